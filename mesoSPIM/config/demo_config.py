@@ -39,6 +39,20 @@ Human interface device (Joystick)
 '''
 sidepanel = 'Demo' #'Demo' or 'FarmSimulator'
 
+'''
+Joystick jogging
+
+The joystick deflection sets the stage velocity (speeds in um/s at full
+deflection, f_fine is the focus axis of the red mode). Every interval ms, the
+distance covered is sent as one relative move, but only after the previous
+move has been acknowledged by the serial thread. A move contains at most
+max_lag s of movement.
+'''
+jog_parameters = {'interval' : 50,
+                  'max_lag' : 0.25,
+                  'timeout' : 2,
+                  'speeds' : {'x' : 2540, 'y' : 2540, 'z' : 2540, 'f' : 2540, 'f_fine' : 423}}
+
 '''
 Digital laser enable lines
 '''
@@ -156,8 +170,25 @@ camera_parameters = {'x_pixels' : 5056,
                      'scan_line_delay' : 6, # 10.26 us x factor, a factor = 6 equals 71.82 us                     
                     }
 
+A ReplayCamera serves the planes of a recorded stack (.raw with its _meta.txt
+file, .craw, .tif or .zarr) as frames, e.g. to benchmark the writers and the
+post-processing with real sample data. replay_frame_rate limits the frame rate
+(0: as fast as possible), with replay_loop the stack starts over at its end:
+
+camera_parameters = {'x_pixels' : 2048,
+                     'y_pixels' : 2048,
+                     'x_pixel_size_in_microns' : 6.5,
+                     'y_pixel_size_in_microns' : 6.5,
+                     'subsampling' : [1,2,4],
+                     'binning' : '1x1',
+                     'replay_path' : 'D:/data/stack.raw',
+                     'replay_dataset' : None, # Array of a Zarr group, None: the first array
+                     'replay_frame_rate' : 40,
+                     'replay_loop' : True,
+                    }
+
 '''
-camera = 'DemoCamera' # 'DemoCamera' or 'HamamatsuOrca' or 'PhotometricsIris15'
+camera = 'DemoCamera' # 'DemoCamera' or 'HamamatsuOrca' or 'PhotometricsIris15' or 'ReplayCamera'
 
 camera_parameters = {'x_pixels' : 1024,
                      'y_pixels' : 1024,
@@ -370,3 +401,212 @@ startup = {
 'camera_sensor_mode':'ASLM',
 'average_frame_rate': 4.969,
 }
+
+'''
+Performance metrics (optional)
+
+If enabled, counters and gauges such as frame rate, frames written, bytes/s,
+dropped frames and stage command latency are published for dashboards
+(Prometheus format) on http://host:port/metrics and as JSON on /metrics.json.
+Keep the host at 127.0.0.1 unless the microscope PC is on a trusted network.
+'''
+metrics_parameters = {'enabled' : False,
+                      'host' : '127.0.0.1',
+                      'port' : 9110,
+                      'microscope_name' : 'mesoSPIM-demo'}
+
+'''
+Storage preflight
+
+Before an acquisition list starts, the size of all stacks is compared with the
+free space of the target disks (plus free_space_margin). If measure_bandwidth
+is True, a test file of probe_size_mb is written to every target disk to check
+that it can keep up with the camera at the average_frame_rate.
+'''
+storage_preflight_parameters = {'measure_bandwidth' : False,
+                                'probe_size_mb' : 256,
+                                'free_space_margin' : 0.05}
+
+'''
+Storage policy (optional)
+
+Distributes the stacks of an acquisition list across several target folders,
+ideally on different disks. The folder column of the Acquisition Manager is
+ignored while this is enabled. Modes: 'round_robin' or 'bandwidth_weighted'.
+For 'bandwidth_weighted', weights are the relative write speeds of the targets,
+None measures them with a short write test. A JSON manifest of the assignment
+is saved into every target folder.
+'''
+storage_policy_parameters = {'enabled' : False,
+                             'targets' : ['D:/mesoSPIM_data', 'E:/mesoSPIM_data'],
+                             'mode' : 'round_robin',
+                             'weights' : None}
+
+'''
+Raw writer
+
+'memmap' writes the .raw files through the page cache (as before). 'preallocated'
+reserves the full file size up front and writes batches of batch_planes planes
+from a page-aligned buffer. On Linux, direct_io bypasses the page cache (O_DIRECT);
+without it, drop_page_cache asks the OS to write back and evict written pages.
+Both writers produce identical files.
+
+'compressed' writes losslessly compressed stacks (.craw instead of .raw) with an
+index for random access to every plane, see src/utils/compressed_raw.py. The
+planes are compressed by a pool of worker threads, codec is 'zstd', 'lz4'
+(if the zstandard or lz4 packages are installed), 'zlib' or 'auto'.
+'''
+raw_writer_parameters = {'writer' : 'memmap',
+                         'batch_planes' : 4,
+                         'direct_io' : True,
+                         'drop_page_cache' : True,
+                         'codec' : 'auto',
+                         'level' : None,
+                         'workers' : 4,
+                         'shuffle' : True}
+
+'''
+Flat-field correction (optional)
+
+If enabled, acquired images are corrected with dark and flat reference frames
+from the reference folder: corrected = (image - dark) * gain + offset. The
+references are recorded with scripts/flatfield_calibration.py, dark frames per
+binning and flat frames per binning and zoom.
+'''
+flatfield_parameters = {'enabled' : False,
+                        'reference_folder' : 'D:/mesoSPIM_flatfield',
+                        'offset' : 100,
+                        'workers' : 4}
+
+'''
+Online tile registration (optional)
+
+While a tiled acquisition list runs, overlapping neighbouring tiles are compared
+by phase correlation of downsampled max projections (projection_planes around the
+middle of each stack) in worker processes. At the end of the list, a BigDataViewer
+XML with the refined tile translations (mesoSPIM_registration_<time>.xml) is saved
+in the folder of the first stack. x_sign, y_sign and swap_xy map the stage x/y
+axes onto the columns/rows of the saved images.
+'''
+tile_registration_parameters = {'enabled' : False,
+                                'downsampling' : 4,
+                                'projection_planes' : 5,
+                                'min_overlap' : 0.05,
+                                'min_confidence' : 0.05,
+                                'workers' : 2,
+                                'x_sign' : 1,
+                                'y_sign' : 1,
+                                'swap_xy' : False}
+
+'''
+Focus metric & autofocus
+
+method: 'tenengrad' or 'dct_entropy' (requires scipy), computed on frames binned by
+'binning'. live_metric measures every live frame (published as focus_metric), with
+acquisition_metric, the sharpness of every plane is saved in the timing trace.
+The autofocus (mesoSPIM_Core.autofocus, see scripts/autofocus_tiles.py) sweeps
+f_search_range (microns) or etl_search_range (V) in 'steps' images.
+
+For the ETL calibration (mesoSPIM_Core.calibrate_etl_table, see
+scripts/etl_calibration.py), the image is split into etl_bands bands along
+etl_band_axis (axis of the saved images along the light-sheet sweep). Set
+etl_band_direction to -1 if the sweep runs against the band order.
+'''
+focus_parameters = {'method' : 'tenengrad',
+                    'binning' : 4,
+                    'live_metric' : True,
+                    'acquisition_metric' : False,
+                    'f_search_range' : 200,
+                    'etl_search_range' : 0.2,
+                    'steps' : 11,
+                    'etl_bands' : 8,
+                    'etl_band_axis' : 1,
+                    'etl_band_direction' : 1}
+
+'''
+Multiple cameras
+
+When this is enabled, each camera runs in its own thread with its own writer.
+All cameras are triggered by the same waveform generator. The first camera is
+the primary one: it is displayed and used for focus measurements. Files of the
+other cameras get filename_suffix before the extension (default: _<name>), e.g.
+stack_cam1.raw. After every stack, the frame numbers of all cameras are compared
+plane by plane and the result is written to the metadata files.
+'''
+multicamera_parameters = {'enabled' : False,
+                          'cameras' : [{'name' : 'cam0',
+                                        'camera' : 'DemoCamera',
+                                        'camera_parameters' : camera_parameters},
+                                       {'name' : 'cam1',
+                                        'camera' : 'DemoCamera',
+                                        'camera_parameters' : camera_parameters,
+                                        'filename_suffix' : '_cam1'}]}
+
+'''
+Camera ROI
+
+In the camera window, a region can be drawn and applied as camera sub-array.
+Only the lines in the ROI are read out: the sweeptime and the ETL ramps are
+shortened to match, so the frame rate increases and the files get smaller.
+Sub-array positions and sizes are multiples of step sensor pixels (times the
+binning). If the sweeptime would drop below min_sweeptime, the line interval
+is stretched instead. sweep_direction is -1 if the light-sheet sweeps against
+the column order of the saved images.
+'''
+camera_roi_parameters = {'step' : 4,
+                         'min_sweeptime' : 0.02,
+                         'sweep_direction' : 1}
+
+'''
+Frame loss
+
+Frames are assigned to planes by the frame counter of the camera. Planes
+without a frame (e.g. after a buffer overrun) are written empty and listed in
+<filename>_frame_check.json. With repair, the stages move back to these planes
+after the stack and the planes are re-acquired and written into the file.
+Stacks with more than max_repair_planes missing planes are not repaired.
+'''
+frame_loss_parameters = {'repair' : False,
+                         'max_repair_planes' : 50}
+
+'''
+Acquisition journal
+
+While an acquisition list runs, a journal (mesoSPIM_journal_<time>.jsonl) is
+written into the folder of the first stack: completed stacks, the planes on
+disk of the current stack every checkpoint_interval planes and the device
+state. After a crash, "Resume Acquisition List..." (or mesoSPIM_Batch.py
+--resume <journal>) skips the completed stacks and continues the interrupted
+stack into the existing files.
+'''
+journal_parameters = {'enabled' : True,
+                      'checkpoint_interval' : 50}
+
+'''
+Post-processing
+
+The jobs of the "Processing" column (comma-separated: MAX, PREVIEW, TIFF,
+SHA256) run after each stack in a pool of worker processes, so the next stack
+starts right away. The workers run with a lower scheduling priority (nice)
+and, on Linux, only on the CPUs in cpu_affinity (None: all CPUs). default_jobs
+are added to every stack, jobs with a lower priority number run first.
+'''
+postprocessing_parameters = {'workers' : 1,
+                             'nice' : 10,
+                             'cpu_affinity' : None,
+                             'default_jobs' : [],
+                             'priorities' : {'SHA256' : 0, 'MAX' : 1, 'PREVIEW' : 2, 'TIFF' : 3},
+                             'preview_downsampling' : 4}
+
+'''
+Snaps
+
+Snapped images are written by a pool of writer threads, with the snap metadata
+embedded into the TIFF file. compression is passed to tifffile (e.g. 'zlib',
+None writes uncompressed files), ome writes OME-TIFF files. At most
+max_pending snaps are held in memory until they are written.
+'''
+snap_parameters = {'workers' : 2,
+                   'compression' : None,
+                   'ome' : False,
+                   'max_pending' : 16}
@@ -0,0 +1,118 @@
+'''
+mesoSPIM_Batch.py
+========================================
+Command-line entry point to run acquisition lists without the GUI
+
+Usage (from the mesoSPIM folder):
+
+    python mesoSPIM_Batch.py config/demo_config.py acquisitions/my_list.jsonl
+
+An interrupted list is continued from the journal written next to the data:
+
+    python mesoSPIM_Batch.py config/demo_config.py --resume /data/mesoSPIM_journal_20201019-213000.jsonl
+
+Progress is written to stdout and to the logfile in the `log` folder.
+The exit code is 0 if the list was acquired completely and 1 otherwise (the
+list was stopped, a check before the start failed or planes are missing).
+Warnings that do not affect the acquired data, e.g. slow disks, are only
+logged.
+'''
+
+''' Configuring the logging module before doing anything else'''
+import time
+import logging
+timestr = time.strftime("%Y%m%d-%H%M%S")
+logging_filename = timestr + '_batch.log'
+logging_format = '%(asctime)-8s:%(levelname)s:%(threadName)s:%(thread)d:%(module)s:%(name)s:%(message)s'
+logging.basicConfig(filename='log/'+logging_filename, level=logging.INFO, format=logging_format)
+logger = logging.getLogger(__name__)
+
+''' Stream the log to stdout as well '''
+console_handler = logging.StreamHandler()
+console_handler.setFormatter(logging.Formatter('%(asctime)-8s:%(levelname)s:%(message)s'))
+logging.getLogger().addHandler(console_handler)
+
+logger.info('mesoSPIM batch runner started')
+
+import sys
+import signal
+import argparse
+
+from PyQt5 import QtCore
+
+from src.mesoSPIM_BatchRunner import mesoSPIM_BatchRunner
+from src.utils.acquisition_io import load_acquisition_list
+from src.utils.utility_functions import load_config_from_path
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(description='Run a mesoSPIM acquisition list without the GUI')
+    parser.add_argument('config', help='Path to the microscope configuration file')
+    parser.add_argument('acquisition_list', nargs='?', default=None,
+                        help='Path to an acquisition list saved by the Acquisition Manager')
+    parser.add_argument('--resume', metavar='JOURNAL', default=None,
+                        help='Continue an interrupted acquisition list from its journal instead')
+    parser.add_argument('--row', type=int, default=None,
+                        help='Only acquire a single row of the acquisition list')
+    parser.add_argument('--progress-interval', type=int, default=10,
+                        help='Report progress every N images (default: 10)')
+    parser.add_argument('--reference-ok', action='store_true',
+                        help='Confirm that a stage reference movement is safe (required for some PI stage configurations)')
+    return parser.parse_args(argv)
+
+def stage_referencing_check(cfg, reference_ok):
+    '''
+    Command-line version of the stage referencing check in mesoSPIM_Control.py:
+    As there is nobody to click the message box, the user has to confirm beforehand.
+    '''
+    if cfg.stage_parameters['stage_type'] in ('PI_rotzf_and_Galil_xy', 'PI_rotz_and_Galil_xyf'):
+        if not reference_ok:
+            logger.error('This stage configuration requires a reference z movement. Move the XYZ stage to a '
+                         'safe position and restart with --reference-ok - shutting down!')
+            return False
+    return True
+
+def main(argv=None):
+    args = parse_arguments(sys.argv[1:] if argv is None else argv)
+
+    cfg = load_config_from_path(args.config)
+    logger.info(f'Configuration file loaded: {args.config}')
+
+    if args.resume is None:
+        if args.acquisition_list is None:
+            logger.error('Either an acquisition list or --resume is required - shutting down!')
+            return 1
+        acq_list = load_acquisition_list(args.acquisition_list)
+        logger.info(f'Acquisition list loaded: {args.acquisition_list} ({len(acq_list)} rows)')
+
+        if args.row is not None and not 0 <= args.row < len(acq_list):
+            logger.error(f'Row {args.row} does not exist in the acquisition list - shutting down!')
+            return 1
+
+    if not stage_referencing_check(cfg, args.reference_ok):
+        return 1
+
+    app = QtCore.QCoreApplication(sys.argv)
+
+    runner = mesoSPIM_BatchRunner(cfg, progress_interval=args.progress_interval)
+    runner.sig_finished.connect(app.exit)
+
+    ''' Ctrl+C stops the acquisition properly. Python signal handlers only run
+    while the interpreter is active, so a timer wakes it up regularly '''
+    signal.signal(signal.SIGINT, lambda signum, frame: runner.stop())
+    wakeup_timer = QtCore.QTimer()
+    wakeup_timer.timeout.connect(lambda: None)
+    wakeup_timer.start(200)
+
+    runner.apply_startup_parameters()
+    if args.resume is None:
+        runner.run(acq_list, row=args.row)
+    else:
+        runner.resume(args.resume)
+
+    exit_code = app.exec_()
+    runner.shutdown()
+    logger.info(f'mesoSPIM batch runner finished with exit code {exit_code}')
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -15,11 +15,11 @@ logger.info('mesoSPIM-control started')
 
 import os
 import sys
-import importlib.util
 
 from PyQt5 import QtWidgets
 
 from src.mesoSPIM_MainWindow import mesoSPIM_MainWindow
+from src.utils.utility_functions import load_config_from_path
 
 logger.info('Modules loaded')
 
@@ -38,9 +38,7 @@ def load_config():
 
     if global_config_path != '':
         ''' Using importlib to load the config file '''
-        spec = importlib.util.spec_from_file_location('module.name', global_config_path)
-        config = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(config)
+        config = load_config_from_path(global_config_path)
         logger.info(f'Configuration file loaded: {global_config_path}')
         return config
     else:
@@ -0,0 +1,6 @@
+''' Autofocus for all rows of the Acquisition Manager
+
+For every row, the focus is measured at z_start and z_end with the laser,
+filter and zoom of the row. f_start and f_end are updated in the table.
+'''
+self.autofocus_acquisition_list()
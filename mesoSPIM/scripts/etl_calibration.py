@@ -0,0 +1,6 @@
+''' Calibrate the ETL parameters for all laser/zoom combinations
+
+Use a sample with structure across the whole field of view, e.g. a bead
+phantom. The results are written into the current ETL parameter file.
+'''
+self.calibrate_etl_table()
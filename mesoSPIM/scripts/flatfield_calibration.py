@@ -0,0 +1,7 @@
+''' Record the references for the flat-field correction
+
+Dark frames: Laser intensity 0 (the shutters stay closed)
+Flat frames: Uniform fluorescent sample, recorded for the current zoom
+'''
+self.calibrate_flatfield('dark', frames=20)
+self.calibrate_flatfield('flat', frames=20)
@@ -17,6 +17,9 @@ import numpy
 # for debugging
 import sys
 
+import logging
+logger = logging.getLogger(__name__)
+
 # import storm_control.sc_library.halExceptions as halExceptions
 
 # Hamamatsu constants.
@@ -278,6 +281,7 @@ class HamamatsuCamera(object):
         self.last_frame_number = 0
         self.properties = None
         self.max_backlog = 0
+        self.buffer_overruns = 0
         self.number_image_buffers = 0
 
         self.acquisition_mode = "run_till_abort"
@@ -637,8 +641,11 @@ class HamamatsuCamera(object):
         # Check that we have not acquired more frames than we can store in our buffer.
         # Keep track of the maximum backlog.
         backlog = cur_frame_number - self.last_frame_number
+        # The frames of an overrun are lost, the frame numbers tell which ones.
         if (backlog > self.number_image_buffers):
-            print(">> Warning! hamamatsu camera frame buffer overrun detected!")
+            self.buffer_overruns += 1
+            logger.warning("Hamamatsu camera frame buffer overrun: %d frames since the last read, %d buffers",
+                           backlog, self.number_image_buffers)
         if (backlog > self.max_backlog):
             self.max_backlog = backlog
         self.last_frame_number = cur_frame_number
@@ -778,7 +785,10 @@ class HamamatsuCamera(object):
                          "dcamcap_stop")
 
         print("max camera backlog was", self.max_backlog, "of", self.number_image_buffers)
+        if self.buffer_overruns:
+            logger.warning("Hamamatsu camera: %d frame buffer overrun(s) during the acquisition", self.buffer_overruns)
         self.max_backlog = 0
+        self.buffer_overruns = 0
 
         # Free image buffers.
         self.number_image_buffers = 0
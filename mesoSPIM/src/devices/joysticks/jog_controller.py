@@ -0,0 +1,150 @@
+'''
+Jog controller - turns joystick deflections into stage movements
+
+The joystick sets a velocity per axis. A timer integrates the velocities and
+sends the distance covered since the last command as one relative move for all
+axes. Only one move is in flight: the next one is sent after the serial thread
+has acknowledged the previous one, so a busy serial thread or slow stages do
+not build up a queue of moves that keep the stage going after the joystick
+has been released. Instead, the distance of the next move grows (up to
+max_lag seconds of movement).
+
+The parameters are set in the config file (all optional):
+
+    jog_parameters = {'interval' : 50,
+                      'max_lag' : 0.25,
+                      'timeout' : 2,
+                      'speeds' : {'x' : 2540, 'y' : 2540, 'z' : 2540, 'f' : 2540, 'f_fine' : 423}}
+
+interval: ms between commands, max_lag: s of movement a command can contain,
+timeout: s after which a move that has not been acknowledged is considered
+lost, speeds: um/s at full deflection.
+'''
+import time
+
+from PyQt5 import QtCore
+
+import logging
+logger = logging.getLogger(__name__)
+
+from ...utils.metrics import metrics
+
+def get_jog_parameters_from_config(cfg):
+    ''' The default speeds match the previous 10 ms timer steps at full deflection '''
+    parameters = {'interval' : 50,
+                  'max_lag' : 0.25,
+                  'timeout' : 2,
+                  'min_step' : 0.1,
+                  'speeds' : {'x' : 2540, 'y' : 2540, 'z' : 2540, 'f' : 2540, 'f_fine' : 423}}
+    if hasattr(cfg, 'jog_parameters'):
+        speeds = dict(parameters['speeds'])
+        speeds.update(cfg.jog_parameters.get('speeds', {}))
+        parameters.update(cfg.jog_parameters)
+        parameters['speeds'] = speeds
+    return parameters
+
+class JogController(QtCore.QObject):
+    '''Coalesces joystick velocities into relative moves, one in flight at a time
+
+    Signals:
+        sig_move_relative(dict): {'x_rel' : ..., 'f_rel' : ...}, has to be
+            acknowledged by calling move_done()
+
+    Args:
+        interval (int): ms between moves
+        max_lag (float): s of movement a move can contain at most
+        timeout (float): s after which an unacknowledged move is dropped
+        min_step (float): Smallest distance in um that is sent
+    '''
+    sig_move_relative = QtCore.pyqtSignal(dict)
+
+    def __init__(self, interval=50, max_lag=0.25, timeout=2, min_step=0.1, parent=None):
+        super().__init__(parent)
+        self.interval = interval
+        self.max_lag = max_lag
+        self.timeout = timeout
+        self.min_step = min_step
+
+        ''' source -> (axis, velocity in um/s) '''
+        self.velocities = {}
+        ''' axis -> distance in um not sent yet '''
+        self.pending = {}
+        self.in_flight = False
+        self.sent_time = 0
+        self.last_tick = 0
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setInterval(self.interval)
+        self.timer.timeout.connect(self.tick)
+
+    def set_velocity(self, source, axis, velocity):
+        '''Sets the velocity of an input
+
+        Args:
+            source: The joystick axis, several sources can move the same axis
+            axis (str): 'x', 'y', 'z', 'f' or 'theta'
+            velocity (float): um/s, 0 stops the input
+        '''
+        if velocity == 0:
+            self.velocities.pop(source, None)
+        else:
+            self.velocities[source] = (axis, velocity)
+
+        if self.velocities and not self.timer.isActive():
+            ''' The first move covers one interval and is sent right away '''
+            self.last_tick = time.perf_counter() - self.interval / 1000
+            self.timer.start()
+            self.tick()
+
+    def get_axis_velocities(self):
+        velocities = {}
+        for axis, velocity in self.velocities.values():
+            velocities[axis] = velocities.get(axis, 0) + velocity
+        return velocities
+
+    @QtCore.pyqtSlot()
+    def tick(self):
+        now = time.perf_counter()
+        elapsed = now - self.last_tick
+        self.last_tick = now
+
+        velocities = self.get_axis_velocities()
+        for axis, velocity in velocities.items():
+            limit = abs(velocity) * self.max_lag
+            distance = self.pending.get(axis, 0) + velocity * elapsed
+            self.pending[axis] = max(-limit, min(limit, distance))
+
+        if self.in_flight and now - self.sent_time > self.timeout:
+            logger.warning('Jog Controller: Move was not acknowledged, sending the next one')
+            self.in_flight = False
+
+        if not self.in_flight:
+            self.send(velocities)
+
+        if not self.velocities and not self.pending and not self.in_flight:
+            self.timer.stop()
+
+    def send(self, velocities):
+        move = {}
+        for axis, distance in list(self.pending.items()):
+            if abs(distance) >= self.min_step:
+                move[axis+'_rel'] = round(distance, 3)
+                del self.pending[axis]
+            elif axis not in velocities:
+                ''' Remainders of released axes are dropped '''
+                del self.pending[axis]
+        if move:
+            self.in_flight = True
+            self.sent_time = time.perf_counter()
+            metrics.inc('jog_moves_total')
+            self.sig_move_relative.emit(move)
+
+    @QtCore.pyqtSlot()
+    def move_done(self):
+        self.in_flight = False
+
+    def stop(self):
+        ''' Forgets all velocities and distances not sent yet '''
+        self.velocities.clear()
+        self.pending.clear()
+        self.timer.stop()
@@ -23,8 +23,6 @@ class FarmSimulatorSidePanel(QtCore.QObject):
         sig_button_pressed = QtCore.pyqtSignal(int) # <-- allows handling of buttons
         sig_axis_moved = QtCore.pyqtSignal(int, int) # <-- axis, value
         sig_mode_changed = QtCore.pyqtSignal(str) # <-- Modal switching (XY/ZF mode)
-        sig_start_timer =  QtCore.pyqtSignal(int) # <-- timer id, value to emit
-        sig_stop_timer = QtCore.pyqtSignal(int) # <-- timer id
 
     Attributes:
         mode (str): Joysticks can have different modes (e.g. whether analog axes 0-2
@@ -34,8 +32,6 @@ class FarmSimulatorSidePanel(QtCore.QObject):
     sig_button_pressed = QtCore.pyqtSignal(int) # <-- allows handling of buttons
     sig_axis_moved = QtCore.pyqtSignal(int, int) # <-- axis, value
     sig_mode_changed = QtCore.pyqtSignal(str) # <-- Modal switching (XY/ZF mode)
-    sig_start_timer =  QtCore.pyqtSignal(int) # <-- timer id, value to emit
-    sig_stop_timer = QtCore.pyqtSignal(int) # <-- timer id
 
     def __init__(self):
         super().__init__()
@@ -52,44 +48,13 @@ class FarmSimulatorSidePanel(QtCore.QObject):
         self.mode = 'undefined'
         self.sig_mode_changed.emit(self.mode)
 
-        self.sig_start_timer.connect(self.start_axis_timer)
-        self.sig_stop_timer.connect(self.stop_axis_timer)
-
         '''
-        One problem with the joystick is that it stops sending packages when the
-        maximum tip/tilt is reached. To circumvent the motion to be stopped,
-        a QTimer is used to periodically trigger movement in the same direction.
-
-        joystick_timer_start/stop are helper methods.
+        The joystick stops sending packages when the maximum tip/tilt is
+        reached, so sig_axis_moved is only emitted when the value of an axis
+        changes (including the return to the center, 128). The jog controller
+        keeps moving at the last value, see jog_controller.py.
         '''
-        self.timeout_interval = 10
-        self.axis0_timer = QtCore.QTimer(self)
-        self.axis1_timer = QtCore.QTimer(self)
-        self.axis2_timer = QtCore.QTimer(self)
-        self.axis3_timer = QtCore.QTimer(self)
-        self.axis4_timer = QtCore.QTimer(self)
-        self.axis5_timer = QtCore.QTimer(self)
-
-        self.axis0_value = 0
-        self.axis1_value = 0
-        self.axis2_value = 0
-        self.axis3_value = 0
-        self.axis4_value = 0
-        self.axis5_value = 0
-
-        self.axis0_timer.timeout.connect(lambda: self.sig_axis_moved.emit(0, self.axis0_value))
-        self.axis1_timer.timeout.connect(lambda: self.sig_axis_moved.emit(1, self.axis1_value))
-        self.axis2_timer.timeout.connect(lambda: self.sig_axis_moved.emit(2, self.axis2_value))
-        self.axis3_timer.timeout.connect(lambda: self.sig_axis_moved.emit(3, self.axis3_value))
-        self.axis4_timer.timeout.connect(lambda: self.sig_axis_moved.emit(4, self.axis4_value))
-        self.axis5_timer.timeout.connect(lambda: self.sig_axis_moved.emit(5, self.axis5_value))
-
-    def start_axis_timer(self, axis):
-        value = exec('self.axis'+str(axis)+'_value')
-        exec('self.axis'+str(axis)+'_timer.start(self.timeout_interval)')
-
-    def stop_axis_timer(self, axis):
-        exec('self.axis'+str(axis)+'_timer.stop()')
+        self.axis_values = [128] * 6
 
     def __del__(self):
         try:
@@ -165,12 +130,6 @@ class FarmSimulatorSidePanel(QtCore.QObject):
                 button = 32-index
                 self.sig_button_pressed.emit(button)
 
-        '''Joystick handling:
-
-        Stop the joystick timer - a QTimer can be stopped even though it was never
-        started. This allows every new arriving HID package to stop the
-        persistent sending of messages.
-        '''
         self.handle_axis_value_changes(0,'012',5,data)
         self.handle_axis_value_changes(1,'012',6,data)
         self.handle_axis_value_changes(2,'012',7,data)
@@ -180,18 +139,10 @@ class FarmSimulatorSidePanel(QtCore.QObject):
 
     def handle_axis_value_changes(self, axis_id, axis_group, data_group, data):
         value = data[data_group]
-        if value != 128:
-            if self.mode != axis_group:
-                self.mode = axis_group
-                self.sig_mode_changed.emit(axis_group)
-
-            if value-128 == -128 or value-128 == 127:
-                ''' Assign a certain axis the min or max value '''
-                exec('self.axis'+str(axis_id)+'_value = value')
-                ''' Start timers. Because this is executed from
-                another thread, a signal has to be used here.'''
-                self.sig_start_timer.emit(axis_id)
-                self.sig_axis_moved.emit(axis_id, value)
-            else:
-                self.sig_stop_timer.emit(axis_id)
-                self.sig_axis_moved.emit(axis_id, value)
+        if value != 128 and self.mode != axis_group:
+            self.mode = axis_group
+            self.sig_mode_changed.emit(axis_group)
+
+        if value != self.axis_values[axis_id]:
+            self.axis_values[axis_id] = value
+            self.sig_axis_moved.emit(axis_id, value)
@@ -8,6 +8,7 @@ from PyQt5 import QtCore
 
 from .Demo_SidePanel import Demo_SidePanel
 from .logitech import FarmSimulatorSidePanel
+from .jog_controller import JogController, get_jog_parameters_from_config
 
 class Demo_JoystickHandler(QtCore.QObject):
     def __init__(self, parent = None):
@@ -29,6 +30,16 @@ class mesoSPIM_JoystickHandler(QtCore.QObject):
 
         ''' parent is the window '''
 
+        ''' Joystick deflections become coalesced relative moves, see jog_controller.py '''
+        jog_parameters = get_jog_parameters_from_config(self.cfg)
+        self.jog_speeds = jog_parameters['speeds']
+        self.jog = JogController(jog_parameters['interval'],
+                                 jog_parameters['max_lag'],
+                                 jog_parameters['timeout'],
+                                 jog_parameters['min_step'],
+                                 parent=self)
+        self.jog.sig_move_relative.connect(self.parent.sig_jog.emit)
+
         if self.cfg.sidepanel == 'FarmSimulator':
             self.joystick = FarmSimulatorSidePanel()
 
@@ -107,6 +118,7 @@ class mesoSPIM_JoystickHandler(QtCore.QObject):
 
         ''' Stop movement button '''
         if button_id == 28:
+            self.jog.stop()
             self.parent.sig_stop_movement.emit()
 
         if button_id == 29:
@@ -202,13 +214,13 @@ class mesoSPIM_JoystickHandler(QtCore.QObject):
         ''' Debugging print statement '''
         # print('Axis: ', axis_id, ',Value: ', value)
 
-        ''' '''
-        value = value - 128
+        ''' Deflection between -1 and 1 '''
+        deflection = max(-1.0, (value - 128) / 127)
 
         if axis_id == 0:
-            self.parent.sig_move_relative.emit({'x_rel':value/5})
+            self.jog.set_velocity(0, 'x', deflection * self.jog_speeds['x'])
         elif axis_id == 1:
-            self.parent.sig_move_relative.emit({'y_rel':value/5})
+            self.jog.set_velocity(1, 'y', deflection * self.jog_speeds['y'])
         elif axis_id == 3:
             ''' Some FarmSimulatorSidePanel have a bug which lets them
             send axis 2 and axis 3 (both rotation motions) at the same time.
@@ -217,8 +229,8 @@ class mesoSPIM_JoystickHandler(QtCore.QObject):
             if self.joystick.mode == '123':
                 pass
             else:
-                self.parent.sig_move_relative.emit({'f_rel':value/30})
+                self.jog.set_velocity(3, 'f', deflection * self.jog_speeds['f_fine'])
         elif axis_id == 4:
-            self.parent.sig_move_relative.emit({'f_rel': value/5})
+            self.jog.set_velocity(4, 'f', deflection * self.jog_speeds['f'])
         elif axis_id == 5:
-            self.parent.sig_move_relative.emit({'z_rel': value/5})
+            self.jog.set_velocity(5, 'z', deflection * self.jog_speeds['z'])
@@ -298,7 +298,7 @@ class mesoSPIM_AcquisitionManagerWindow(QtWidgets.QWidget):
 
     def update_acquisition_time_prediction(self):
         framerate = self.state['current_framerate']
-        total_time = self.state['acq_list'].get_acquisition_time(framerate)
+        total_time = self.model.getAcquisitionTime(framerate)
         self.state['predicted_acq_list_time'] = total_time
         self.state['remaining_acq_list_time'] = total_time
         time_string = convert_seconds_to_string(total_time)
@@ -320,13 +320,13 @@ class mesoSPIM_AcquisitionManagerWindow(QtWidgets.QWidget):
         self.generalControlButtons.setEnabled(False)
 
     def save_table(self):
-        path , _ = QtWidgets.QFileDialog.getSaveFileName(None,'Save Table')
+        path , _ = QtWidgets.QFileDialog.getSaveFileName(None,'Save Table', '', 'Acquisition lists (*.jsonl);;All files (*)')
         if path:
             self.model.saveModel(path)
         self.set_state()
 
     def load_table(self):
-        path , _ = QtWidgets.QFileDialog.getOpenFileName(None,'Load Table')
+        path , _ = QtWidgets.QFileDialog.getOpenFileName(None,'Load Table', '', 'Acquisition lists (*.jsonl);;All files (*)')
         if path:
             try:
                 self.model.loadModel(path)
@@ -410,6 +410,14 @@ class mesoSPIM_AcquisitionManagerWindow(QtWidgets.QWidget):
             else:
                 self.display_no_row_selected_warning()
             
+    @QtCore.pyqtSlot(int, float, float)
+    def set_focus_of_row(self, row, f_start, f_end):
+        ''' Sets the focus positions found by the autofocus of the core '''
+        index0 = self.model.createIndex(row, self.model._table[0].keys().index('f_start'))
+        index1 = self.model.createIndex(row, self.model._table[0].keys().index('f_end'))
+        self.model.setData(index0, round(f_start, 2))
+        self.model.setData(index1, round(f_end, 2))
+
     def mark_current_rotation(self):
         row = self.get_first_selected_row()
 
@@ -0,0 +1,210 @@
+'''
+mesoSPIM Batch Runner
+=====================
+
+Runs an acquisition list through the mesoSPIM_Core without any GUI windows.
+
+The batch runner takes the place of the mesoSPIM_MainWindow as parent of the core:
+It provides the configuration, the signals the core connects to and keeps the
+position in the state up to date. Progress is streamed into the log instead of
+progress bars.
+'''
+import logging
+logger = logging.getLogger(__name__)
+
+from PyQt5 import QtCore
+
+from .mesoSPIM_State import mesoSPIM_StateSingleton
+from .mesoSPIM_Core import mesoSPIM_Core
+from .utils.acquisitions import AcquisitionList
+from .utils.utility_functions import convert_seconds_to_string
+
+class mesoSPIM_BatchRunner(QtCore.QObject):
+    '''Headless parent for the mesoSPIM_Core
+
+    The signals mirror the ones of the mesoSPIM_MainWindow as the core
+    connects to them during its initialization.
+    '''
+    sig_finished = QtCore.pyqtSignal(int)
+
+    sig_state_request = QtCore.pyqtSignal(dict)
+    sig_execute_script = QtCore.pyqtSignal(str)
+
+    sig_move_relative = QtCore.pyqtSignal(dict)
+    sig_move_absolute = QtCore.pyqtSignal(dict)
+    sig_zero_axes = QtCore.pyqtSignal(list)
+    sig_unzero_axes = QtCore.pyqtSignal(list)
+    sig_stop_movement = QtCore.pyqtSignal()
+    sig_load_sample = QtCore.pyqtSignal()
+    sig_unload_sample = QtCore.pyqtSignal()
+
+    sig_mark_rotation_position = QtCore.pyqtSignal()
+    sig_go_to_rotation_position = QtCore.pyqtSignal()
+
+    sig_save_etl_config = QtCore.pyqtSignal()
+
+    ''' Startup parameters which the main window applies via its widgets,
+    spinbox parameters come first as zoom & laser changes reload the ETL values '''
+    startup_parameters = ('camera_exposure_time',
+                          'camera_delay_%',
+                          'camera_pulse_%',
+                          'sweeptime',
+                          'laser_l_delay_%',
+                          'laser_r_delay_%',
+                          'laser_l_pulse_%',
+                          'laser_r_pulse_%',
+                          'galvo_l_frequency',
+                          'galvo_r_frequency',
+                          'galvo_l_amplitude',
+                          'galvo_r_amplitude',
+                          'galvo_l_phase',
+                          'galvo_r_phase',
+                          'galvo_l_offset',
+                          'galvo_r_offset',
+                          'etl_l_delay_%',
+                          'etl_r_delay_%',
+                          'etl_l_ramp_rising_%',
+                          'etl_r_ramp_rising_%',
+                          'etl_l_ramp_falling_%',
+                          'etl_r_ramp_falling_%',
+                          'etl_l_offset',
+                          'etl_r_offset',
+                          'etl_l_amplitude',
+                          'etl_r_amplitude',
+                          'filter',
+                          'zoom',
+                          'shutterconfig',
+                          'laser',
+                          'intensity',
+                          'camera_display_live_subsampling',
+                          'camera_display_snap_subsampling',
+                          'camera_display_acquisition_subsampling',
+                          'camera_binning',
+                          )
+
+    def __init__(self, config, progress_interval=10):
+        super().__init__()
+
+        self.cfg = config
+        self.progress_interval = progress_interval
+        self.exit_code = 0
+        self.running = False
+
+        self.state = mesoSPIM_StateSingleton()
+
+        ''' Setting the mesoSPIM_Core thread up '''
+        self.core_thread = QtCore.QThread()
+        self.core = mesoSPIM_Core(self.cfg, self)
+        self.core.moveToThread(self.core_thread)
+        self.core.waveformer.moveToThread(self.core_thread)
+
+        ''' The signal switchboard '''
+        self.core.sig_finished.connect(self.finished)
+        self.core.sig_position.connect(self.update_position)
+        self.core.sig_status_message.connect(self.log_status_message)
+        self.core.sig_progress.connect(self.log_progress)
+        self.core.sig_warning.connect(self.log_warning)
+        self.core.sig_error.connect(self.set_error)
+
+        self.core_thread.start(QtCore.QThread.HighPriority)
+        logger.info(f'Batch Runner: Core thread priority: {str(self.core_thread.priority())}')
+
+    def apply_startup_parameters(self):
+        '''Sends the startup parameters of the config to the core
+
+        In the GUI, this happens implicitly when the widgets are initialized.
+        '''
+        startup_dict = {}
+        for key in self.startup_parameters:
+            if key in self.cfg.startup:
+                startup_dict[key] = self.cfg.startup[key]
+        self.sig_state_request.emit(startup_dict)
+
+    def run(self, acq_list, row=None):
+        '''Starts the acquisition list - the core signals the end via sig_finished
+
+        Args:
+            acq_list (AcquisitionList): List of stacks to acquire
+            row (int): If not None, only this row is acquired
+        '''
+        framerate = self.state['current_framerate']
+        if row is None:
+            total_time = acq_list.get_acquisition_time(framerate)
+        else:
+            total_time = AcquisitionList([acq_list[row]]).get_acquisition_time(framerate)
+
+        self.state['acq_list'] = acq_list
+        self.state['predicted_acq_list_time'] = total_time
+        self.state['remaining_acq_list_time'] = total_time
+
+        logger.info(f'Batch Runner: Starting {len(acq_list) if row is None else 1} stack(s), '
+                    f'predicted time: {convert_seconds_to_string(total_time)}')
+
+        self.running = True
+        if row is None:
+            self.state['selected_row'] = -1
+            self.sig_state_request.emit({'state':'run_acquisition_list'})
+        else:
+            self.state['selected_row'] = row
+            self.sig_state_request.emit({'state':'run_selected_acquisition'})
+
+    def resume(self, journal_path):
+        '''Continues an interrupted acquisition list from its journal, see utils/acquisition_journal.py'''
+        logger.info(f'Batch Runner: Resuming {journal_path}')
+        self.running = True
+        self.state['resume_journal'] = journal_path
+        self.state['selected_row'] = -1
+        self.sig_state_request.emit({'state':'resume_acquisition_list'})
+
+    def stop(self):
+        logger.info('Batch Runner: Stop requested')
+        self.exit_code = 1
+        self.sig_state_request.emit({'state':'idle'})
+
+    def shutdown(self):
+        '''Waits for the post-processing jobs, then quits the core, camera, serial and script threads'''
+        status = self.core.postprocessing.get_status()
+        if status['queued'] or status['running']:
+            logger.info(f"Batch Runner: Waiting for {status['queued'] + status['running']} post-processing jobs")
+        self.core.postprocessing.shutdown(wait=True)
+        for thread in [self.core_thread] + self.core.camera_threads + [self.core.serial_thread, self.core.script_thread]:
+            thread.quit()
+            thread.wait()
+
+    @QtCore.pyqtSlot()
+    def finished(self):
+        ''' The core emits sig_finished more than once when stopping '''
+        if self.running:
+            self.running = False
+            logger.info('Batch Runner: Finished')
+            self.sig_finished.emit(self.exit_code)
+
+    @QtCore.pyqtSlot(dict)
+    def update_position(self, dict):
+        if 'position' in dict:
+            self.state['position'] = dict['position']
+
+    @QtCore.pyqtSlot(str)
+    def log_status_message(self, string):
+        logger.info(f'Batch Runner: {string}')
+
+    @QtCore.pyqtSlot(str)
+    def log_warning(self, string):
+        logger.warning('Batch Runner: '+string.replace('\n', ''))
+
+    @QtCore.pyqtSlot(str)
+    def set_error(self, string):
+        ''' The list was not acquired completely, the message is logged by log_warning '''
+        self.exit_code = 1
+
+    @QtCore.pyqtSlot(dict)
+    def log_progress(self, dict):
+        cur_image = dict['current_image_in_acq']
+        images_in_acq = dict['images_in_acq']
+
+        if (cur_image+1) % self.progress_interval == 0 or cur_image+1 == images_in_acq:
+            logger.info(f"Acq: {dict['current_acq']+1}/{dict['total_acqs']} "
+                        f"Image: {cur_image+1}/{images_in_acq} "
+                        f"Total: {dict['image_counter']}/{dict['total_image_count']} "
+                        f"Time: {dict['time_passed_string']} "
+                        f"Remaining: {dict['remaining_time_string']}")
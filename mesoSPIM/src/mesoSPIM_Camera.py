@@ -5,8 +5,6 @@ import os
 import time
 import numpy as np
 
-import tifffile
-
 import logging
 logger = logging.getLogger(__name__)
 
@@ -19,15 +17,31 @@ except:
 '''
 from .mesoSPIM_State import mesoSPIM_StateSingleton
 from .utils.acquisitions import AcquisitionList, Acquisition
+from .utils.metrics import metrics, FrameRateMeter
+from .utils.command_registry import CommandRegistry
+from .utils.raw_writers import get_raw_writer, get_written_path, replace_planes
+from .utils.frame_check import FrameCheck, get_frame_check_path
+from .utils.flatfield import get_flatfield_library_from_config
+from .utils.focus_metrics import compute_focus_metric
+from .utils.etl_calibration import compute_band_metrics
+from .utils.multicamera import add_filename_suffix
+from .utils.replay_stack import open_replay_stack, fit_frame
+from .utils.camera_roi import get_roi_parameters_from_config, snap_roi, get_subarray, get_image_bounds, get_roi_timing
 
 class mesoSPIM_Camera(QtCore.QObject):
-    '''Top-level class for all cameras'''
+    '''Top-level class for all cameras
+
+    Args:
+        camera_index (int): Position in the camera list of the core, 0 is the primary camera
+        camera_config (dict): Entry of utils.multicamera.get_camera_configs(),
+            None uses camera and camera_parameters of the config
+    '''
     sig_camera_frame = QtCore.pyqtSignal(np.ndarray)
     sig_finished = QtCore.pyqtSignal()
     sig_update_gui_from_state = QtCore.pyqtSignal(bool)
     sig_status_message = QtCore.pyqtSignal(str)
 
-    def __init__(self, parent = None):
+    def __init__(self, parent = None, camera_index = 0, camera_config = None):
         super().__init__()
 
         self.parent = parent
@@ -37,18 +51,35 @@ class mesoSPIM_Camera(QtCore.QObject):
 
         self.stopflag = False
 
-        self.x_pixels = self.cfg.camera_parameters['x_pixels']
-        self.y_pixels = self.cfg.camera_parameters['y_pixels']
-        self.x_pixel_size_in_microns = self.cfg.camera_parameters['x_pixel_size_in_microns']
-        self.y_pixel_size_in_microns = self.cfg.camera_parameters['y_pixel_size_in_microns']
-
-        self.binning_string = self.cfg.camera_parameters['binning'] # Should return a string in the form '2x4'
+        self.camera_index = camera_index
+        if camera_config is None:
+            camera_config = {'name' : self.cfg.camera,
+                             'camera' : self.cfg.camera,
+                             'camera_parameters' : self.cfg.camera_parameters,
+                             'filename_suffix' : ''}
+        self.camera_name = camera_config['name']
+        self.camera_type = camera_config['camera']
+        self.camera_parameters = camera_config['camera_parameters']
+        self.filename_suffix = camera_config['filename_suffix']
+
+        self.x_pixels = self.camera_parameters['x_pixels']
+        self.y_pixels = self.camera_parameters['y_pixels']
+        self.x_pixel_size_in_microns = self.camera_parameters['x_pixel_size_in_microns']
+        self.y_pixel_size_in_microns = self.camera_parameters['y_pixel_size_in_microns']
+
+        self.binning_string = self.camera_parameters['binning'] # Should return a string in the form '2x4'
         self.x_binning = int(self.binning_string[0])
         self.y_binning = int(self.binning_string[2])
 
         self.x_pixels = int(self.x_pixels / self.x_binning)
         self.y_pixels = int(self.y_pixels / self.y_binning)
 
+        ''' Sub-array readout, x_pixels and y_pixels are the size of the ROI '''
+        self.roi_parameters = get_roi_parameters_from_config(self.cfg)
+        self.camera_roi = None
+        self.full_x_pixels = self.x_pixels
+        self.full_y_pixels = self.y_pixels
+
         self.camera_line_interval = self.cfg.startup['camera_line_interval']
         self.camera_exposure_time = self.cfg.startup['camera_exposure_time']
 
@@ -56,7 +87,44 @@ class mesoSPIM_Camera(QtCore.QObject):
         self.camera_display_snap_subsampling = self.cfg.startup['camera_display_snap_subsampling']
         self.camera_display_acquisition_subsampling = self.cfg.startup['camera_display_acquisition_subsampling']
 
+        self.framerate_meter = FrameRateMeter()
+
+        ''' Selects how the .raw files are written, see raw_writers.py '''
+        if hasattr(self.cfg, 'raw_writer_parameters'):
+            self.raw_writer_parameters = self.cfg.raw_writer_parameters
+        else:
+            self.raw_writer_parameters = {}
+        self.raw_writer_statistics = {}
+        self.last_written_path = None
+        self.start_plane = 0
+        self.planes_on_disk = 0
+
+        ''' Frames are assigned to planes by their frame number, see frame_check.py '''
+        self.frame_check = None
+        self.repair_images = {}
+
+        ''' Optional dark and flat-field correction of acquired images '''
+        self.flatfield_library = get_flatfield_library_from_config(self.cfg, self.camera_name)
+        self.flatfield_correction = None
+        self.calibration_sum = None
+        self.calibration_count = 0
+
+        ''' Image sharpness, see focus_metrics.py '''
+        if hasattr(self.cfg, 'focus_parameters'):
+            self.focus_parameters = self.cfg.focus_parameters
+        else:
+            self.focus_parameters = {}
+        self.focus_method = self.focus_parameters.get('method', 'tenengrad')
+        self.focus_binning = self.focus_parameters.get('binning', 4)
+        self.last_focus_metric = 0.0
+        self.live_focus_metric = self.focus_parameters.get('live_metric', True)
+        self.acquisition_focus_metric = self.focus_parameters.get('acquisition_metric', False)
+        self.focus_bands = self.focus_parameters.get('etl_bands', 8)
+        self.focus_band_axis = self.focus_parameters.get('etl_band_axis', 1)
+        self.last_focus_band_metrics = []
+
         ''' Wiring signals '''
+        self.commands = self.create_command_registry()
         self.parent.sig_state_request.connect(self.state_request_handler)
 
         self.parent.sig_prepare_image_series.connect(self.prepare_image_series, type=3)
@@ -69,13 +137,22 @@ class mesoSPIM_Camera(QtCore.QObject):
         self.parent.sig_get_snap_image.connect(self.snap_image)
         self.parent.sig_end_live.connect(self.end_live, type=3)
 
+        self.parent.sig_add_calibration_frame.connect(self.add_calibration_frame, type=3)
+        self.parent.sig_end_calibration.connect(self.end_calibration, type=3)
+        self.parent.sig_measure_focus.connect(self.measure_focus, type=3)
+
+        self.parent.sig_add_repair_frame.connect(self.add_repair_frame, type=3)
+        self.parent.sig_end_repair.connect(self.end_repair, type=3)
+
         ''' Set up the camera '''
-        if self.cfg.camera == 'HamamatsuOrca':
+        if self.camera_type == 'HamamatsuOrca':
             self.camera = mesoSPIM_HamamatsuCamera(self)
-        elif self.cfg.camera == 'PhotometricsIris15':
+        elif self.camera_type == 'PhotometricsIris15':
             self.camera = mesoSPIM_PhotometricsCamera(self)
-        elif self.cfg.camera == 'DemoCamera':
+        elif self.camera_type == 'DemoCamera':
             self.camera = mesoSPIM_DemoCamera(self)
+        elif self.camera_type == 'ReplayCamera':
+            self.camera = mesoSPIM_ReplayCamera(self)
 
         self.camera.open_camera()
 
@@ -87,24 +164,20 @@ class mesoSPIM_Camera(QtCore.QObject):
 
     @QtCore.pyqtSlot(dict)
     def state_request_handler(self, dict):
-        for key, value in zip(dict.keys(),dict.values()):
-            # print('Camera Thread: State request: Key: ', key, ' Value: ', value)
-            '''
-            The request handling is done with exec() to write fewer lines of
-            code.
-            '''
-            if key in ('camera_exposure_time',
-                        'camera_line_interval',
-                        'state',
-                        'camera_display_live_subsampling',
-                        'camera_display_snap_subsampling',
-                        'camera_display_acquisition_subsampling',
-                        'camera_binning'):
-                exec('self.set_'+key+'(value)')
-            # Log Thread ID during Live: just debugging code
-            elif key == 'state':
-                if value == 'live':
-                    logger.info('Thread ID during live: '+str(int(QtCore.QThread.currentThreadId())))
+        self.commands.dispatch(dict)
+
+    def create_command_registry(self):
+        commands = CommandRegistry(self.camera_name)
+        commands.register('camera_exposure_time', self.set_camera_exposure_time, float)
+        commands.register('camera_line_interval', self.set_camera_line_interval, float)
+        commands.register('state', self.set_state)
+        commands.register('camera_display_live_subsampling', self.set_camera_display_live_subsampling, int)
+        commands.register('camera_display_snap_subsampling', self.set_camera_display_snap_subsampling, int)
+        commands.register('camera_display_acquisition_subsampling', self.set_camera_display_acquisition_subsampling, int)
+        commands.register('camera_binning', self.set_camera_binning, str)
+        commands.register('camera_roi', self.set_camera_roi)
+        commands.register('sweeptime', self.set_sweeptime, float)
+        return commands
 
     def set_state(self, value):
         pass
@@ -134,8 +207,8 @@ class mesoSPIM_Camera(QtCore.QObject):
         Args:
             time (float): interval time to set
         '''
-        self.camera.set_line_interval(time)
         self.camera_line_interval = time
+        self.apply_line_interval()
         self.sig_update_gui_from_state.emit(True)
         self.state['camera_line_interval'] = time
         self.sig_update_gui_from_state.emit(False)
@@ -149,9 +222,53 @@ class mesoSPIM_Camera(QtCore.QObject):
     def set_camera_display_acquisition_subsampling(self, factor):
         self.camera_display_acquisition_subsampling = factor
 
+    def set_sweeptime(self, sweeptime):
+        ''' Only matters for the line interval of a ROI '''
+        if self.camera_roi is not None:
+            self.apply_line_interval(sweeptime=sweeptime)
+
     def set_camera_binning(self, value):
         self.camera.set_binning(value)
 
+    def set_camera_roi(self, roi):
+        '''Reads out only a sub-array of the sensor, see utils/camera_roi.py
+
+        Args:
+            roi (tuple): (row_start, row_stop, column_start, column_stop) as
+                fractions of the saved image, None for the full frame
+        '''
+        sensor_width = self.camera_parameters['x_pixels']
+        sensor_height = self.camera_parameters['y_pixels']
+        step = self.roi_parameters['step'] * max(self.x_binning, self.y_binning)
+        roi = snap_roi(roi, sensor_width, sensor_height, step)
+        hpos, hsize, vpos, vsize = get_subarray(roi, sensor_width, sensor_height)
+
+        if not self.camera.set_subarray(hpos, hsize, vpos, vsize):
+            ''' The core rejects ROIs for cameras without supports_subarray '''
+            logger.warning(f'Camera: {self.camera_type} does not support sub-arrays, reading full frames')
+            return
+
+        self.camera_roi = roi
+        self.x_pixels = hsize // self.x_binning
+        self.y_pixels = vsize // self.y_binning
+        self.apply_line_interval()
+        logger.info(f'Camera: ROI {self.get_roi_description()}, saved images: {self.x_pixels} x {self.y_pixels}')
+
+    def apply_line_interval(self, sweeptime=None):
+        ''' With a ROI, the line interval is stretched if the sweeptime reaches its lower limit '''
+        if sweeptime is None:
+            sweeptime = self.state['sweeptime']
+        _, line_interval = get_roi_timing(sweeptime, self.camera_line_interval, self.camera_roi,
+                                          self.roi_parameters['min_sweeptime'])
+        self.camera.set_line_interval(line_interval)
+
+    def get_roi_description(self):
+        ''' For the metadata files '''
+        if self.camera_roi is None:
+            return 'full frame'
+        hpos, hsize, vpos, vsize = get_subarray(self.camera_roi, self.camera_parameters['x_pixels'], self.camera_parameters['y_pixels'])
+        return f'hpos {hpos}, hsize {hsize}, vpos {vpos}, vsize {vsize}'
+
     @QtCore.pyqtSlot(Acquisition)
     def prepare_image_series(self, acq):
         '''
@@ -164,7 +281,7 @@ class mesoSPIM_Camera(QtCore.QObject):
         ''' TODO: Needs cam delay, sweeptime, QTimer, line delay, exp_time '''
 
         self.folder = acq['folder']
-        self.filename = acq['filename']
+        self.filename = self.get_filename(acq['filename'])
         self.path = self.folder+'/'+self.filename
         
         logger.info(f'Camera: Save path: {self.path}')
@@ -173,17 +290,39 @@ class mesoSPIM_Camera(QtCore.QObject):
         self.z_stepsize = acq['z_step']
         self.max_frame = acq.get_image_count()
 
-        self.processing_options_string = acq['processing']
-
         self.fsize = self.x_pixels*self.y_pixels
 
-        self.xy_stack = np.memmap(self.path, mode = "write", dtype = np.uint16, shape = self.fsize * self.max_frame)
+        if self.flatfield_library is not None:
+            ''' The references are full frames, they are cropped to the ROI '''
+            bounds = None if self.camera_roi is None else get_image_bounds(self.camera_roi, self.full_x_pixels, self.full_y_pixels)
+            self.flatfield_correction = self.flatfield_library.get_correction(self.binning_string, acq['zoom'], bounds)
+
+        ''' The core sets the timing traces (one per camera) and the start plane
+        (> 0 if an interrupted stack is continued) right before this call '''
+        self.timing_trace = self.parent.timing_traces[self.camera_index]
+        self.start_plane = self.parent.start_plane
+
+        self.raw_writer = get_raw_writer(self.path, self.x_pixels, self.y_pixels, self.max_frame,
+                                         self.raw_writer_parameters, self.start_plane)
+        self.planes_on_disk = self.start_plane
 
         self.camera.initialize_image_series()
-        self.cur_image = 0
+        self.first_frame_number = self.camera.get_last_frame_number()
+        self.last_seen_frame_number = 0
+        self.frame_check = FrameCheck(self.max_frame, self.start_plane)
+        self.framerate_meter.reset()
+        self.cur_image = self.start_plane
         logger.info(f'Camera: Finished Preparing Image Series')
         self.start_time = time.time()
 
+    def get_filename(self, filename):
+        ''' Filename of this camera for a row of the acquisition list '''
+        return add_filename_suffix(filename, self.filename_suffix)
+
+    def get_written_path(self, path):
+        ''' The file this camera writes for a path of the acquisition list '''
+        return get_written_path(add_filename_suffix(path, self.filename_suffix), self.raw_writer_parameters)
+
     @QtCore.pyqtSlot()
     def add_images_to_series(self):
         if self.cur_image == 0:
@@ -193,59 +332,180 @@ class mesoSPIM_Camera(QtCore.QObject):
             if self.cur_image < self.max_frame:
                 # logger.info('self.cur_image + 1: '+str(self.cur_image + 1))
                 images = self.camera.get_images_in_series()
-                for image in images:
+                arrival_time = time.time()
+                ''' Frame numbers relative to the start of the series, the last image is the newest one '''
+                last_frame_number = self.camera.get_last_frame_number() - self.first_frame_number
+                if images:
+                    dropped_frames = last_frame_number - len(images) - self.last_seen_frame_number
+                    if dropped_frames > 0:
+                        metrics.inc('dropped_frames_total', dropped_frames)
+                    self.last_seen_frame_number = last_frame_number
+                metrics.inc('frames_acquired_total', len(images))
+
+                for index, image in enumerate(images):
+                    frame_number = last_frame_number - len(images) + 1 + index
+                    plane, skipped_planes = self.frame_check.assign_frame(frame_number)
+                    if plane is None:
+                        logger.warning(f'Camera: Dropped frame {frame_number} (duplicate or beyond the stack)')
+                        continue
+                    self.write_empty_planes(skipped_planes)
+
+                    self.timing_trace.record_frame(plane, arrival_time, frame_number, len(images))
                     image = np.rot90(image)
+                    if self.flatfield_correction is not None:
+                        image = self.flatfield_correction.apply(image)
+                    if self.acquisition_focus_metric:
+                        self.timing_trace.record_focus_metric(plane, self.update_focus_metric(image))
                     self.sig_camera_frame.emit(image[0:self.x_pixels:self.camera_display_acquisition_subsampling,0:self.y_pixels:self.camera_display_acquisition_subsampling])
                     image = image.flatten()
-                    self.xy_stack[self.cur_image*self.fsize:(self.cur_image+1)*self.fsize] = image
-                    self.cur_image += 1
+                    self.raw_writer.write_plane(image)
+                    self.timing_trace.record_write(plane, time.time())
+                    self.cur_image = plane + 1
+                self.planes_on_disk = self.raw_writer.planes_on_disk
+
+                framerate = self.framerate_meter.update(len(images))
+                metrics.inc('frames_written_total', len(images))
+                metrics.inc('bytes_written_total', len(images) * self.fsize * 2)
+                metrics.set('frames_per_second', framerate)
+                metrics.set('bytes_per_second', framerate * self.fsize * 2)
+                metrics.set('writer_queue_depth', self.timing_trace.triggered - self.timing_trace.written)
+
+    def write_empty_planes(self, planes):
+        ''' Keeps the following planes at their position in the file '''
+        if not planes:
+            return
+        logger.warning(f'Camera: {len(planes)} missing plane(s) starting at plane {planes[0]}')
+        empty_plane = np.zeros(self.fsize, dtype=np.uint16)
+        for plane in planes:
+            self.raw_writer.write_plane(empty_plane)
+        metrics.inc('missing_planes_total', len(planes))
 
     @QtCore.pyqtSlot()
     def end_image_series(self):
         if self.stopflag is False:
-            if self.processing_options_string != '':
-                if self.processing_options_string == 'MAX':
-                    self.sig_status_message.emit('Doing Max Projection')
-                    logger.info('Camera: Started Max Projection of '+str(self.max_frame)+' Images')
-                    stackview = self.xy_stack.view()
-                    stackview.shape = (self.max_frame, self.x_pixels, self.y_pixels)
-                    max_proj = np.max(stackview, axis=0)
-                    filename = 'MAX_' +self.filename + '.tif'
-                    path = self.folder+'/'+filename
-                    tifffile.imsave(path, max_proj, photometric='minisblack')
-                    logger.info('Camera: Saved Max Projection')
-                    self.sig_status_message.emit('Done with image processing')
+            ''' Planes that did not arrive are written empty, so the file has its full size '''
+            self.write_empty_planes(self.frame_check.finish())
+            self.cur_image = self.max_frame
+        self.save_frame_check()
+
+        self.raw_writer.close()
+        self.planes_on_disk = self.raw_writer.planes_on_disk
+        self.raw_writer_statistics = self.raw_writer.get_statistics()
+        self.last_written_path = self.raw_writer.path
+        logger.info(f'Camera: Raw writer statistics: {self.raw_writer_statistics}')
+
+        ''' Projections etc. run in the post-processing queue of the core '''
 
         try:
             self.camera.close_image_series()
-            del self.xy_stack
+            del self.raw_writer
         except:
             pass
 
         self.end_time =  time.time()
-        framerate = (self.cur_image + 1)/(self.end_time - self.start_time)
+        framerate = (self.cur_image - self.start_plane + 1)/(self.end_time - self.start_time)
         logger.info(f'Camera: Framerate: {framerate}')
         self.sig_finished.emit()
 
+    def save_frame_check(self):
+        try:
+            self.frame_check.save(get_frame_check_path(self.path))
+        except OSError:
+            logger.error(f'Camera: Frame check could not be saved for {self.path}', exc_info=True)
+
+    @QtCore.pyqtSlot(int)
+    def add_repair_frame(self, plane):
+        '''Reads a snapped image to replace a missing plane of the last stack
+
+        The core snaps an image for every plane that is missing on any camera,
+        it is only kept if this camera is missing the plane.
+        '''
+        image = np.rot90(self.camera.get_image())
+        if self.flatfield_correction is not None:
+            image = self.flatfield_correction.apply(image)
+        if plane in self.frame_check.missing_planes:
+            self.repair_images[plane] = image
+        self.sig_camera_frame.emit(image[0:self.x_pixels:self.camera_display_snap_subsampling,0:self.y_pixels:self.camera_display_snap_subsampling])
+
     @QtCore.pyqtSlot()
-    def snap_image(self):
-        image = self.camera.get_image()
-        image = np.rot90(image)
+    def end_repair(self):
+        ''' Writes the re-acquired planes into the last stack '''
+        if self.repair_images:
+            replace_planes(self.last_written_path, self.x_pixels, self.y_pixels, self.repair_images)
+            self.frame_check.mark_repaired(self.repair_images)
+            self.save_frame_check()
+            logger.info(f'Camera: Replaced {len(self.repair_images)} missing plane(s) in {self.last_written_path}')
+        self.repair_images = {}
+
+    @QtCore.pyqtSlot(str, dict)
+    def snap_image(self, filename, metadata):
+        '''Hands a snapped image to the snap writer of the core
 
-        timestr = time.strftime("%Y%m%d-%H%M%S")
-        filename = timestr + '.tif'
+        Args:
+            filename (str): Filename of the snap, the camera suffix is added
+            metadata (dict): Metadata of the core, embedded into the TIFF file
+        '''
+        ''' Copy, the camera driver may reuse its buffer '''
+        image = np.rot90(self.camera.get_image()).copy()
 
-        path = self.state['snap_folder']+'/'+filename
+        path = self.state['snap_folder']+'/'+self.get_filename(filename)
 
         self.sig_camera_frame.emit(image[0:self.x_pixels:self.camera_display_snap_subsampling,0:self.y_pixels:self.camera_display_snap_subsampling])
 
-        tifffile.imsave(path, image, photometric='minisblack')
+        self.parent.snap_writer.submit(path, image, dict(metadata, CAMERA={'camera_name' : self.camera_name}))
+
+    def get_flatfield_description(self):
+        ''' For the metadata files '''
+        if self.flatfield_correction is None:
+            return 'off'
+        elif self.flatfield_correction.gain is None:
+            return 'dark frame'
+        else:
+            return 'dark and flat frame'
+
+    def update_focus_metric(self, image):
+        self.last_focus_metric = compute_focus_metric(image, self.focus_method, self.focus_binning)
+        metrics.set('focus_metric', self.last_focus_metric)
+        return self.last_focus_metric
+
+    @QtCore.pyqtSlot()
+    def measure_focus(self):
+        ''' Reads a snapped image for the autofocus and ETL calibration of the core '''
+        image = np.rot90(self.camera.get_image())
+        self.update_focus_metric(image)
+        self.last_focus_band_metrics = compute_band_metrics(image, self.focus_bands, self.focus_band_axis,
+                                                            self.focus_method, self.focus_binning)
+        self.sig_camera_frame.emit(image[0:self.x_pixels:self.camera_display_snap_subsampling,0:self.y_pixels:self.camera_display_snap_subsampling])
+
+    @QtCore.pyqtSlot()
+    def add_calibration_frame(self):
+        ''' Adds an image to the average of the flat-field calibration '''
+        image = np.rot90(self.camera.get_image()).astype(np.float64)
+        if self.calibration_sum is None:
+            self.calibration_sum = image
+        else:
+            self.calibration_sum += image
+        self.calibration_count += 1
+        self.sig_camera_frame.emit(image[0:self.x_pixels:self.camera_display_snap_subsampling,0:self.y_pixels:self.camera_display_snap_subsampling].astype(np.uint16))
+
+    @QtCore.pyqtSlot(str)
+    def end_calibration(self, kind):
+        ''' Saves the averaged calibration frames as dark or flat reference '''
+        if self.camera_roi is not None:
+            self.sig_status_message.emit('Reference frames have to be full frames, switch the camera ROI off')
+        elif self.calibration_count > 0:
+            self.flatfield_library.save_reference(kind, self.calibration_sum/self.calibration_count,
+                                                  self.binning_string, zoom=self.state['zoom'])
+            self.sig_status_message.emit(f'Saved {kind} reference ({self.calibration_count} frames)')
+        self.calibration_sum = None
+        self.calibration_count = 0
 
     @QtCore.pyqtSlot()
     def prepare_live(self):
         self.camera.initialize_live_mode()
 
         self.live_image_count = 0
+        self.framerate_meter.reset()
 
         self.start_time = time.time()
         logger.info('Camera: Preparing Live Mode')
@@ -262,6 +522,11 @@ class mesoSPIM_Camera(QtCore.QObject):
             self.live_image_count += 1
             #self.sig_camera_status.emit(str(self.live_image_count))
 
+        if images and self.live_focus_metric:
+            self.update_focus_metric(image)
+
+        metrics.set('frames_per_second', self.framerate_meter.update(len(images)))
+
     @QtCore.pyqtSlot()
     def end_live(self):
         self.camera.close_live_mode()
@@ -272,6 +537,9 @@ class mesoSPIM_Camera(QtCore.QObject):
 class mesoSPIM_GenericCamera(QtCore.QObject):
     ''' Generic mesoSPIM camera class meant for subclassing.'''
 
+    ''' Cameras that implement set_subarray set this to True '''
+    supports_subarray = False
+
     def __init__(self, parent = None):
         super().__init__()
         self.parent = parent
@@ -281,12 +549,15 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
 
         self.stopflag = False
 
-        self.x_pixels = self.cfg.camera_parameters['x_pixels']
-        self.y_pixels = self.cfg.camera_parameters['y_pixels']
-        self.x_pixel_size_in_microns = self.cfg.camera_parameters['x_pixel_size_in_microns']
-        self.y_pixel_size_in_microns = self.cfg.camera_parameters['y_pixel_size_in_microns']
+        ''' The parameters of this camera, see utils/multicamera.py '''
+        self.camera_parameters = parent.camera_parameters
+
+        self.x_pixels = self.camera_parameters['x_pixels']
+        self.y_pixels = self.camera_parameters['y_pixels']
+        self.x_pixel_size_in_microns = self.camera_parameters['x_pixel_size_in_microns']
+        self.y_pixel_size_in_microns = self.camera_parameters['y_pixel_size_in_microns']
 
-        self.binning_string = self.cfg.camera_parameters['binning'] # Should return a string in the form '2x4'
+        self.binning_string = self.camera_parameters['binning'] # Should return a string in the form '2x4'
         self.x_binning = int(self.binning_string[0])
         self.y_binning = int(self.binning_string[2])
 
@@ -296,6 +567,9 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
         self.camera_line_interval = self.cfg.startup['camera_line_interval']
         self.camera_exposure_time = self.cfg.startup['camera_exposure_time']
 
+        ''' Running count of the frames read out, cameras with hardware counters override get_last_frame_number '''
+        self.frame_number = 0
+
     def open_camera(self):
         pass
 
@@ -314,6 +588,13 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
         self.x_pixels = int(self.x_pixels / self.x_binning)
         self.y_pixels = int(self.y_pixels / self.y_binning)
 
+    def set_subarray(self, hpos, hsize, vpos, vsize):
+        '''Reads out only a sub-array of the sensor (unbinned pixels)
+
+        Returns False if the camera does not support sub-arrays.
+        '''
+        return False
+
     def initialize_image_series(self):
         pass
 
@@ -321,6 +602,10 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
         '''Should return a single numpy array'''
         pass
 
+    def get_last_frame_number(self):
+        '''Returns the number of the newest frame delivered by get_images_in_series'''
+        return self.frame_number
+
     def close_image_series(self):
         pass
 
@@ -338,6 +623,8 @@ class mesoSPIM_GenericCamera(QtCore.QObject):
         pass
 
 class mesoSPIM_DemoCamera(mesoSPIM_GenericCamera):
+    supports_subarray = True
+
 
     def __init__(self, parent = None):
         super().__init__(parent)
@@ -361,9 +648,16 @@ class mesoSPIM_DemoCamera(mesoSPIM_GenericCamera):
         self.line = np.linspace(0,6*np.pi,self.x_pixels)
         self.line = 400*np.sin(self.line)+1200
 
+    def set_subarray(self, hpos, hsize, vpos, vsize):
+        self.x_pixels = hsize // self.x_binning
+        self.y_pixels = vsize // self.y_binning
+        self.line = np.linspace(0,6*np.pi,self.x_pixels)
+        self.line = 400*np.sin(self.line)+1200
+        return True
+
     def _create_random_image(self):
         data = np.array([np.roll(self.line, 4*i+self.count) for i in range(0, self.y_pixels)], dtype='uint16')
-        data = data + (np.random.normal(size=(self.x_pixels, self.y_pixels))*100)
+        data = data + (np.random.normal(size=(self.y_pixels, self.x_pixels))*100)
         data = np.around(data).astype('uint16')
         self.count += 20
         return data
@@ -371,6 +665,7 @@ class mesoSPIM_DemoCamera(mesoSPIM_GenericCamera):
         # return np.random.randint(low=0, high=2**16, size=(self.x_pixels,self.y_pixels), dtype='l')
 
     def get_images_in_series(self):
+        self.frame_number += 1
         return [self._create_random_image()]
 
     def get_image(self):
@@ -379,14 +674,96 @@ class mesoSPIM_DemoCamera(mesoSPIM_GenericCamera):
     def get_live_image(self):
         return [self._create_random_image()]
 
+class mesoSPIM_ReplayCamera(mesoSPIM_GenericCamera):
+    '''Serves the planes of a recorded stack as frames, see utils/replay_stack.py
+
+    The planes are stored as saved by mesoSPIM, i.e. rotated by np.rot90, so
+    they are rotated back into the sensor orientation here.
+    '''
+    supports_subarray = True
+
+    def __init__(self, parent = None):
+        super().__init__(parent)
+        self.replay_path = self.camera_parameters['replay_path']
+        self.replay_dataset = self.camera_parameters.get('replay_dataset', None)
+        self.replay_loop = self.camera_parameters.get('replay_loop', True)
+        frame_rate = self.camera_parameters.get('replay_frame_rate', 0)
+        self.frame_interval = 1/frame_rate if frame_rate else 0
+        self.next_frame_time = 0
+        self.plane = 0
+        self.subarray = None
+        self.stack = None
+
+    def open_camera(self):
+        self.stack = open_replay_stack(self.replay_path, self.replay_dataset)
+        logger.info(f'Initialized Replay Camera: {self.replay_path}, {len(self.stack)} planes')
+        if tuple(self.stack[0].shape) != (self.x_pixels, self.y_pixels):
+            logger.warning(f'Replay Camera: The planes ({self.stack[0].shape}) are cropped or padded '
+                           f'to {self.x_pixels} x {self.y_pixels}')
+
+    def close_camera(self):
+        if hasattr(self.stack, 'close'):
+            self.stack.close()
+        self.stack = None
+        logger.info('Closed Replay Camera')
+
+    def set_binning(self, binning_string):
+        self.x_binning = int(self.binning_string[0])
+        self.y_binning = int(self.binning_string[2])
+        self.x_pixels = int(self.camera_parameters['x_pixels'] / self.x_binning)
+        self.y_pixels = int(self.camera_parameters['y_pixels'] / self.y_binning)
+
+    def set_subarray(self, hpos, hsize, vpos, vsize):
+        if (hpos, hsize, vpos, vsize) == (0, self.camera_parameters['x_pixels'], 0, self.camera_parameters['y_pixels']):
+            self.subarray = None
+        else:
+            self.subarray = (vpos // self.y_binning, (vpos + vsize) // self.y_binning,
+                             hpos // self.x_binning, (hpos + hsize) // self.x_binning)
+        return True
+
+    def _wait_for_frame(self):
+        ''' Limits the frame rate to replay_frame_rate '''
+        if self.frame_interval:
+            now = time.perf_counter()
+            if self.next_frame_time > now:
+                time.sleep(self.next_frame_time - now)
+            self.next_frame_time = max(self.next_frame_time, now) + self.frame_interval
+
+    def _get_next_frame(self):
+        self._wait_for_frame()
+        image = fit_frame(np.asarray(self.stack[self.plane]), int(self.camera_parameters['x_pixels'] / self.x_binning),
+                          int(self.camera_parameters['y_pixels'] / self.y_binning))
+        if self.plane + 1 < len(self.stack):
+            self.plane += 1
+        elif self.replay_loop:
+            self.plane = 0
+
+        frame = np.rot90(image, -1)
+        if self.subarray is not None:
+            v_start, v_stop, h_start, h_stop = self.subarray
+            frame = frame[v_start:v_stop, h_start:h_stop]
+        return np.ascontiguousarray(frame)
+
+    def get_images_in_series(self):
+        self.frame_number += 1
+        return [self._get_next_frame()]
+
+    def get_image(self):
+        return self._get_next_frame()
+
+    def get_live_image(self):
+        return [self._get_next_frame()]
+
 class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
+    supports_subarray = True
+
     def __init__(self, parent = None):
         super().__init__(parent)
         logger.info('Thread ID at Startup: '+str(int(QtCore.QThread.currentThreadId())))
 
     def open_camera(self):
         ''' Hamamatsu-specific code '''
-        self.camera_id = self.cfg.camera_parameters['camera_id']
+        self.camera_id = self.camera_parameters['camera_id']
 
         from .devices.cameras.hamamatsu import hamamatsu_camera as cam
         # if self.cfg.camera == 'HamamatsuOrca':
@@ -396,17 +773,17 @@ class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
 
         ''' Ideally, the Hamamatsu Camera properties should be set in this order '''
         ''' mesoSPIM mode parameters '''
-        self.hcam.setPropertyValue("sensor_mode", self.cfg.camera_parameters['sensor_mode'])
+        self.hcam.setPropertyValue("sensor_mode", self.camera_parameters['sensor_mode'])
 
-        self.hcam.setPropertyValue("defect_correct_mode", self.cfg.camera_parameters['defect_correct_mode'])
+        self.hcam.setPropertyValue("defect_correct_mode", self.camera_parameters['defect_correct_mode'])
         self.hcam.setPropertyValue("exposure_time", self.camera_exposure_time)
-        self.hcam.setPropertyValue("binning", self.cfg.camera_parameters['binning'])
-        self.hcam.setPropertyValue("readout_speed", self.cfg.camera_parameters['readout_speed'])
+        self.hcam.setPropertyValue("binning", self.camera_parameters['binning'])
+        self.hcam.setPropertyValue("readout_speed", self.camera_parameters['readout_speed'])
 
-        self.hcam.setPropertyValue("trigger_active", self.cfg.camera_parameters['trigger_active'])
-        self.hcam.setPropertyValue("trigger_mode", self.cfg.camera_parameters['trigger_mode']) # it is unclear if this is the external lightsheeet mode - how to check this?
-        self.hcam.setPropertyValue("trigger_polarity", self.cfg.camera_parameters['trigger_polarity']) # positive pulse
-        self.hcam.setPropertyValue("trigger_source", self.cfg.camera_parameters['trigger_source']) # external
+        self.hcam.setPropertyValue("trigger_active", self.camera_parameters['trigger_active'])
+        self.hcam.setPropertyValue("trigger_mode", self.camera_parameters['trigger_mode']) # it is unclear if this is the external lightsheeet mode - how to check this?
+        self.hcam.setPropertyValue("trigger_polarity", self.camera_parameters['trigger_polarity']) # positive pulse
+        self.hcam.setPropertyValue("trigger_source", self.camera_parameters['trigger_source']) # external
         self.hcam.setPropertyValue("internal_line_interval",self.camera_line_interval)
 
     def close_camera(self):
@@ -424,6 +801,7 @@ class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
         self.hcam.setPropertyValue("exposure_time", time)
 
     def set_line_interval(self, time):
+        self.camera_line_interval = time
         self.hcam.setPropertyValue("internal_line_interval",self.camera_line_interval)
 
     def set_binning(self, binningstring):
@@ -433,6 +811,19 @@ class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
         self.x_pixels = int(self.x_pixels / self.x_binning)
         self.y_pixels = int(self.y_pixels / self.y_binning)
 
+    def set_subarray(self, hpos, hsize, vpos, vsize):
+        ''' The positions are reset first, so that position + size never exceeds the sensor '''
+        self.hcam.setPropertyValue("subarray_hpos", 0)
+        self.hcam.setPropertyValue("subarray_vpos", 0)
+        self.hcam.setPropertyValue("subarray_hsize", hsize)
+        self.hcam.setPropertyValue("subarray_vsize", vsize)
+        self.hcam.setPropertyValue("subarray_hpos", hpos)
+        self.hcam.setPropertyValue("subarray_vpos", vpos)
+        ''' The sub-array mode is switched on by captureSetup when the next acquisition starts '''
+        self.x_pixels = hsize // self.x_binning
+        self.y_pixels = vsize // self.y_binning
+        return True
+
     def initialize_image_series(self):
         self.hcam.startAcquisition()
 
@@ -441,6 +832,10 @@ class mesoSPIM_HamamatsuCamera(mesoSPIM_GenericCamera):
         images = [np.reshape(aframe.getData(), (-1,self.x_pixels)) for aframe in frames]
         return images
 
+    def get_last_frame_number(self):
+        ''' Hardware frame count of the DCAM API (reset when the acquisition starts) '''
+        return self.hcam.last_frame_number
+
     def close_image_series(self):
         self.hcam.stopAcquisition()
 
@@ -478,8 +873,8 @@ class mesoSPIM_PhotometricsCamera(mesoSPIM_GenericCamera):
         self.pvcam = [cam for cam in Camera.detect_camera()][0]
 
         self.pvcam.open()
-        self.pvcam.speed_table_index = self.cfg.camera_parameters['speed_table_index']
-        self.pvcam.exp_mode = self.cfg.camera_parameters['exp_mode']
+        self.pvcam.speed_table_index = self.camera_parameters['speed_table_index']
+        self.pvcam.exp_mode = self.camera_parameters['exp_mode']
         
         logger.info('Camera Vendor Name: '+str(self.pvcam.get_param(param_id = self.const.PARAM_VENDOR_NAME)))
         logger.info('Camera Product Name: '+str(self.pvcam.get_param(param_id = self.const.PARAM_PRODUCT_NAME)))
@@ -494,16 +889,16 @@ class mesoSPIM_PhotometricsCamera(mesoSPIM_GenericCamera):
 
         ''' Setting ASLM parameters '''
         # Scan mode options: {'Auto': 0, 'Line Delay': 1, 'Scan Width': 2}
-        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_MODE, value = self.cfg.camera_parameters['scan_mode'])
+        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_MODE, value = self.camera_parameters['scan_mode'])
         # Scan direction options: {'Down': 0, 'Up': 1, 'Down/Up Alternate': 2}
-        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_DIRECTION, value = self.cfg.camera_parameters['scan_direction'])
+        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_DIRECTION, value = self.camera_parameters['scan_direction'])
         # 10.26 us x factor 
         # factor = 6 equals 71.82 us
-        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_LINE_DELAY, value = self.cfg.camera_parameters['scan_line_delay'])
+        self.pvcam.set_param(param_id = self.const.PARAM_SCAN_LINE_DELAY, value = self.camera_parameters['scan_line_delay'])
         self.pvcam.set_param(param_id = self.const.PARAM_READOUT_PORT, value = 1)
         ''' Setting Binning parameters: '''
         '''
-        self.binning_string = self.cfg.camera_parameters['binning'] # Should return a string in the form '2x4'
+        self.binning_string = self.camera_parameters['binning'] # Should return a string in the form '2x4'
         self.x_binning = int(self.binning_string[0])
         self.y_binning = int(self.binning_string[2])
         '''
@@ -585,6 +980,7 @@ class mesoSPIM_PhotometricsCamera(mesoSPIM_GenericCamera):
         self.pvcam.start_live(exp_time_ms)    
 
     def get_images_in_series(self):
+        self.frame_number += 1
         return [self.pvcam.get_live_frame()]
     
     def close_image_series(self):
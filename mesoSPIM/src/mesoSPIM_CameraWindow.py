@@ -16,7 +16,11 @@ pg.setConfigOptions(imageAxisOrder='row-major')
 pg.setConfigOptions(foreground='k')
 pg.setConfigOptions(background='w')
 
+from .mesoSPIM_State import mesoSPIM_StateSingleton
+
 class mesoSPIM_CameraWindow(QtWidgets.QWidget):
+    sig_state_request = QtCore.pyqtSignal(dict)
+
     def __init__(self, parent=None):
         super().__init__()
 
@@ -29,7 +33,7 @@ class mesoSPIM_CameraWindow(QtWidgets.QWidget):
 
         self.parent = parent
         self.cfg = parent.cfg
-
+        self.state = mesoSPIM_StateSingleton()
 
 
         ''' Set histogram Range '''
@@ -61,6 +65,12 @@ class mesoSPIM_CameraWindow(QtWidgets.QWidget):
         # print(self.vLine.getXPos())
         # print(self.hLine.getYPos())
 
+        ''' Camera ROI selection, see utils/camera_roi.py '''
+        self.roi = None
+        self.DrawROIButton.toggled.connect(self.draw_roi)
+        self.ApplyROIButton.clicked.connect(self.apply_roi)
+        self.FullFrameButton.clicked.connect(lambda: self.sig_state_request.emit({'camera_roi' : None}))
+
         logger.info('Thread ID at Startup: '+str(int(QtCore.QThread.currentThreadId())))
 
 
@@ -81,6 +91,46 @@ class mesoSPIM_CameraWindow(QtWidgets.QWidget):
         self.graphicsView.addItem(self.vLine, ignoreBounds=True)
         self.graphicsView.addItem(self.hLine, ignoreBounds=True)
 
+    @QtCore.pyqtSlot(bool)
+    def draw_roi(self, checked):
+        if checked:
+            self.roi = pg.RectROI([self.x_image_width/4, self.y_image_width/4],
+                                  [self.x_image_width/2, self.y_image_width/2],
+                                  pen=pg.mkPen({'color': "b", 'width': 2}))
+            self.graphicsView.addItem(self.roi)
+        elif self.roi is not None:
+            self.graphicsView.removeItem(self.roi)
+            self.roi = None
+
+    def apply_roi(self):
+        '''Sends the drawn rectangle as camera ROI
+
+        The displayed image is the current ROI (and may be subsampled), so the
+        rectangle is converted into fractions of the full frame.
+        '''
+        if self.roi is None:
+            return
+
+        x, y = self.roi.pos()
+        width, height = self.roi.size()
+        row_start = max(y / self.y_image_width, 0.0)
+        row_stop = min((y + height) / self.y_image_width, 1.0)
+        column_start = max(x / self.x_image_width, 0.0)
+        column_stop = min((x + width) / self.x_image_width, 1.0)
+        if row_stop <= row_start or column_stop <= column_start:
+            return
+
+        current = self.state['camera_roi'] or (0.0, 1.0, 0.0, 1.0)
+        row_span = current[1] - current[0]
+        column_span = current[3] - current[2]
+        roi = (current[0] + row_span * row_start,
+               current[0] + row_span * row_stop,
+               current[2] + column_span * column_start,
+               current[2] + column_span * column_stop)
+
+        self.DrawROIButton.setChecked(False)
+        self.sig_state_request.emit({'camera_roi' : roi})
+
     @QtCore.pyqtSlot(np.ndarray)
     def set_image(self, image):
         self.graphicsView.setImage(image, autoLevels=False, autoHistogramRange=False, autoRange=False)
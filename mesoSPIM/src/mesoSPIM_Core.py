@@ -34,10 +34,26 @@ from .devices.lasers.mesoSPIM_LaserEnabler import mesoSPIM_LaserEnabler
 
 from .mesoSPIM_Serial import mesoSPIM_Serial
 # from .mesoSPIM_DemoSerial import mesoSPIM_Serial
-from .mesoSPIM_WaveFormGenerator import mesoSPIM_WaveFormGenerator, mesoSPIM_DemoWaveFormGenerator
+from .mesoSPIM_WaveFormGenerator import mesoSPIM_WaveFormGenerator, mesoSPIM_DemoWaveFormGenerator, WAVEFORM_PARAMETERS
+from .mesoSPIM_ScriptRunner import mesoSPIM_ScriptRunner, mesoSPIM_CommandExecutor, is_legacy_script
 
 from .utils.acquisitions import AcquisitionList, Acquisition
 from .utils.utility_functions import convert_seconds_to_string
+from .utils.timing_trace import TimingTrace
+from .utils.metrics import metrics, start_metrics_server_from_config
+from .utils.command_registry import CommandRegistry
+from .utils.storage_preflight import run_storage_preflight
+from .utils.storage_policy import get_storage_policy_from_config
+from .utils.tile_registration import get_tile_registration_from_config
+from .utils.bigdataviewer_xml_creator import mesoSPIM_XMLexporter
+from .utils.focus_metrics import fit_focus_peak
+from .utils.etl_calibration import fit_etl_parameters
+from .utils.multicamera import get_camera_configs, compare_frame_numbers
+from .utils.camera_roi import snap_roi, get_subarray
+from .utils.frame_check import get_frame_loss_parameters_from_config, get_frame_check_path
+from .utils.postprocessing import get_postprocessing_queue_from_config
+from .utils.snap_writer import get_snap_writer_from_config
+from .utils.acquisition_journal import AcquisitionJournal, read_journal, get_journal_parameters_from_config, journal_state_keys, journal_resume_keys
 from .utils.demo_threads import mesoSPIM_DemoThread
 
 class mesoSPIM_Core(QtCore.QObject):
@@ -57,8 +73,11 @@ class mesoSPIM_Core(QtCore.QObject):
 
     sig_status_message = QtCore.pyqtSignal(str)
     sig_warning = QtCore.pyqtSignal(str)
+    ''' Warnings meaning that the acquisition list was not (completely) acquired '''
+    sig_error = QtCore.pyqtSignal(str)
 
     sig_progress = QtCore.pyqtSignal(dict)
+    sig_postprocessing_status = QtCore.pyqtSignal(dict)
 
     ''' Camera-related signals '''
     sig_prepare_image_series = QtCore.pyqtSignal(Acquisition)
@@ -68,9 +87,20 @@ class mesoSPIM_Core(QtCore.QObject):
 
     sig_prepare_live = QtCore.pyqtSignal()
     sig_get_live_image = QtCore.pyqtSignal()
-    sig_get_snap_image = QtCore.pyqtSignal()
+    sig_get_snap_image = QtCore.pyqtSignal(str, dict)
     sig_end_live = QtCore.pyqtSignal()
 
+    sig_add_calibration_frame = QtCore.pyqtSignal()
+    sig_end_calibration = QtCore.pyqtSignal(str)
+    sig_measure_focus = QtCore.pyqtSignal()
+
+    ''' Re-acquisition of missing planes, see utils/frame_check.py '''
+    sig_add_repair_frame = QtCore.pyqtSignal(int)
+    sig_end_repair = QtCore.pyqtSignal()
+
+    ''' Row, f_start, f_end found by the autofocus '''
+    sig_set_acquisition_focus = QtCore.pyqtSignal(int, float, float)
+
     ''' Movement-related signals: '''
     sig_move_relative = QtCore.pyqtSignal(dict)
     sig_move_relative_and_wait_until_done = QtCore.pyqtSignal(dict)
@@ -100,6 +130,7 @@ class mesoSPIM_Core(QtCore.QObject):
         self.state['state']='init'
 
         ''' The signal-slot switchboard '''
+        self.commands = self.create_command_registry()
         self.parent.sig_state_request.connect(self.state_request_handler)
 
         self.parent.sig_execute_script.connect(self.execute_script)
@@ -120,15 +151,25 @@ class mesoSPIM_Core(QtCore.QObject):
 
         #logger.info('Core internal thread affinity in init: '+str(id(self.thread())))
 
-        ''' Set the Camera thread up '''
-        self.camera_thread = QtCore.QThread()
-        #self.camera_worker = mesoSPIM_HamamatsuCamera(self)
-        self.camera_worker = mesoSPIM_Camera(self)
-        #logger.info('Camera worker thread affinity before moveToThread? Answer:'+str(id(self.camera_worker.thread())))
-        self.camera_worker.moveToThread(self.camera_thread)
-        self.camera_worker.sig_update_gui_from_state.connect(self.sig_update_gui_from_state.emit)
-        self.camera_worker.sig_status_message.connect(self.send_status_message_to_gui)
-        #logger.info('Camera worker thread affinity after moveToThread? Answer:'+str(id(self.camera_worker.thread())))
+        ''' Set the Camera threads up: One thread per camera, see utils/multicamera.py '''
+        self.camera_threads = []
+        self.camera_workers = []
+        for camera_index, camera_config in enumerate(get_camera_configs(self.cfg)):
+            camera_thread = QtCore.QThread()
+            #self.camera_worker = mesoSPIM_HamamatsuCamera(self)
+            camera_worker = mesoSPIM_Camera(self, camera_index, camera_config)
+            #logger.info('Camera worker thread affinity before moveToThread? Answer:'+str(id(self.camera_worker.thread())))
+            camera_worker.moveToThread(camera_thread)
+            camera_worker.sig_update_gui_from_state.connect(self.sig_update_gui_from_state.emit)
+            camera_worker.sig_status_message.connect(self.send_status_message_to_gui)
+            #logger.info('Camera worker thread affinity after moveToThread? Answer:'+str(id(self.camera_worker.thread())))
+            self.camera_threads.append(camera_thread)
+            self.camera_workers.append(camera_worker)
+
+        ''' The primary camera is displayed and used for focus measurements '''
+        self.camera_thread = self.camera_threads[0]
+        self.camera_worker = self.camera_workers[0]
+        self.timing_traces = []
         ''' Set the serial thread up '''
         self.serial_thread = QtCore.QThread()
         self.serial_worker = mesoSPIM_Serial(self)
@@ -144,13 +185,9 @@ class mesoSPIM_Core(QtCore.QObject):
         # self.demo_worker.moveToThread(self.demo_thread)
         # self.demo_thread.start()
 
-        # ''' HICKUP DEBUGGING '''
-        # self.z_start_measured = 0.0
-        # self.z_end_measured = 0.0
-        # self.hickup_delta_z = 0.0
-
         ''' Start the threads '''
-        self.camera_thread.start()
+        for camera_thread in self.camera_threads:
+            camera_thread.start()
         #logger.info('Camera worker thread affinity after starting the thread? Answer:'+str(id(self.camera_worker.thread())))
         self.serial_thread.start()
 
@@ -203,6 +240,49 @@ class mesoSPIM_Core(QtCore.QObject):
 
         self.stopflag = False
 
+        ''' Optional local HTTP endpoint for performance metrics '''
+        self.metrics_server = start_metrics_server_from_config(self.cfg)
+
+        ''' Optional distribution of the stacks across several disks '''
+        self.storage_policy = get_storage_policy_from_config(self.cfg)
+
+        ''' Optional registration of overlapping tiles while they are acquired '''
+        self.tile_registration = get_tile_registration_from_config(self.cfg)
+
+        if hasattr(self.cfg, 'focus_parameters'):
+            self.focus_parameters = self.cfg.focus_parameters
+        else:
+            self.focus_parameters = {}
+
+        ''' Optional re-acquisition of planes lost by the cameras '''
+        self.frame_loss_parameters = get_frame_loss_parameters_from_config(self.cfg)
+
+        ''' Journal of the running acquisition list, see utils/acquisition_journal.py '''
+        self.journal_parameters = get_journal_parameters_from_config(self.cfg)
+        self.journal = None
+        self.journal_progress = None
+        self.start_plane = 0
+
+        ''' Projections, previews, conversions and checksums of finished stacks in worker processes '''
+        self.postprocessing = get_postprocessing_queue_from_config(self.cfg)
+        self.postprocessing.sig_status.connect(self.sig_postprocessing_status.emit)
+
+        ''' Scripts run in their own thread, their commands are executed in the core and serial threads.
+        The core executor is a child of the core, so it moves into the core thread with it. '''
+        self.core_executor = mesoSPIM_CommandExecutor(self)
+        self.serial_executor = mesoSPIM_CommandExecutor()
+        self.serial_executor.moveToThread(self.serial_thread)
+        self.script_thread = QtCore.QThread()
+        self.script_runner = mesoSPIM_ScriptRunner(self, self.core_executor, self.serial_executor)
+        self.script_runner.moveToThread(self.script_thread)
+        self.script_runner.sig_finished.connect(self.script_finished)
+        self.script_thread.start()
+
+        ''' Snapped images are encoded and written in background threads '''
+        self.snap_writer = get_snap_writer_from_config(self.cfg)
+        self.last_snap_time = ''
+        self.snap_count = 0
+
         logger.info('Thread ID at Startup: '+str(int(QtCore.QThread.currentThreadId())))
 
         # self.acquisition_list_rotation_position = {}
@@ -214,10 +294,22 @@ class mesoSPIM_Core(QtCore.QObject):
         Make sure to keep this up to date with the number of threads
         '''
         try:
-            self.camera_thread.quit()
+            if self.metrics_server is not None:
+                self.metrics_server.stop()
+            if self.tile_registration is not None:
+                self.tile_registration.shutdown()
+            self.postprocessing.shutdown()
+            self.snap_writer.shutdown()
+            self.script_runner.stop()
+            self.script_thread.quit()
+            self.script_thread.wait()
+
+            for camera_thread in self.camera_threads:
+                camera_thread.quit()
             self.serial_thread.quit()
 
-            self.camera_thread.wait()
+            for camera_thread in self.camera_threads:
+                camera_thread.wait()
             self.serial_thread.wait()
         except:
             pass
@@ -225,60 +317,27 @@ class mesoSPIM_Core(QtCore.QObject):
 
     @QtCore.pyqtSlot(dict)
     def state_request_handler(self, dict):
-        for key, value in zip(dict.keys(),dict.values()):
-            # print('Core Thread: State request: Key: ', key, ' Value: ', value)
-            '''
-            The request handling is done with exec() to write fewer lines of
-            code.
-            '''
-            if key in ('filter',
-                       'zoom',
-                       'laser',
-                       'intensity',
-                       'shutterconfig',
-                       'state',
-                       'camera_exposure_time',
-                       'camera_line_interval'):
-                exec('self.set_'+key+'(value)')
-
-            elif key in ('samplerate',
-                       'sweeptime',
-                       'ETL_cfg_file',
-                       'etl_l_delay_%',
-                       'etl_l_ramp_rising_%',
-                       'etl_l_ramp_falling_%',
-                       'etl_l_amplitude',
-                       'etl_l_offset',
-                       'etl_r_delay_%',
-                       'etl_r_ramp_rising_%',
-                       'etl_r_ramp_falling_%',
-                       'etl_r_amplitude',
-                       'etl_r_offset',
-                       'galvo_l_frequency',
-                       'galvo_l_amplitude',
-                       'galvo_l_offset',
-                       'galvo_l_duty_cycle',
-                       'galvo_l_phase',
-                       'galvo_r_frequency',
-                       'galvo_r_amplitude',
-                       'galvo_r_offset',
-                       'galvo_r_duty_cycle',
-                       'galvo_r_phase',
-                       'laser_l_delay_%',
-                       'laser_l_pulse_%',
-                       'laser_l_max_amplitude',
-                       'laser_r_delay_%',
-                       'laser_r_pulse_%',
-                       'laser_r_max_amplitude',
-                       'camera_delay_%',
-                       'camera_pulse_%',
-                       'camera_display_live_subsampling',
-                       'camera_display_snap_subsampling',
-                       'camera_display_acquisition_subsampling',
-                       'camera_sensor_mode',
-                       'camera_binning',
-                       ):
-                self.sig_state_request.emit({key : value})
+        ''' Keys for the other threads are passed on in one emission per batch, see utils/command_registry.py '''
+        self.commands.dispatch(dict, forward=self.sig_state_request.emit)
+
+    def create_command_registry(self):
+        commands = CommandRegistry('Core')
+        commands.register('filter', self.set_filter, str)
+        commands.register('zoom', self.set_zoom, str)
+        commands.register('laser', self.set_laser, str)
+        commands.register('intensity', self.set_intensity)
+        commands.register('shutterconfig', self.set_shutterconfig, str)
+        commands.register('state', self.set_state, str)
+        commands.register('camera_exposure_time', self.set_camera_exposure_time, float)
+        commands.register('camera_line_interval', self.set_camera_line_interval, float)
+        commands.register('camera_roi', self.set_camera_roi)
+        commands.register_forwarded(WAVEFORM_PARAMETERS + ('ETL_cfg_file',
+                                    'camera_display_live_subsampling',
+                                    'camera_display_snap_subsampling',
+                                    'camera_display_acquisition_subsampling',
+                                    'camera_sensor_mode',
+                                    'camera_binning'))
+        return commands
 
     def set_state(self, state):
         if state == 'live':
@@ -303,6 +362,11 @@ class mesoSPIM_Core(QtCore.QObject):
             self.sig_state_request.emit({'state':'run_acquisition_list'})
             self.start(row = None)
 
+        elif state == 'resume_acquisition_list':
+            self.state['state'] = 'run_acquisition_list'
+            self.sig_state_request.emit({'state':'run_acquisition_list'})
+            self.resume(self.state['resume_journal'])
+
         elif state == 'preview_acquisition_with_z_update':
             self.state['state'] = 'preview_acquisition'
             self.preview_acquisition(z_update=True)
@@ -328,6 +392,7 @@ class mesoSPIM_Core(QtCore.QObject):
 
     def stop(self):
         self.stopflag = True
+        self.script_runner.stop()
         ''' This stopflag is a bit risky, needs to be updated'''
         self.state['state']='idle'
         self.sig_update_gui_from_state.emit(False)
@@ -399,6 +464,39 @@ class mesoSPIM_Core(QtCore.QObject):
     def set_camera_line_interval(self, time):
         self.sig_state_request.emit({'camera_line_interval' : time})
 
+    def set_camera_roi(self, roi):
+        '''Reads out only a region of the cameras and retimes the waveforms
+
+        Args:
+            roi (tuple): (row_start, row_stop, column_start, column_stop) as
+                fractions of the saved image, None for the full frame
+
+        The ROI is aligned to the sub-array granularity of the primary camera.
+        It is rejected if one of the cameras cannot read out sub-arrays, as the
+        waveforms would be retimed for a ROI that is not read out.
+        '''
+        if self.state['state'] != 'idle':
+            self.sig_warning.emit('The camera ROI can only be changed while no acquisition or live mode is running.')
+            return
+
+        if roi is not None:
+            unsupported = [worker.camera_type for worker in self.camera_workers if not worker.camera.supports_subarray]
+            if unsupported:
+                self.sig_warning.emit(f"Camera ROIs are not supported by {', '.join(unsupported)}, the full frame is read out.")
+                return
+
+        camera_worker = self.camera_worker
+        step = camera_worker.roi_parameters['step'] * max(camera_worker.x_binning, camera_worker.y_binning)
+        roi = snap_roi(roi, camera_worker.camera_parameters['x_pixels'], camera_worker.camera_parameters['y_pixels'], step)
+
+        self.sig_update_gui_from_state.emit(True)
+        self.state['camera_roi'] = roi
+        self.sig_update_gui_from_state.emit(False)
+        ''' Cameras and waveform generator '''
+        self.sig_state_request.emit({'camera_roi' : roi})
+        hpos, hsize, vpos, vsize = get_subarray(roi, camera_worker.camera_parameters['x_pixels'], camera_worker.camera_parameters['y_pixels'])
+        self.sig_status_message.emit(f'Camera ROI: {hsize} x {vsize} sensor pixels at {hpos}, {vpos}')
+
     @QtCore.pyqtSlot(dict)
     def move_relative(self, dict, wait_until_done=False):
         if wait_until_done:
@@ -462,21 +560,238 @@ class mesoSPIM_Core(QtCore.QObject):
     Sub-Imaging modes
     '''
     def snap(self):
+        self.save_snap()
+        self.sig_finished.emit()
+        QtWidgets.QApplication.processEvents()
+
+    def save_snap(self):
+        '''Snaps an image into the snap folder and returns its filename
+
+        The camera hands the image to the snap writer, filename and metadata
+        are taken once for both files.
+        '''
+        filename = self.get_snap_filename()
+        metadata = self.get_snap_metadata()
+
         self.sig_prepare_live.emit()
         self.open_shutters()
         self.snap_image()
-        self.sig_get_snap_image.emit()
+        self.sig_get_snap_image.emit(filename, metadata)
         self.close_shutters()
 
-        ''' Doubled code'''
-        timestr = time.strftime("%Y%m%d-%H%M%S")
-        filename = timestr + '.tif'
+        self.write_snap_metadata(filename, metadata)
+
+        self.sig_end_live.emit()
+        return filename
+
+    def calibrate_flatfield(self, kind, frames=10):
+        '''Averages reference frames for the flat-field correction
 
-        self.write_snap_metadata(filename)
+        Args:
+            kind (str): 'dark' (shutters stay closed, e.g. with the laser off) or
+                        'flat' (shutters open, with a uniform sample in the beam path)
+            frames (int): Number of frames to average
 
+        The flat frame is saved for the current zoom. Can be run from a script:
+        self.calibrate_flatfield('dark', frames=20)
+        '''
+        if self.camera_worker.flatfield_library is None:
+            self.sig_warning.emit('Flat-field correction is not enabled in the configuration file!')
+            return
+
+        self.stopflag = False
+        self.sig_status_message.emit(f'Acquiring {kind} reference frames')
+        self.sig_prepare_live.emit()
+        for frame in range(frames):
+            if self.stopflag:
+                break
+            if kind == 'flat':
+                self.open_shutters()
+            self.snap_image()
+            self.sig_add_calibration_frame.emit()
+            if kind == 'flat':
+                self.close_shutters()
+        self.sig_end_calibration.emit(kind)
         self.sig_end_live.emit()
-        self.sig_finished.emit()
-        QtWidgets.QApplication.processEvents()
+
+    def set_focus_axis(self, axis, position):
+        ''' Moves the detection focus ('f_pos') or sets an ETL offset/amplitude '''
+        if axis == 'f_pos':
+            self.move_absolute({'f_abs' : position}, wait_until_done=True)
+        else:
+            self.state_request_handler({axis : position})
+
+    def get_focus_axis(self, axis):
+        if axis == 'f_pos':
+            return self.state['position']['f_pos']
+        else:
+            return self.state[axis]
+
+    def autofocus(self, axis='f_pos', search_range=None, steps=None):
+        '''Sweeps the focus, fits the sharpness peak and goes there
+
+        Args:
+            axis (str): 'f_pos' (focus stage) or an ETL parameter like 'etl_l_offset'
+            search_range (float): Full width of the sweep around the current
+                                  position (microns for f_pos, V for ETL parameters)
+            steps (int): Number of images in the sweep
+
+        Returns the best position. Can be run from a script:
+        self.autofocus('f_pos', search_range=200, steps=11)
+        '''
+        self.stopflag = False
+        return self.sweep_focus(axis, search_range, steps)
+
+    def sweep_focus(self, axis='f_pos', search_range=None, steps=None):
+        ''' The sweep of autofocus(), keeps the stopflag so that a Stop also ends loops over sweeps '''
+        if search_range is None:
+            search_range = self.focus_parameters.get('f_search_range' if axis == 'f_pos' else 'etl_search_range', 200 if axis == 'f_pos' else 0.2)
+        if steps is None:
+            steps = self.focus_parameters.get('steps', 11)
+
+        center = self.get_focus_axis(axis)
+        positions = np.linspace(center - search_range/2, center + search_range/2, steps)
+        scores = []
+
+        self.sig_status_message.emit(f'Autofocus: Sweeping {axis}')
+        self.sig_prepare_live.emit()
+        self.open_shutters()
+        for position in positions:
+            if self.stopflag:
+                break
+            self.set_focus_axis(axis, position)
+            self.snap_image()
+            self.sig_measure_focus.emit()
+            scores.append(self.camera_worker.last_focus_metric)
+        self.close_shutters()
+        self.sig_end_live.emit()
+
+        if scores:
+            best = fit_focus_peak(positions[:len(scores)], scores)
+        else:
+            best = center
+        self.set_focus_axis(axis, best)
+        logger.info(f'Core: Autofocus {axis}: {best} (sweep {list(positions[:len(scores)])}, scores {scores})')
+        return best
+
+    def autofocus_acquisition_list(self, rows=None):
+        '''Finds f_start and f_end for rows of the acquisition list
+
+        For every row, the focus is measured at z_start and z_end with the
+        settings of the row and written back into the Acquisition Manager.
+
+        Args:
+            rows (list): Rows to focus, None focuses all rows
+        '''
+        acq_list = self.state['acq_list']
+        if rows is None:
+            rows = range(len(acq_list))
+
+        self.stopflag = False
+        for row in rows:
+            acq = acq_list[row]
+            self.sig_status_message.emit(f'Autofocus: Row {row}')
+            self.move_absolute(acq.get_startpoint(), wait_until_done=True)
+            self.set_acquisition_settings(acq)
+            f_start = self.sweep_focus('f_pos')
+            if self.stopflag:
+                break
+
+            self.move_absolute({'z_abs' : acq['z_end']}, wait_until_done=True)
+            f_end = self.sweep_focus('f_pos')
+            if self.stopflag:
+                break
+
+            self.sig_set_acquisition_focus.emit(row, f_start, f_end)
+
+    def calibrate_etl(self, side='l', search_range=None, steps=None):
+        '''Finds ETL offset and amplitude of one side for the current laser and zoom
+
+        The offset is swept around the current value, the sharpness is measured
+        in bands across the field of view and the best offsets of the bands are
+        fitted (see etl_calibration.py). The result is set, but not saved.
+
+        Args:
+            side (str): 'l' or 'r'
+            search_range (float): Full width of the offset sweep in V
+
+        Returns (offset, amplitude)
+        '''
+        self.stopflag = False
+        return self.sweep_etl(side, search_range, steps)
+
+    def sweep_etl(self, side='l', search_range=None, steps=None):
+        ''' The sweep of calibrate_etl(), keeps the stopflag so that a Stop also ends loops over sweeps '''
+        offset_key = 'etl_'+side+'_offset'
+        amplitude_key = 'etl_'+side+'_amplitude'
+        if search_range is None:
+            search_range = self.focus_parameters.get('etl_search_range', 0.2)
+        if steps is None:
+            steps = self.focus_parameters.get('steps', 11)
+
+        self.set_shutterconfig('Left' if side == 'l' else 'Right')
+        center = self.state[offset_key]
+        amplitude = self.state[amplitude_key]
+        offsets = np.linspace(center - search_range/2, center + search_range/2, steps)
+        band_metrics = []
+
+        self.sig_status_message.emit(f'ETL calibration: Sweeping {offset_key}')
+        self.sig_prepare_live.emit()
+        self.open_shutters()
+        for offset in offsets:
+            if self.stopflag:
+                break
+            self.state_request_handler({offset_key : offset})
+            self.snap_image()
+            self.sig_measure_focus.emit()
+            band_metrics.append(self.camera_worker.last_focus_band_metrics)
+        self.close_shutters()
+        self.sig_end_live.emit()
+
+        if len(band_metrics) < steps:
+            self.state_request_handler({offset_key : center})
+            return center, amplitude
+
+        offset, amplitude, best_offsets = fit_etl_parameters(offsets, band_metrics, amplitude,
+                                                              self.focus_parameters.get('etl_band_direction', 1))
+        self.state_request_handler({offset_key : round(offset, 4), amplitude_key : round(amplitude, 4)})
+        logger.info(f'Core: ETL calibration {side}: offset {offset}, amplitude {amplitude}, best offsets of the bands {list(best_offsets)}')
+        return round(offset, 4), round(amplitude, 4)
+
+    def calibrate_etl_table(self, lasers=None, zooms=None):
+        '''Calibrates both ETLs for all laser/zoom combinations and saves them to the ETL parameter file
+
+        Starts from the values in the ETL parameter file. Needs a sample
+        with structure across the whole field of view.
+
+        Args:
+            lasers, zooms (list): Combinations to calibrate, default: all in the config
+        '''
+        if lasers is None:
+            lasers = list(self.cfg.laserdict.keys())
+        if zooms is None:
+            zooms = list(self.cfg.zoomdict.keys())
+
+        shutterconfig = self.state['shutterconfig']
+        parameters = {}
+        self.stopflag = False
+        for zoom in zooms:
+            if self.stopflag:
+                break
+            self.set_zoom(zoom, wait_until_done=True, update_etl=False)
+            for laser in lasers:
+                self.set_laser(laser, wait_until_done=True, update_etl=True)
+                left = self.sweep_etl('l')
+                if self.stopflag:
+                    break
+                right = self.sweep_etl('r')
+                if self.stopflag:
+                    break
+                parameters[(laser, zoom)] = dict(zip(('etl_l_offset', 'etl_l_amplitude', 'etl_r_offset', 'etl_r_amplitude'), left + right))
+
+        self.waveformer.etl_parameters.update_parameters(parameters)
+        self.set_shutterconfig(shutterconfig)
+        self.sig_status_message.emit(f'ETL calibration: Saved {len(parameters)} laser/zoom combinations')
 
     def snap_image(self):
         '''Snaps a single image after updating the waveforms.
@@ -531,36 +846,170 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_end_live.emit()
         self.sig_finished.emit()
 
-    def start(self, row=None):
+    def get_written_paths(self, path):
+        ''' The files the cameras write for a path of the acquisition list '''
+        return [camera_worker.get_written_path(path) for camera_worker in self.camera_workers]
+
+    def start(self, row=None, acq_list=None):
+        '''Runs the acquisition list of the state, one row of it or the given acq_list'''
         self.stopflag = False
 
-        if row==None:
+        if acq_list is not None:
+            pass
+        elif row==None:
             acq_list = self.state['acq_list']
         else:
             acq_list = self.state['acq_list']
             acquisition = self.state['acq_list'][row]
             acq_list = AcquisitionList([acquisition])
-            
-        nonexisting_folders_list = acq_list.check_for_nonexisting_folders()
-        filename_list = acq_list.check_for_existing_filenames()
-        duplicates_list = acq_list.check_for_duplicated_filenames()
+
+        if self.storage_policy is not None:
+            acq_list = self.storage_policy.apply(acq_list, self.camera_worker.x_pixels, self.camera_worker.y_pixels)
+
+        ''' One table for all file checks '''
+        checks = acq_list.get_table().validate(self.get_written_paths)
+        nonexisting_folders_list = checks['nonexisting_folders']
+        filename_list = checks['existing_filenames']
+        duplicates_list = checks['duplicated_filenames']
 
         if nonexisting_folders_list != []:
-            self.sig_warning.emit('The following folders do not exist - stopping! \n'+self.list_to_string_with_carriage_return(nonexisting_folders_list))
+            self.send_error('The following folders do not exist - stopping! \n'+self.list_to_string_with_carriage_return(nonexisting_folders_list))
             self.sig_finished.emit()
         elif filename_list != []:
-            self.sig_warning.emit('The following files already exist - stopping! \n'+self.list_to_string_with_carriage_return(filename_list))
+            self.send_error('The following files already exist - stopping! \n'+self.list_to_string_with_carriage_return(filename_list))
             self.sig_finished.emit()
         elif duplicates_list != []:
-            self.sig_warning.emit('The following filenames are duplicated - stopping! \n' +self.list_to_string_with_carriage_return(duplicates_list))
+            self.send_error('The following filenames are duplicated - stopping! \n' +self.list_to_string_with_carriage_return(duplicates_list))
+            self.sig_finished.emit()
+        elif not self.check_storage(acq_list):
             self.sig_finished.emit()
         else:
+            if self.storage_policy is not None:
+                self.storage_policy.save_manifest()
+            self.journal_progress = None
+            self.open_journal(acq_list)
             self.sig_update_gui_from_state.emit(True)
             self.prepare_acquisition_list(acq_list)
             self.run_acquisition_list(acq_list)
             self.close_acquisition_list(acq_list)
             self.sig_update_gui_from_state.emit(False)
 
+    def resume(self, journal_path):
+        '''Continues an interrupted acquisition list from its journal
+
+        Completed stacks are skipped, a partial stack continues at the last
+        checkpoint into the existing files. Can be run from a script:
+        self.resume('/data/mesoSPIM_journal_20201019-213000.jsonl')
+        '''
+        self.stopflag = False
+        try:
+            progress = read_journal(journal_path)
+        except (OSError, ValueError) as error:
+            self.send_error(f'The journal could not be read - stopping! \n{error}')
+            self.sig_finished.emit()
+            return
+
+        acq_list = progress.acq_list
+        nonexisting_folders_list = acq_list.check_for_nonexisting_folders()
+        resume_problems = self.check_resume(progress)
+        if progress.finished:
+            self.send_error(f'The acquisition list of {journal_path} was already completed - stopping!')
+            self.sig_finished.emit()
+        elif nonexisting_folders_list != []:
+            self.send_error('The following folders do not exist - stopping! \n'+self.list_to_string_with_carriage_return(nonexisting_folders_list))
+            self.sig_finished.emit()
+        elif resume_problems != []:
+            self.send_error(f'{journal_path} cannot be continued with the current settings - stopping! \n'+self.list_to_string_with_carriage_return(resume_problems))
+            self.sig_finished.emit()
+        else:
+            logger.info(f'Core: Resuming {journal_path}: {len(progress.completed_rows)} of {len(acq_list)} stacks completed, '
+                        f'partial stacks {progress.planes_written}, last device state {progress.last_state}')
+            self.state['predicted_acq_list_time'] = progress.get_remaining_image_count()/self.state['current_framerate']
+            self.journal_progress = progress
+            self.journal = AcquisitionJournal.append(journal_path) if self.journal_parameters['enabled'] else None
+            self.sig_update_gui_from_state.emit(True)
+            self.prepare_acquisition_list(acq_list)
+            self.run_acquisition_list(acq_list)
+            self.close_acquisition_list(acq_list)
+            self.sig_update_gui_from_state.emit(False)
+
+    def open_journal(self, acq_list):
+        ''' Starts a journal in the folder of the first stack '''
+        self.journal = None
+        if not self.journal_parameters['enabled']:
+            return
+        try:
+            self.journal = AcquisitionJournal.create(acq_list[0]['folder'], acq_list)
+        except OSError:
+            logger.error('Core: The acquisition journal could not be created', exc_info=True)
+
+    def get_journal_state(self):
+        return {key : self.state[key] for key in journal_state_keys}
+
+    def check_resume(self, progress):
+        '''Returns why the stacks of a journal cannot be continued, an empty list if they can
+
+        The camera settings have to match the last state of the journal and the
+        files of partial stacks have to hold the planes written before.
+        '''
+        problems = []
+        for key in journal_resume_keys:
+            if key not in progress.last_state:
+                continue
+            recorded, current = progress.last_state[key], self.state[key]
+            ''' JSON turns tuples into lists '''
+            if isinstance(current, tuple):
+                current = list(current)
+            if recorded != current:
+                problems.append(f'{key} is {current}, the journal was written with {recorded}')
+
+        for row, start_plane in progress.planes_written.items():
+            if not start_plane:
+                continue
+            acq = progress.acq_list[row]
+            for camera_worker in self.camera_workers:
+                path = camera_worker.get_written_path(acq['folder']+'/'+acq['filename'])
+                if not os.path.exists(path):
+                    problems.append(f'{path} does not exist')
+                elif camera_worker.raw_writer_parameters.get('writer', 'memmap') != 'compressed':
+                    ''' Compressed files check their plane index when they are continued '''
+                    expected_size = start_plane * camera_worker.x_pixels * camera_worker.y_pixels * 2
+                    if os.path.getsize(path) < expected_size:
+                        problems.append(f'{path} is smaller than the {start_plane} planes written before')
+        return problems
+
+    def get_planes_on_disk(self):
+        ''' Planes of the current stack written by all cameras '''
+        return min(camera_worker.planes_on_disk for camera_worker in self.camera_workers)
+
+    def check_storage(self, acq_list):
+        '''
+        Checks free space and (optionally) write bandwidth of the target folders
+
+        Returns False if the data does not fit on the disks. Slow disks only cause a warning.
+        '''
+        if hasattr(self.cfg, 'storage_preflight_parameters'):
+            parameters = self.cfg.storage_preflight_parameters
+        else:
+            parameters = {}
+
+        self.sig_status_message.emit('Checking storage')
+        report = run_storage_preflight(acq_list,
+                                       self.camera_worker.x_pixels,
+                                       self.camera_worker.y_pixels,
+                                       self.state['current_framerate'],
+                                       cameras=len(self.camera_workers),
+                                       measure_bandwidth=parameters.get('measure_bandwidth', False),
+                                       probe_size_mb=parameters.get('probe_size_mb', 256),
+                                       free_space_margin=parameters.get('free_space_margin', 0.05))
+
+        if report.errors:
+            self.send_error('Not enough disk space - stopping! \n'+self.list_to_string_with_carriage_return(report.errors)+'\n\n'+report.to_string())
+            return False
+        elif report.warnings:
+            self.sig_warning.emit('The acquisition might be slowed down by the disks: \n'+self.list_to_string_with_carriage_return(report.warnings)+'\n\n'+report.to_string())
+        return True
+
     def prepare_acquisition_list(self, acq_list):
         '''
         Housekeeping: Prepare the acquisition list
@@ -569,19 +1018,60 @@ class mesoSPIM_Core(QtCore.QObject):
         self.acquisition_count = 0
         self.total_acquisition_count = len(acq_list)
         self.total_image_count = acq_list.get_image_count()
+        ''' image_count includes the planes of a resumed list that were acquired before,
+        the frame rate and the remaining time only count the frames of this run '''
+        self.run_image_count = 0
+        if self.journal_progress is None:
+            self.run_total_image_count = self.total_image_count
+        else:
+            self.run_total_image_count = self.journal_progress.get_remaining_image_count()
         self.start_time = time.time()
+        metrics.set('acquisition_images_done', 0)
+        metrics.set('acquisition_images_total', self.total_image_count)
+
+        if self.tile_registration is not None:
+            self.tile_registration.start(acq_list, (self.camera_worker.x_pixels, self.camera_worker.y_pixels))
 
 
     def run_acquisition_list(self, acq_list):
-        for acq in acq_list:
+        for row, acq in enumerate(acq_list):
             if not self.stopflag:
+                if self.journal_progress is None:
+                    self.start_plane = 0
+                else:
+                    self.start_plane = self.journal_progress.get_start_plane(row)
+                    if self.start_plane is None:
+                        self.skip_acquisition(row, acq)
+                        continue
+                    self.image_count += self.start_plane
+
                 self.prepare_acquisition(acq)
                 self.run_acquisition(acq)
                 self.close_acquisition(acq)
+        self.start_plane = 0
+
+    def skip_acquisition(self, row, acq):
+        ''' A stack that was completed before the list was interrupted '''
+        logger.info(f'Core: Skipping completed stack {acq["filename"]}')
+        self.image_count += acq.get_image_count()
+        paths = self.journal_progress.completed_rows[row]
+        if self.tile_registration is not None and paths:
+            self.tile_registration.add_stack(self.acquisition_count, acq, paths[0])
+        self.acquisition_count += 1
 
     def close_acquisition_list(self, acq_list):
         self.sig_status_message.emit('Closing Acquisition List')
 
+        if self.tile_registration is not None and self.stopflag is False:
+            self.write_registered_xml(acq_list)
+
+        if self.journal is not None:
+            if not self.stopflag:
+                self.journal.list_completed()
+            self.journal.close()
+            self.journal = None
+        self.journal_progress = None
+
         if not self.stopflag:
             current_rotation = self.state['position']['theta_pos']
             startpoint = acq_list.get_startpoint()
@@ -607,6 +1097,22 @@ class mesoSPIM_Core(QtCore.QObject):
             time.sleep(0.1) # tiny sleep period to allow Main Window indicators to catch up
             self.sig_finished.emit()
 
+    def write_registered_xml(self, acq_list):
+        '''
+        Waits for the tile registration and writes a BigDataViewer XML with the
+        refined tile translations into the folder of the first stack
+        '''
+        self.sig_status_message.emit('Registering tiles')
+        try:
+            translations = self.tile_registration.finish()
+            basepath = acq_list[0]['folder']+'/mesoSPIM_registration_'+time.strftime("%Y%m%d-%H%M%S")
+            xml_exporter = mesoSPIM_XMLexporter(self)
+            xml_exporter.generate_xml_from_acqlist(acq_list, basepath+'.xml', translations=translations)
+            self.tile_registration.save_pairs(basepath+'_pairs.json')
+            logger.info(f'Core: Registered tiles saved in {basepath}.xml')
+        except Exception:
+            logger.error('Core: Tile registration failed', exc_info=True)
+
     def preview_acquisition(self, z_update=True):
         self.stopflag = False
 
@@ -687,6 +1193,13 @@ class mesoSPIM_Core(QtCore.QObject):
         startpoint = acq.get_startpoint()
         target_rotation = startpoint['theta_abs']
         self.acq_start_time = time.time()
+
+        self.f_step_generator = acq.get_focus_stepsize_generator()
+        if self.start_plane:
+            ''' Continuing an interrupted stack: The focus steps of the planes before are skipped '''
+            logger.info(f'Core: Continuing {acq["filename"]} at plane {self.start_plane}')
+            startpoint['z_abs'] += self.start_plane * acq.get_delta_dict()['z_rel']
+            startpoint['f_abs'] += sum(next(self.f_step_generator) for plane in range(self.start_plane))
         self.acq_start_time_string = time.strftime("%Y%m%d-%H%M%S")
 
         ''' Check if sample has to be rotated, allow some tolerance '''
@@ -696,6 +1209,26 @@ class mesoSPIM_Core(QtCore.QObject):
 
         self.move_absolute(startpoint, wait_until_done=True)
 
+        self.set_acquisition_settings(acq)
+
+        ''' The timing traces are filled by the core and the cameras during the stack '''
+        self.timing_traces = [TimingTrace(acq.get_image_count()) for camera_worker in self.camera_workers]
+        self.timing_trace = self.timing_traces[0]
+        self.z_commanded = startpoint['z_abs']
+        self.f_commanded = startpoint['f_abs']
+
+        self.sig_status_message.emit('Preparing camera: Allocating memory')
+        self.sig_prepare_image_series.emit(acq)
+        self.prepare_image_series()
+
+        for camera_worker in self.camera_workers:
+            self.write_metadata(acq, camera_worker)
+
+        if self.journal is not None:
+            self.journal.stack_started(self.acquisition_count, self.start_plane, self.get_journal_state())
+
+    def set_acquisition_settings(self, acq):
+        '''Sets shutter, filter, zoom, intensity, laser and ETL parameters of a row'''
         self.sig_status_message.emit('Setting Filter & Shutter')
         self.set_shutterconfig(acq['shutterconfig'])
         self.set_filter(acq['filter'], wait_until_done=True)
@@ -711,17 +1244,6 @@ class mesoSPIM_Core(QtCore.QObject):
         self.sig_state_request.emit({'etl_l_offset' : acq['etl_l_offset']})
         self.sig_state_request.emit({'etl_r_offset' : acq['etl_r_offset']})
 
-        self.f_step_generator = acq.get_focus_stepsize_generator()
-
-        self.sig_status_message.emit('Preparing camera: Allocating memory')
-        self.sig_prepare_image_series.emit(acq)
-        self.prepare_image_series()
-
-        # ''' HICKUP DEBUGGING: Measure z position '''
-        # self.z_start_measured = self.state['position']['z_pos']
-
-        self.write_metadata(acq)
-
     def run_acquisition(self, acq):
         steps = acq.get_image_count()
         self.sig_status_message.emit('Running Acquisition')
@@ -730,13 +1252,21 @@ class mesoSPIM_Core(QtCore.QObject):
         self.image_acq_start_time = time.time()
         self.image_acq_start_time_string = time.strftime("%Y%m%d-%H%M%S")
 
-        for i in range(steps):
+        checkpoint_interval = self.journal_parameters['checkpoint_interval']
+
+        for i in range(self.start_plane, steps):
             if self.stopflag is True:
                 self.close_image_series()
                 self.sig_end_image_series.emit()
                 self.sig_finished.emit()
                 break
             else:
+                if self.journal is not None and i > self.start_plane and i % checkpoint_interval == 0:
+                    self.journal.checkpoint(self.acquisition_count, self.get_planes_on_disk(), self.get_journal_state())
+
+                trigger_time = time.time()
+                for timing_trace in self.timing_traces:
+                    timing_trace.record_trigger(i, trigger_time, self.z_commanded, self.f_commanded, self.state['position'])
                 self.snap_image_in_series()
                 self.sig_add_images_to_image_series.emit()
                 #time.sleep(0.02)
@@ -751,9 +1281,12 @@ class mesoSPIM_Core(QtCore.QObject):
                     move_dict.update({'f_rel':f_step})
 
                 self.move_relative(move_dict)
+                self.z_commanded += move_dict['z_rel']
+                self.f_commanded += f_step
 
                 QtWidgets.QApplication.processEvents(QtCore.QEventLoop.AllEvents, 1)
                 self.image_count += 1
+                self.run_image_count += 1
 
                 ''' Keep track of passed time and predict remaining time '''
                 time_passed = time.time() - self.start_time
@@ -767,12 +1300,13 @@ class mesoSPIM_Core(QtCore.QObject):
                     time_remaining = self.state['predicted_acq_list_time'] - time_passed
 
                 self.state['remaining_acq_list_time'] = time_remaining
-                framerate = self.image_count / time_passed
+                metrics.set('acquisition_images_done', self.image_count)
+                metrics.set('acquisition_remaining_seconds', max(time_remaining, 0))
 
                 ''' Every 100 images, update the predicted acquisition time '''
-                if self.image_count % 100 == 0:
-                    framerate = self.image_count / time_passed
-                    self.state['predicted_acq_list_time'] = self.total_image_count / framerate
+                if self.run_image_count % 100 == 0:
+                    framerate = self.run_image_count / time_passed
+                    self.state['predicted_acq_list_time'] = self.run_total_image_count / framerate
       
 
                 self.send_progress(self.acquisition_count,
@@ -790,34 +1324,105 @@ class mesoSPIM_Core(QtCore.QObject):
         self.close_shutters()
 
     def close_acquisition(self, acq):
-
-        # ''' HICKUP DEBUGGING '''
-        # self.z_end_measured = self.state['position']['z_pos']
-        # self.f_end_measured = self.state['position']['f_pos']
-        # self.collect_troubleshooting_data(acq)
-        # self.append_troubleshooting_info_to_metadata(acq)
-
         self.sig_status_message.emit('Closing Acquisition: Saving data & freeing up memory')
 
         if self.stopflag is False:
             # self.move_absolute(acq.get_startpoint(), wait_until_done=True)
             self.close_image_series()
             self.sig_end_image_series.emit()
+            if self.frame_loss_parameters['repair']:
+                self.repair_missing_planes(acq)
 
         self.acq_end_time = time.time()
         self.acq_end_time_string = time.strftime("%Y%m%d-%H%M%S")
 
-        self.append_timing_info_to_metadata(acq)
+        if len(self.camera_workers) > 1:
+            self.check_camera_synchronization()
+        for camera_worker in self.camera_workers:
+            self.save_timing_trace(acq, camera_worker)
+            self.append_timing_info_to_metadata(acq, camera_worker)
+
+        if self.journal is not None:
+            if self.stopflag is False:
+                self.journal.stack_completed(self.acquisition_count, self.get_planes_on_disk(),
+                                             [camera_worker.last_written_path for camera_worker in self.camera_workers])
+            else:
+                self.journal.checkpoint(self.acquisition_count, self.get_planes_on_disk(), self.get_journal_state())
+
+        if self.stopflag is False:
+            for camera_worker in self.camera_workers:
+                self.postprocessing.submit_stack(acq, camera_worker.last_written_path,
+                                                 (camera_worker.max_frame, camera_worker.x_pixels, camera_worker.y_pixels),
+                                                 camera_worker.filename, self.state['pixelsize'])
+
+        if self.tile_registration is not None and self.stopflag is False:
+            self.tile_registration.add_stack(self.acquisition_count, acq, self.camera_worker.last_written_path)
         self.acquisition_count += 1
 
+    def repair_missing_planes(self, acq):
+        '''Re-acquires the planes that are missing in the last stack
+
+        The stages move back to the commanded z and focus position of every plane
+        that is missing on any camera, the cameras replace the empty planes in
+        their files (see utils/frame_check.py).
+        '''
+        planes = sorted(set(plane for camera_worker in self.camera_workers
+                            for plane in camera_worker.frame_check.get_unrepaired_planes()))
+        if not planes:
+            return
+        if len(planes) > self.frame_loss_parameters['max_repair_planes']:
+            logger.warning(f'Core: {len(planes)} missing planes in {acq["filename"]}, too many to re-acquire')
+            self.send_error(f'{len(planes)} planes of {acq["filename"]} are missing and were not re-acquired!')
+            return
+
+        self.sig_status_message.emit(f'Re-acquiring {len(planes)} missing plane(s)')
+        logger.info(f'Core: Re-acquiring missing planes {planes} of {acq["filename"]}')
+        self.sig_prepare_live.emit()
+        self.open_shutters()
+        for plane in planes:
+            if self.stopflag:
+                break
+            row = self.timing_trace.data[plane]
+            self.move_absolute({'z_abs' : float(row['z_commanded']), 'f_abs' : float(row['f_commanded'])}, wait_until_done=True)
+            self.snap_image()
+            self.sig_add_repair_frame.emit(plane)
+        self.close_shutters()
+        self.sig_end_live.emit()
+        self.sig_end_repair.emit()
+        metrics.inc('repaired_planes_total', len(planes))
+
+    def check_camera_synchronization(self):
+        ''' Compares the frame numbers of all cameras plane by plane, see utils/multicamera.py '''
+        self.camera_synchronization = compare_frame_numbers(self.timing_traces)
+        mismatches = self.camera_synchronization['planes_with_mismatched_frame_numbers']
+        if mismatches:
+            metrics.inc('camera_frame_mismatches_total', mismatches)
+            logger.warning(f'Core: Camera frame numbers differ in {mismatches} planes: {self.camera_synchronization}')
+
     @QtCore.pyqtSlot(str)
     def execute_script(self, script):
+        '''Runs a script, see mesoSPIM_ScriptRunner.py
+
+        Scripts using the mesospim API run in the script thread. Old scripts
+        calling self.<method> of the core still run here, in the core thread.
+        '''
         self.sig_update_gui_from_state.emit(True)
         self.state['state']='running_script'
-        try:
-            exec(script)
-        except:
-            traceback.print_exc()
+        if is_legacy_script(script):
+            logger.warning('Core: Running a script with self.<method> in the core thread, consider the mesospim scripting API')
+            try:
+                exec(script)
+            except:
+                traceback.print_exc()
+            self.script_finished('')
+        else:
+            self.stopflag = False
+            self.script_runner.sig_run.emit(script)
+
+    @QtCore.pyqtSlot(str)
+    def script_finished(self, error):
+        if error:
+            self.sig_status_message.emit('Script: ' + error.strip().splitlines()[-1])
         self.sig_finished.emit()
         self.state['state']='idle'
         self.sig_update_gui_from_state.emit(False)
@@ -885,13 +1490,16 @@ class mesoSPIM_Core(QtCore.QObject):
         else:
             file.write('\n')
 
-    def write_metadata(self, acq):
+    def write_metadata(self, acq, camera_worker=None):
         '''
         Writes a metadata.txt file
 
-        Path contains the file to be written
+        Path contains the file to be written, with several cameras
+        every camera gets its own file (default: primary camera)
         '''
-        path = acq['folder']+'/'+acq['filename']
+        if camera_worker is None:
+            camera_worker = self.camera_worker
+        path = acq['folder']+'/'+camera_worker.get_filename(acq['filename'])
 
         metadata_path = os.path.dirname(path)+'/'+os.path.basename(path)+'_meta.txt'
 
@@ -940,97 +1548,102 @@ class mesoSPIM_Core(QtCore.QObject):
             self.write_line(file, 'galvo_r_offset', self.state['galvo_r_offset'])
             self.write_line(file)
             self.write_line(file, 'CAMERA PARAMETERS')
-            self.write_line(file, 'camera_type', self.cfg.camera)
+            self.write_line(file, 'camera_type', camera_worker.camera_type)
+            self.write_line(file, 'camera_name', camera_worker.camera_name)
             self.write_line(file, 'camera_exposure', self.state['camera_exposure_time'])
             self.write_line(file, 'camera_line_interval', self.state['camera_line_interval'])
-            self.write_line(file, 'x_pixels',self.cfg.camera_parameters['x_pixels'])
-            self.write_line(file, 'y_pixels',self.cfg.camera_parameters['y_pixels'])
+            self.write_line(file, 'x_pixels',camera_worker.camera_parameters['x_pixels'])
+            self.write_line(file, 'y_pixels',camera_worker.camera_parameters['y_pixels'])
+            ''' Size of the images in the file, after binning and ROI '''
+            self.write_line(file, 'image_rows', camera_worker.x_pixels)
+            self.write_line(file, 'image_columns', camera_worker.y_pixels)
+            self.write_line(file, 'flatfield_correction', camera_worker.get_flatfield_description())
+            self.write_line(file, 'camera_roi', camera_worker.get_roi_description())
+            if self.start_plane:
+                self.write_line(file)
+                self.write_line(file, 'RESUMED')
+                self.write_line(file, 'Continued at plane', self.start_plane)
 
     def execute_galil_program(self):
         '''Little helper method to execute the program loaded onto the Galil stage:
         allows hand controller to operate'''
         self.sig_state_request.emit({'stage_program' : 'execute'})
 
-    def write_snap_metadata(self, filename):
+    def get_snap_filename(self):
+        ''' <time>.tif, with a counter for further snaps within the same second '''
+        timestr = time.strftime("%Y%m%d-%H%M%S")
+        if timestr == self.last_snap_time:
+            self.snap_count += 1
+            return timestr + '_' + str(self.snap_count) + '.tif'
+        self.last_snap_time = timestr
+        self.snap_count = 0
+        return timestr + '.tif'
+
+    def get_snap_metadata(self):
+        '''Returns the metadata of a snap as sections of key-value pairs
+
+        The same dict is embedded into the TIFF file and written to the _meta.txt file.
+        Attention: change to true ETL values ASAP
+        '''
+        return {'CFG' : {'Laser' : self.state['laser'],
+                         'Intensity (%)' : self.state['intensity'],
+                         'Zoom' : self.state['zoom'],
+                         'Pixelsize in um' : self.state['pixelsize'],
+                         'Filter' : self.state['filter'],
+                         'Shutter' : self.state['shutterconfig']},
+                'POSITION' : {'x_pos' : self.state['position']['x_pos'],
+                              'y_pos' : self.state['position']['y_pos'],
+                              'z_pos' : self.state['position']['z_pos'],
+                              'f_pos' : self.state['position']['f_pos']},
+                'ETL PARAMETERS' : {'ETL CFG File' : self.state['ETL_cfg_file'],
+                                    'etl_l_offset' : self.state['etl_l_offset'],
+                                    'etl_l_amplitude' : self.state['etl_l_amplitude'],
+                                    'etl_r_offset' : self.state['etl_r_offset'],
+                                    'etl_r_amplitude' : self.state['etl_r_amplitude']},
+                'GALVO PARAMETERS' : {'galvo_l_frequency' : self.state['galvo_l_frequency'],
+                                      'galvo_l_amplitude' : self.state['galvo_l_amplitude'],
+                                      'galvo_l_offset' : self.state['galvo_l_offset'],
+                                      'galvo_r_amplitude' : self.state['galvo_r_amplitude'],
+                                      'galvo_r_offset' : self.state['galvo_r_offset']},
+                'CAMERA PARAMETERS' : {'camera_type' : self.cfg.camera,
+                                       'camera_exposure' : self.state['camera_exposure_time'],
+                                       'camera_line_interval' : self.state['camera_line_interval'],
+                                       'x_pixels' : self.cfg.camera_parameters['x_pixels'],
+                                       'y_pixels' : self.cfg.camera_parameters['y_pixels']}}
+
+    def write_snap_metadata(self, filename, metadata):
             path = self.state['snap_folder']+'/'+filename
 
             metadata_path = os.path.dirname(path)+'/'+os.path.basename(path)+'_meta.txt'
 
             with open(metadata_path,'w') as file:
-                self.write_line(file, 'CFG')
-                self.write_line(file, 'Laser', self.state['laser'])
-                self.write_line(file, 'Intensity (%)', self.state['intensity'])
-                self.write_line(file, 'Zoom', self.state['zoom'])
-                self.write_line(file, 'Pixelsize in um', self.state['pixelsize'])
-                self.write_line(file, 'Filter', self.state['filter'])
-                self.write_line(file, 'Shutter', self.state['shutterconfig'])
-                self.write_line(file)
-                self.write_line(file, 'POSITION')
-                self.write_line(file, 'x_pos', self.state['position']['x_pos'])
-                self.write_line(file, 'y_pos', self.state['position']['y_pos'])
-                self.write_line(file, 'z_pos', self.state['position']['z_pos'])
-                self.write_line(file, 'f_pos', self.state['position']['f_pos'])
-                self.write_line(file)
+                for number, (section, values) in enumerate(metadata.items()):
+                    if number > 0:
+                        self.write_line(file)
+                    self.write_line(file, section)
+                    for key, value in values.items():
+                        self.write_line(file, key, value)
+
+    def save_timing_trace(self, acq, camera_worker=None):
+        '''Saves the per-plane timing trace next to the raw file as <filename>_timing.npy'''
+        if camera_worker is None:
+            camera_worker = self.camera_worker
+        path = acq['folder']+'/'+camera_worker.get_filename(acq['filename'])
+        trace_path = os.path.dirname(path)+'/'+os.path.basename(path)+'_timing.npy'
+        try:
+            self.timing_traces[camera_worker.camera_index].save(trace_path)
+        except OSError:
+            logger.error(f'Core: Timing trace could not be saved to {trace_path}', exc_info=True)
 
-                ''' Attention: change to true ETL values ASAP '''
-                self.write_line(file,'ETL PARAMETERS')
-                self.write_line(file, 'ETL CFG File', self.state['ETL_cfg_file'])
-                self.write_line(file,'etl_l_offset', self.state['etl_l_offset'])
-                self.write_line(file,'etl_l_amplitude', self.state['etl_l_amplitude'])
-                self.write_line(file,'etl_r_offset', self.state['etl_r_offset'])
-                self.write_line(file,'etl_r_amplitude', self.state['etl_r_amplitude'])
-                self.write_line(file)
-                self.write_line(file, 'GALVO PARAMETERS')
-                self.write_line(file, 'galvo_l_frequency',self.state['galvo_l_frequency'])
-                self.write_line(file, 'galvo_l_amplitude',self.state['galvo_l_amplitude'])
-                self.write_line(file, 'galvo_l_offset', self.state['galvo_l_offset'])
-                self.write_line(file, 'galvo_r_amplitude', self.state['galvo_r_amplitude'])
-                self.write_line(file, 'galvo_r_offset', self.state['galvo_r_offset'])
-                self.write_line(file)
-                self.write_line(file, 'CAMERA PARAMETERS')
-                self.write_line(file, 'camera_type', self.cfg.camera)
-                self.write_line(file, 'camera_exposure', self.state['camera_exposure_time'])
-                self.write_line(file, 'camera_line_interval', self.state['camera_line_interval'])
-                self.write_line(file, 'x_pixels',self.cfg.camera_parameters['x_pixels'])
-                self.write_line(file, 'y_pixels',self.cfg.camera_parameters['y_pixels'])
-
-    # ''' HICKUP DEBUGGING '''
-
-    # def collect_troubleshooting_data(self, acq):
-    #     self.hickup_delta_z = self.z_end_measured - acq['z_end']
-    #     self.hickup_delta_f = self.f_end_measured - acq['f_end']
-    #     # print('HICKUP Difference: ', self.hickup_delta_z)
-
-    # def append_troubleshooting_info_to_metadata(self, acq):
-    #     '''
-    #     Appends a metadata.txt file
-
-    #     Path contains the file to be written
-    #     '''
-    #     path = acq['folder']+'/'+acq['filename']
-
-    #     metadata_path = os.path.dirname(path)+'/'+os.path.basename(path)+'_meta.txt'
-
-    #     with open(metadata_path,'a') as file:
-    #         ''' Adding troubleshooting information '''
-    #         self.write_line(file)
-    #         self.write_line(file, 'TROUBLESHOOTING INFORMATION')
-    #         self.write_line(file, 'Z_pos: delta_z end to start after acq', str(self.hickup_delta_z) )
-    #         self.write_line(file, 'z_start expected', acq['z_start'])
-    #         self.write_line(file, 'z_start measured', str(self.z_start_measured))
-    #         self.write_line(file, 'z_end expected', acq['z_end'])
-    #         self.write_line(file, 'z_end measured', str(self.z_end_measured))
-    #         self.write_line(file, 'F_pos: delta_f end to start after acq', str(self.hickup_delta_f) )
-    #         self.write_line(file, 'f_end expected', acq['f_end'])
-    #         self.write_line(file, 'f_end measured', str(self.f_end_measured))
-
-    def append_timing_info_to_metadata(self, acq):
+    def append_timing_info_to_metadata(self, acq, camera_worker=None):
         '''
         Appends a metadata.txt file
 
         Path contains the file to be written
         '''
-        path = acq['folder']+'/'+acq['filename']
+        if camera_worker is None:
+            camera_worker = self.camera_worker
+        path = acq['folder']+'/'+camera_worker.get_filename(acq['filename'])
 
         metadata_path = os.path.dirname(path)+'/'+os.path.basename(path)+'_meta.txt'
 
@@ -1042,12 +1655,37 @@ class mesoSPIM_Core(QtCore.QObject):
             self.write_line(file, 'Started taking images', self.image_acq_start_time_string )
             self.write_line(file, 'Stopped taking images', self.image_acq_end_time_string )
             self.write_line(file, 'Stopped stack', self.acq_end_time_string )
-            self.write_line(file, 'Frame rate:', str(acq.get_image_count()/(self.image_acq_end_time-self.image_acq_start_time)))
+            self.write_line(file, 'Frame rate:', str((acq.get_image_count()-self.start_plane)/(self.image_acq_end_time-self.image_acq_start_time)))
+            self.write_line(file)
+            self.write_line(file, 'TIMING TRACE')
+            self.write_line(file, 'Timing trace file', os.path.basename(path)+'_timing.npy')
+            for key, value in self.timing_traces[camera_worker.camera_index].get_summary().items():
+                self.write_line(file, key, value)
+            self.write_line(file)
+            self.write_line(file, 'RAW WRITER')
+            for key, value in camera_worker.raw_writer_statistics.items():
+                self.write_line(file, key, value)
+            if camera_worker.frame_check is not None:
+                self.write_line(file)
+                self.write_line(file, 'FRAME CHECK')
+                self.write_line(file, 'Frame check file', os.path.basename(get_frame_check_path(path)))
+                for key, value in camera_worker.frame_check.get_summary().items():
+                    self.write_line(file, key, value)
+            if len(self.camera_workers) > 1:
+                self.write_line(file)
+                self.write_line(file, 'CAMERA SYNCHRONIZATION')
+                for key, value in self.camera_synchronization.items():
+                    self.write_line(file, key, value)
 
     @QtCore.pyqtSlot(str)
     def send_status_message_to_gui(self, string):
         self.sig_status_message.emit(string)
 
+    def send_error(self, string):
+        ''' The GUI shows errors like warnings, the batch runner fails '''
+        self.sig_error.emit(string)
+        self.sig_warning.emit(string)
+
     def list_to_string_with_carriage_return(self, input_list):
         mystring = ''
         for i in input_list:
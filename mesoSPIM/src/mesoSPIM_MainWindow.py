@@ -20,6 +20,7 @@ from PyQt5.uic import loadUi
 from .mesoSPIM_CameraWindow import mesoSPIM_CameraWindow
 from .mesoSPIM_AcquisitionManagerWindow import mesoSPIM_AcquisitionManagerWindow
 from .mesoSPIM_ScriptWindow import mesoSPIM_ScriptWindow
+from .mesoSPIM_StackViewerWindow import mesoSPIM_StackViewerWindow
 
 from .mesoSPIM_State import mesoSPIM_StateSingleton
 from .mesoSPIM_Core import mesoSPIM_Core
@@ -46,6 +47,8 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
 
     sig_move_relative = QtCore.pyqtSignal(dict)
     # sig_move_relative_and_wait_until_done = QtCore.pyqtSignal(dict)
+    ''' Joystick moves, acknowledged by the serial worker, see jog_controller.py '''
+    sig_jog = QtCore.pyqtSignal(dict)
     sig_move_absolute = QtCore.pyqtSignal(dict)
     # sig_move_absolute_and_wait_until_done = QtCore.pyqtSignal(dict)
     sig_zero_axes = QtCore.pyqtSignal(list)
@@ -70,6 +73,7 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
 
         self.cfg = config
         self.script_window_counter = 0
+        self.stack_viewer_windows = []
         self.update_gui_from_state_flag = False
 
         ''' Instantiate the one and only mesoSPIM state '''
@@ -110,6 +114,10 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         ''' Get buttons & connections ready '''
         self.initialize_and_connect_widgets()
 
+        ''' Status of the post-processing queue, right side of the status bar '''
+        self.postprocessing_label = QtWidgets.QLabel('Post-processing: idle')
+        self.statusBar().addPermanentWidget(self.postprocessing_label)
+
         ''' Widget list for blockSignals during status updates '''
         self.widgets_to_block = []
         self.parent_widgets_to_block = [self.ETLTabWidget, self.ParameterTabWidget, self.ControlGroupBox]
@@ -121,8 +129,11 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         self.core.sig_update_gui_from_state.connect(self.enable_gui_updates_from_state)
         self.core.sig_status_message.connect(self.display_status_message)
         self.core.sig_progress.connect(self.update_progressbars)
+        self.core.sig_postprocessing_status.connect(self.display_postprocessing_status)
 
         self.core.sig_warning.connect(self.display_warning)
+        self.core.sig_set_acquisition_focus.connect(self.acquisition_manager_window.set_focus_of_row)
+        self.camera_window.sig_state_request.connect(self.sig_state_request.emit)
 
         ''' Connecting the camera frames (this is a deep connection and slightly
         risky) It will break immediately when there is an API change.'''
@@ -155,6 +166,9 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
 
         ''' Setting up the joystick '''
         self.joystick = mesoSPIM_JoystickHandler(self)
+        ''' Joystick moves go straight to the serial thread, so they are not delayed by the core '''
+        self.sig_jog.connect(self.core.serial_worker.jog)
+        self.core.serial_worker.sig_jog_done.connect(self.joystick.jog.move_done)
 
         self.enable_gui_updates_from_state(False)
 
@@ -170,6 +184,25 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         except:
             pass
 
+    def closeEvent(self, event):
+        ''' Post-processing jobs that are not finished are dropped when the core is deleted '''
+        status = self.core.postprocessing.get_status()
+        if status['queued'] or status['running']:
+            answer = QtWidgets.QMessageBox.question(self, 'mesoSPIM Warning',
+                f"{status['running']} post-processing jobs are running, {status['queued']} are queued.\n\n"
+                'Wait for them before closing? Otherwise the unfinished jobs are dropped.',
+                QtWidgets.QMessageBox.Yes | QtWidgets.QMessageBox.No | QtWidgets.QMessageBox.Cancel,
+                QtWidgets.QMessageBox.Yes)
+            if answer == QtWidgets.QMessageBox.Cancel:
+                event.ignore()
+                return
+            elif answer == QtWidgets.QMessageBox.Yes:
+                self.display_status_message('Waiting for the post-processing jobs')
+                QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+                self.core.postprocessing.shutdown(wait=True)
+                QtWidgets.QApplication.restoreOverrideCursor()
+        event.accept()
+
     def display_icons(self):
         pass
         ''' Disabled taskbar button progress display due to problems with Anaconda default
@@ -233,6 +266,19 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         else:
             self.statusBar().showMessage(string, time)
 
+    @QtCore.pyqtSlot(dict)
+    def display_postprocessing_status(self, status):
+        ''' Job counts of the post-processing queue, the last jobs as tooltip '''
+        if status['queued'] or status['running']:
+            text = f"Post-processing: {status['running']} running, {status['queued']} queued"
+        else:
+            text = 'Post-processing: idle'
+        text += f", {status['done']} done"
+        if status['failed']:
+            text += f", {status['failed']} failed"
+        self.postprocessing_label.setText(text)
+        self.postprocessing_label.setToolTip('\n'.join(status['history']))
+
     def pos2str(self, position):
         ''' Little helper method for converting positions to strings '''
 
@@ -293,9 +339,15 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         exec(windowstring+'.sig_execute_script.connect(self.execute_script)')
         self.script_window_counter += 1
 
+    def create_stack_viewer_window(self):
+        ''' Every click opens another viewer, e.g. to compare two stacks '''
+        self.stack_viewer_windows = [window for window in self.stack_viewer_windows if window.isVisible()]
+        self.stack_viewer_windows.append(mesoSPIM_StackViewerWindow(self))
+
     def initialize_and_connect_widgets(self):
         ''' Connecting the menu actions '''
         self.openScriptEditorButton.clicked.connect(self.create_script_window)
+        self.openStackViewerButton.clicked.connect(self.create_stack_viewer_window)
 
         ''' Connecting the movement & zero buttons '''
         self.xPlusButton.pressed.connect(lambda: self.sig_move_relative.emit({'x_rel': -self.xyzIncrementSpinbox.value()}))
@@ -326,6 +378,7 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         self.LiveButton.clicked.connect(self.run_live)
         self.SnapButton.clicked.connect(self.run_snap)
         self.RunSelectedAcquisitionButton.clicked.connect(self.run_selected_acquisition)
+        self.ResumeAcquisitionListButton.clicked.connect(self.resume_acquisition_list)
         self.RunAcquisitionListButton.clicked.connect(self.run_acquisition_list)
         self.StopButton.clicked.connect(lambda: self.sig_state_request.emit({'state':'idle'}))
         #self.StopButton.clicked.connect(lambda: print('Stopping'))
@@ -527,6 +580,21 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
             self.win_taskbar_button.progress().setVisible(True)
         '''
 
+    def resume_acquisition_list(self):
+        ''' File dialog for the journal of an interrupted acquisition list '''
+        folder = self.state['acq_list'][0]['folder'] if len(self.state['acq_list']) else ''
+        path , _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open Acquisition Journal', folder, 'Journal (mesoSPIM_journal_*.jsonl)')
+
+        if path:
+            logger.info(f'Main Window: Resuming acquisition list from {path}')
+            self.state['resume_journal'] = path
+            self.state['selected_row'] = -1
+            self.sig_state_request.emit({'state':'resume_acquisition_list'})
+            self.enable_mode_control_buttons(False)
+            self.enable_gui_updates_from_state(True)
+            self.enable_stop_button(True)
+            self.enable_gui(False)
+
     def run_lightsheet_alignment_mode(self):
         self.sig_state_request.emit({'state':'lightsheet_alignment_mode'})
         self.set_progressbars_to_busy()
@@ -564,6 +632,7 @@ class mesoSPIM_MainWindow(QtWidgets.QMainWindow):
         self.SnapButton.setEnabled(boolean)
         self.RunSelectedAcquisitionButton.setEnabled(boolean)
         self.RunAcquisitionListButton.setEnabled(boolean)
+        self.ResumeAcquisitionListButton.setEnabled(boolean)
         self.VisualModeButton.setEnabled(boolean)
         self.LightsheetSwitchingModeButton.setEnabled(boolean)
 
@@ -0,0 +1,245 @@
+'''
+mesoSPIM_ScriptRunner.py
+========================
+
+Runs scripts in their own thread with awaitable microscope commands
+
+A script gets the object ``mesospim`` (a mesoSPIM_ScriptAPI) and runs in an
+asyncio event loop of the script thread. Every command returns an awaitable,
+which is done when the device has finished:
+
+    await mesospim.move(z=1000)
+    await mesospim.set_laser('488 nm', intensity=20)
+    filename = await mesospim.snap()
+
+Commands that run in different threads can overlap, e.g. the stages move
+(serial thread) while the laser is switched (core thread):
+
+    await asyncio.gather(mesospim.move(x=5000, y=2000),
+                         mesospim.set_laser('561 nm'))
+
+The commands are executed in the thread that owns the device: Stage, filter and
+zoom commands in the serial thread, laser, waveform, snap and acquisition
+commands in the core thread. Commands for the same thread run one after the
+other in the order in which they were started. Between the commands, the core
+thread is free, so the GUI stays responsive during long scripts. Stopping
+(e.g. with the Stop button) cancels the script.
+'''
+
+import ast
+import asyncio
+import textwrap
+import traceback
+import concurrent.futures
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+from PyQt5 import QtCore
+
+from .utils.acquisitions import Acquisition, AcquisitionList
+
+def is_legacy_script(script):
+    ''' Scripts written for exec() in the core thread call self.<method> and never await '''
+    return 'self.' in script and 'await' not in script
+
+class mesoSPIM_CommandExecutor(QtCore.QObject):
+    '''Runs functions in the thread of this object and reports the results through futures
+
+    submit() can be called from any thread.
+    '''
+    sig_execute = QtCore.pyqtSignal(object, object, object, object)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.sig_execute.connect(self.execute)
+
+    def submit(self, function, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self.sig_execute.emit(function, args, kwargs, future)
+        return future
+
+    @QtCore.pyqtSlot(object, object, object, object)
+    def execute(self, function, args, kwargs, future):
+        ''' Commands of a cancelled script are skipped '''
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(function(*args, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
+class mesoSPIM_ScriptAPI(object):
+    '''The commands available to scripts as ``mesospim``
+
+    All commands are coroutines and have to be awaited.
+    '''
+    axes = ('x', 'y', 'z', 'f', 'theta')
+
+    def __init__(self, core, core_executor, serial_executor):
+        self._core = core
+        self._core_executor = core_executor
+        self._serial_executor = serial_executor
+
+    async def _run_in_core(self, function, *args, **kwargs):
+        return await asyncio.wrap_future(self._core_executor.submit(function, *args, **kwargs))
+
+    async def _run_in_serial(self, function, *args, **kwargs):
+        return await asyncio.wrap_future(self._serial_executor.submit(function, *args, **kwargs))
+
+    ''' Stages, filter wheel and zoom (serial thread) '''
+
+    async def move(self, relative=False, **axes):
+        '''Moves the stages and waits until they have arrived
+
+        Example: await mesospim.move(x=1000, z=-200, relative=True)
+        '''
+        unknown = set(axes) - set(self.axes)
+        if unknown:
+            raise ValueError(f'Unknown axes {sorted(unknown)}, use {self.axes}')
+        if relative:
+            await self._run_in_serial(self._core.serial_worker.move_relative,
+                                      {axis+'_rel' : value for axis, value in axes.items()}, wait_until_done=True)
+        else:
+            await self._run_in_serial(self._core.serial_worker.move_absolute,
+                                      {axis+'_abs' : value for axis, value in axes.items()}, wait_until_done=True)
+
+    async def set_filter(self, filter):
+        await self._run_in_serial(self._core.serial_worker.set_filter, filter, wait_until_done=True)
+
+    async def set_zoom(self, zoom, update_etl=True):
+        ''' Changes the zoom and (optionally) the ETL parameters of the laser/zoom combination '''
+        await self._run_in_serial(self._core.serial_worker.set_zoom, zoom, wait_until_done=True)
+        if update_etl:
+            await self._run_in_core(self._core.waveformer.state_request_handler, {'set_etls_according_to_zoom' : zoom})
+
+    ''' Lasers and waveforms (core thread) '''
+
+    def _set_laser(self, laser, intensity, update_etl):
+        self._core.laserenabler.enable(laser)
+        self._core.waveformer.state_request_handler({'laser' : laser})
+        if intensity is not None:
+            self._core.waveformer.state_request_handler({'intensity' : intensity})
+        if update_etl:
+            self._core.waveformer.state_request_handler({'set_etls_according_to_laser' : laser})
+
+    async def set_laser(self, laser, intensity=None, update_etl=True):
+        await self._run_in_core(self._set_laser, laser, intensity, update_etl)
+
+    async def set_intensity(self, intensity):
+        await self._run_in_core(self._core.waveformer.state_request_handler, {'intensity' : intensity})
+
+    async def set_parameters(self, **parameters):
+        '''Sets waveform parameters of the state, e.g. etl_l_offset=2.3, galvo_l_amplitude=0.5'''
+        await self._run_in_core(self._core.waveformer.state_request_handler, parameters)
+
+    async def set_shutterconfig(self, shutterconfig):
+        await self._run_in_core(self._core.set_shutterconfig, shutterconfig)
+
+    ''' Images (core thread) '''
+
+    async def snap(self):
+        ''' Snaps and saves an image into the snap folder, returns the filename '''
+        return await self._run_in_core(self._core.save_snap)
+
+    async def acquire(self, acquisitions=None):
+        '''Runs an acquisition list and returns when it has finished
+
+        Args:
+            acquisitions: Acquisition, AcquisitionList, list of rows of the
+                acquisition manager (int) or None for the whole list
+        '''
+        if acquisitions is None:
+            acq_list = self._core.state['acq_list']
+        elif isinstance(acquisitions, Acquisition):
+            acq_list = AcquisitionList([acquisitions])
+        elif isinstance(acquisitions, AcquisitionList):
+            acq_list = acquisitions
+        else:
+            acq_list = AcquisitionList([self._core.state['acq_list'][row] for row in acquisitions])
+        await self._run_in_core(self._core.start, acq_list=acq_list)
+
+    async def call(self, method, *args, **kwargs):
+        '''Calls another method of the core in the core thread
+
+        Example: await mesospim.call('autofocus_acquisition_list')
+        '''
+        return await self._run_in_core(getattr(self._core, method), *args, **kwargs)
+
+    ''' State '''
+
+    def get_state(self, key):
+        ''' Current value of a state parameter, e.g. mesospim.get_state('position') '''
+        return self._core.state[key]
+
+    @property
+    def position(self):
+        return dict(self._core.state['position'])
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+class mesoSPIM_ScriptRunner(QtCore.QObject):
+    '''Runs scripts in its own thread
+
+    Scripts can use await at the top level. sig_finished is emitted with an
+    error message ('' if the script ran through).
+    '''
+    sig_run = QtCore.pyqtSignal(str)
+    sig_finished = QtCore.pyqtSignal(str)
+
+    def __init__(self, core, core_executor, serial_executor):
+        super().__init__()
+        self.api = mesoSPIM_ScriptAPI(core, core_executor, serial_executor)
+        self.loop = None
+        self.task = None
+        self.sig_run.connect(self.run)
+
+    def compile_script(self, script):
+        ''' Returns a coroutine function that runs the script '''
+        namespace = {'mesospim' : self.api, 'asyncio' : asyncio, 'np' : np,
+                     'Acquisition' : Acquisition, 'AcquisitionList' : AcquisitionList}
+        if hasattr(ast, 'PyCF_ALLOW_TOP_LEVEL_AWAIT'):
+            code = compile(script, '<mesoSPIM script>', 'exec', flags=ast.PyCF_ALLOW_TOP_LEVEL_AWAIT)
+            async def main():
+                result = eval(code, namespace)
+                if asyncio.iscoroutine(result):
+                    await result
+        else:
+            ''' Python < 3.8: The script becomes the body of a coroutine '''
+            exec('async def __mesospim_script__():\n' + textwrap.indent(script, '    ') + '\n    pass', namespace)
+            main = namespace['__mesospim_script__']
+        return main
+
+    @QtCore.pyqtSlot(str)
+    def run(self, script):
+        error = ''
+        try:
+            main = self.compile_script(script)
+            self.loop = asyncio.new_event_loop()
+            self.task = self.loop.create_task(main())
+            self.loop.run_until_complete(self.task)
+        except asyncio.CancelledError:
+            error = 'Script stopped'
+            logger.info('Script Runner: Script stopped')
+        except Exception:
+            error = traceback.format_exc()
+            logger.error('Script Runner: Script failed', exc_info=True)
+        finally:
+            if self.loop is not None:
+                self.loop.close()
+            self.loop = None
+            self.task = None
+        self.sig_finished.emit(error)
+
+    def stop(self):
+        ''' Cancels the running script, can be called from any thread '''
+        loop, task = self.loop, self.task
+        if loop is not None and task is not None:
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                ''' The script has just finished '''
+                pass
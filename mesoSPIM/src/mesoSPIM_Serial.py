@@ -17,6 +17,7 @@ from PyQt5 import QtWidgets, QtCore, QtGui
 
 ''' Import mesoSPIM modules '''
 from .mesoSPIM_State import mesoSPIM_StateSingleton
+from .utils.metrics import metrics
 
 from .devices.filter_wheels.ludlcontrol import LudlFilterwheel
 from .devices.filter_wheels.mesoSPIM_FilterWheel import mesoSPIM_DemoFilterWheel
@@ -31,6 +32,7 @@ class mesoSPIM_Serial(QtCore.QObject):
     sig_state_request = QtCore.pyqtSignal(dict)
     
     sig_position = QtCore.pyqtSignal(dict)
+    sig_jog_done = QtCore.pyqtSignal()
 
     sig_zero_axes = QtCore.pyqtSignal(list)
     sig_unzero_axes = QtCore.pyqtSignal(list)
@@ -139,17 +141,29 @@ class mesoSPIM_Serial(QtCore.QObject):
         # logger.info('Thread ID during relative movement: '+str(int(QtCore.QThread.currentThreadId())))
 
         # logger.info('Thread ID during move rel: '+str(int(QtCore.QThread.currentThreadId())))
+        start_time = time.perf_counter()
         if wait_until_done:
             self.stage.move_relative(dict, wait_until_done=True)
         else:
             self.stage.move_relative(dict)
+        metrics.observe('stage_command_latency_seconds', time.perf_counter() - start_time)
+
+    @QtCore.pyqtSlot(dict)
+    def jog(self, dict):
+        ''' Relative move of the joystick, acknowledged so that the next one can be sent '''
+        try:
+            self.move_relative(dict)
+        finally:
+            self.sig_jog_done.emit()
 
     @QtCore.pyqtSlot(dict)
     def move_absolute(self, dict, wait_until_done=False):
+        start_time = time.perf_counter()
         if wait_until_done:
             self.stage.move_absolute(dict, wait_until_done=True)
         else:
             self.stage.move_absolute(dict)
+        metrics.observe('stage_command_latency_seconds', time.perf_counter() - start_time)
 
     @QtCore.pyqtSlot(dict)
     def report_position(self, dict):
@@ -0,0 +1,302 @@
+'''
+mesoSPIM_StackViewerWindow.py
+=============================
+
+Browses acquired .raw and .craw stacks in XY, XZ and YZ slices or maximum
+projections. The stack is read lazily, see utils/lazy_stack.py: The XZ/YZ
+views and projections are filled block by block by a loader thread, first at
+a coarse level and then at the finest level that fits into the cache. Blocks
+that are missing when the loader has finished are read again.
+'''
+
+import os
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+from PyQt5 import QtWidgets, QtCore, QtGui
+
+import pyqtgraph as pg
+
+from .utils.lazy_stack import LazyStack
+
+class mesoSPIM_StackLoader(QtCore.QObject):
+    ''' Reads the blocks of a LazyStack in its own thread '''
+    sig_block_loaded = QtCore.pyqtSignal(int, int)
+    sig_finished = QtCore.pyqtSignal()
+
+    def __init__(self):
+        super().__init__()
+        ''' Incremented by the window to abort a running load '''
+        self.generation = 0
+
+    @QtCore.pyqtSlot(object, object, int)
+    def load(self, stack, levels, generation):
+        for level in levels:
+            for block in range(stack.get_block_count(level)):
+                if generation != self.generation:
+                    return
+                if not stack.is_loaded(level, block):
+                    try:
+                        stack.read_block(level, block)
+                    except Exception:
+                        ''' The stack may have been closed meanwhile '''
+                        if generation == self.generation:
+                            logger.error(f'Stack Viewer: Block {block} of level {level} could not be read', exc_info=True)
+                        return
+                self.sig_block_loaded.emit(level, block)
+        self.sig_finished.emit()
+
+class mesoSPIM_StackViewerWindow(QtWidgets.QWidget):
+    sig_load = QtCore.pyqtSignal(object, object, int)
+
+    def __init__(self, parent=None):
+        super().__init__()
+        self.parent = parent
+        self.stack = None
+        self.target_level = 1
+
+        self.setWindowTitle('mesoSPIM Stack Viewer')
+        self.setGeometry(200, 200, 1200, 1000)
+
+        self.OpenButton = QtWidgets.QPushButton('Open Stack...')
+        self.OpenButton.clicked.connect(self.choose_stack)
+        self.LastStackButton = QtWidgets.QPushButton('Last Stack')
+        self.LastStackButton.clicked.connect(self.open_last_stack)
+        self.FileLabel = QtWidgets.QLabel('No stack loaded')
+
+        self.ModeComboBox = QtWidgets.QComboBox()
+        self.ModeComboBox.addItems(['Slices', 'Max projections'])
+        self.ModeComboBox.currentIndexChanged.connect(self.update_views)
+        self.LevelComboBox = QtWidgets.QComboBox()
+        self.LevelComboBox.activated.connect(self.set_target_level)
+
+        self.PlaneSlider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.RowSlider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.ColumnSlider = QtWidgets.QSlider(QtCore.Qt.Horizontal)
+        self.PlaneSlider.valueChanged.connect(self.update_xy)
+        self.RowSlider.valueChanged.connect(self.update_orthogonal_views)
+        self.ColumnSlider.valueChanged.connect(self.update_orthogonal_views)
+        self.StatusLabel = QtWidgets.QLabel('')
+
+        ''' XY top left, YZ to the right (shared rows), XZ below (shared columns) '''
+        self.graphics = pg.GraphicsLayoutWidget()
+        self.xy_view = self.graphics.addViewBox(row=0, col=0, lockAspect=True, invertY=True)
+        self.yz_view = self.graphics.addViewBox(row=0, col=1, lockAspect=True, invertY=True)
+        self.xz_view = self.graphics.addViewBox(row=1, col=0, lockAspect=True, invertY=True)
+        self.yz_view.setYLink(self.xy_view)
+        self.xz_view.setXLink(self.xy_view)
+
+        self.xy_image = pg.ImageItem()
+        self.xz_image = pg.ImageItem()
+        self.yz_image = pg.ImageItem()
+        self.xy_view.addItem(self.xy_image)
+        self.xz_view.addItem(self.xz_image)
+        self.yz_view.addItem(self.yz_image)
+
+        self.histogram = pg.HistogramLUTItem(image=self.xy_image)
+        self.histogram.sigLevelsChanged.connect(self.update_levels)
+        self.graphics.addItem(self.histogram, row=0, col=2, rowspan=2)
+
+        pen = pg.mkPen({'color': "r", 'width': 1})
+        self.xy_vline = pg.InfiniteLine(angle=90, movable=False, pen=pen)
+        self.xy_hline = pg.InfiniteLine(angle=0, movable=False, pen=pen)
+        self.xz_hline = pg.InfiniteLine(angle=0, movable=False, pen=pen)
+        self.yz_vline = pg.InfiniteLine(angle=90, movable=False, pen=pen)
+        self.xy_view.addItem(self.xy_vline, ignoreBounds=True)
+        self.xy_view.addItem(self.xy_hline, ignoreBounds=True)
+        self.xz_view.addItem(self.xz_hline, ignoreBounds=True)
+        self.yz_view.addItem(self.yz_vline, ignoreBounds=True)
+        self.graphics.scene().sigMouseClicked.connect(self.mouse_clicked)
+
+        self.layout = QtWidgets.QGridLayout()
+        self.layout.addWidget(self.OpenButton, 0, 0)
+        self.layout.addWidget(self.LastStackButton, 0, 1)
+        self.layout.addWidget(self.FileLabel, 0, 2, 1, 3)
+        self.layout.addWidget(QtWidgets.QLabel('View'), 1, 0)
+        self.layout.addWidget(self.ModeComboBox, 1, 1)
+        self.layout.addWidget(QtWidgets.QLabel('XZ/YZ downsampling'), 1, 2)
+        self.layout.addWidget(self.LevelComboBox, 1, 3)
+        self.layout.addWidget(self.StatusLabel, 1, 4)
+        self.layout.addWidget(self.graphics, 2, 0, 1, 5)
+        self.layout.addWidget(QtWidgets.QLabel('Plane'), 3, 0)
+        self.layout.addWidget(self.PlaneSlider, 3, 1, 1, 4)
+        self.layout.addWidget(QtWidgets.QLabel('Row'), 4, 0)
+        self.layout.addWidget(self.RowSlider, 4, 1, 1, 4)
+        self.layout.addWidget(QtWidgets.QLabel('Column'), 5, 0)
+        self.layout.addWidget(self.ColumnSlider, 5, 1, 1, 4)
+        self.setLayout(self.layout)
+
+        ''' Redraw the orthogonal views at most every 300 ms while blocks arrive '''
+        self.refresh_timer = QtCore.QTimer(self)
+        self.refresh_timer.setSingleShot(True)
+        self.refresh_timer.setInterval(300)
+        self.refresh_timer.timeout.connect(self.update_orthogonal_views)
+
+        self.loader = mesoSPIM_StackLoader()
+        self.loader_thread = QtCore.QThread()
+        self.loader.moveToThread(self.loader_thread)
+        self.loader_thread.start()
+        self.sig_load.connect(self.loader.load)
+        self.loader.sig_block_loaded.connect(self.block_loaded)
+        self.loader.sig_finished.connect(self.loading_finished)
+
+        self.show()
+
+    def choose_stack(self):
+        path, _ = QtWidgets.QFileDialog.getOpenFileName(self, 'Open stack', '', 'mesoSPIM stacks (*.raw *.craw)')
+        if path:
+            self.open_stack(path)
+
+    def open_last_stack(self):
+        path = None
+        if self.parent is not None:
+            path = self.parent.core.camera_worker.last_written_path
+        if path is None or not os.path.exists(path):
+            self.FileLabel.setText('No stack has been written yet')
+            return
+        self.open_stack(path)
+
+    def open_stack(self, path):
+        try:
+            stack = LazyStack(path)
+        except (OSError, ValueError) as error:
+            logger.error(f'Stack Viewer: {path} could not be opened', exc_info=True)
+            QtWidgets.QMessageBox.warning(self, 'mesoSPIM Stack Viewer', str(error))
+            return
+
+        self.close_stack()
+        self.stack = stack
+        planes, rows, columns = stack.shape
+        self.FileLabel.setText(f'{path}: {planes} x {rows} x {columns}, {stack.get_level_bytes(1)/1024**3:.1f} GB')
+        logger.info(f'Stack Viewer: Opened {path} ({planes} x {rows} x {columns})')
+
+        for slider, maximum in ((self.PlaneSlider, planes), (self.RowSlider, rows), (self.ColumnSlider, columns)):
+            slider.blockSignals(True)
+            slider.setMaximum(maximum - 1)
+            slider.setValue(maximum // 2)
+            slider.blockSignals(False)
+
+        self.target_level = stack.get_finest_level()
+        self.LevelComboBox.clear()
+        for level in stack.get_levels():
+            self.LevelComboBox.addItem(f'{level}x ({stack.get_level_bytes(level)/1024**2:.0f} MB)', level)
+        self.LevelComboBox.setCurrentIndex(stack.get_levels().index(self.target_level))
+
+        self.update_xy()
+        self.histogram.setLevels(*self.get_auto_levels(self.xy_image.image))
+        self.xy_view.autoRange()
+        self.start_loading()
+
+    def close_stack(self):
+        self.loader.generation += 1
+        if self.stack is not None:
+            self.stack.close()
+            self.stack = None
+
+    def start_loading(self):
+        ''' Loads the coarse levels first, then the target level '''
+        self.loader.generation += 1
+        if not self.stack.fits_in_cache(self.target_level):
+            level = self.stack.get_finest_level()
+            self.StatusLabel.setText(f'Level {self.target_level}x does not fit into the cache, loading {level}x')
+            self.target_level = level
+            self.LevelComboBox.blockSignals(True)
+            self.LevelComboBox.setCurrentIndex(self.stack.get_levels().index(level))
+            self.LevelComboBox.blockSignals(False)
+        levels = [level for level in reversed(self.stack.get_levels()) if level >= self.target_level]
+        self.sig_load.emit(self.stack, levels, self.loader.generation)
+
+    @QtCore.pyqtSlot()
+    def loading_finished(self):
+        ''' Blocks evicted while loading are read again '''
+        if self.stack is None:
+            return
+        self.update_orthogonal_views()
+        if not self.stack.is_level_loaded(self.target_level):
+            logger.info(f'Stack Viewer: Reading evicted blocks of level {self.target_level}x again')
+            self.start_loading()
+
+    def set_target_level(self, index):
+        if self.stack is not None:
+            self.target_level = self.LevelComboBox.itemData(index)
+            self.start_loading()
+
+    @QtCore.pyqtSlot(int, int)
+    def block_loaded(self, level, block):
+        if self.stack is None:
+            return
+        self.StatusLabel.setText(f'Level {level}x: {self.stack.get_loaded_block_count(level)}/{self.stack.get_block_count(level)} blocks')
+        if not self.refresh_timer.isActive():
+            self.refresh_timer.start()
+
+    def get_display_level(self):
+        ''' The finest level whose blocks are all in the cache, or the coarsest level while it loads '''
+        for level in self.stack.get_levels():
+            if level >= self.target_level and self.stack.is_level_loaded(level):
+                return level
+        return self.stack.get_levels()[-1]
+
+    def get_auto_levels(self, image):
+        low, high = np.percentile(image[::4, ::4], (1, 99.9))
+        return float(low), float(max(high, low + 1))
+
+    def update_views(self):
+        self.update_xy()
+        self.update_orthogonal_views()
+
+    def update_xy(self):
+        if self.stack is None:
+            return
+        if self.ModeComboBox.currentIndex() == 1:
+            self.update_orthogonal_views()
+            return
+        self.xy_image.setImage(self.stack.read_plane(self.PlaneSlider.value()), autoLevels=False)
+        self.xy_image.setTransform(QtGui.QTransform.fromScale(self.stack.pixelsize, self.stack.pixelsize))
+        self.update_crosshairs()
+
+    def update_orthogonal_views(self):
+        if self.stack is None:
+            return
+        level = self.get_display_level()
+        if self.ModeComboBox.currentIndex() == 1:
+            xy, xz, yz = self.stack.get_projections(level)
+            self.xy_image.setImage(xy, autoLevels=False)
+            self.xy_image.setTransform(QtGui.QTransform.fromScale(level * self.stack.pixelsize, level * self.stack.pixelsize))
+        else:
+            xz = self.stack.get_xz(self.RowSlider.value(), level)
+            yz = self.stack.get_yz(self.ColumnSlider.value(), level)
+        self.xz_image.setImage(xz, autoLevels=False)
+        self.yz_image.setImage(yz, autoLevels=False)
+        self.xz_image.setTransform(QtGui.QTransform.fromScale(level * self.stack.pixelsize, level * self.stack.z_step))
+        self.yz_image.setTransform(QtGui.QTransform.fromScale(level * self.stack.z_step, level * self.stack.pixelsize))
+        self.update_levels()
+        self.update_crosshairs()
+
+    def update_levels(self):
+        levels = self.histogram.getLevels()
+        self.xz_image.setLevels(levels)
+        self.yz_image.setLevels(levels)
+
+    def update_crosshairs(self):
+        pixelsize, z_step = self.stack.pixelsize, self.stack.z_step
+        self.xy_vline.setPos(self.ColumnSlider.value() * pixelsize)
+        self.xy_hline.setPos(self.RowSlider.value() * pixelsize)
+        self.xz_hline.setPos(self.PlaneSlider.value() * z_step)
+        self.yz_vline.setPos(self.PlaneSlider.value() * z_step)
+
+    def mouse_clicked(self, event):
+        ''' A click into the XY view selects the row and column of the XZ/YZ views '''
+        if self.stack is None or not self.xy_view.sceneBoundingRect().contains(event.scenePos()):
+            return
+        point = self.xy_view.mapSceneToView(event.scenePos())
+        self.ColumnSlider.setValue(int(point.x() / self.stack.pixelsize))
+        self.RowSlider.setValue(int(point.y() / self.stack.pixelsize))
+
+    def closeEvent(self, event):
+        self.close_stack()
+        self.loader_thread.quit()
+        self.loader_thread.wait()
+        super().closeEvent(event)
@@ -95,6 +95,8 @@ class mesoSPIM_StateSingleton():
                             'camera_display_acquisition_subsampling': 2,
                             'camera_binning':'1x1',
                             'camera_sensor_mode':'ASLM',
+                            'camera_roi' : None, # Fractions of the saved image, None is the full frame
+                            'resume_journal' : None, # Journal of an interrupted acquisition list to resume
                             'current_framerate':3.8,
                             'predicted_acq_list_time':1,
                             'remaining_acq_list_time':1,
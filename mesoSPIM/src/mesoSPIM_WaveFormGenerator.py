@@ -1,9 +1,7 @@
 '''
 mesoSPIM Waveform Generator - Creates and allows control of waveform generation.
 '''
-import os
 import numpy as np
-import csv
 import time
 
 import logging
@@ -18,9 +16,87 @@ from nidaqmx.types import CtrTime
 '''mesoSPIM imports'''
 from .mesoSPIM_State import mesoSPIM_StateSingleton
 from .utils.waveforms import single_pulse, tunable_lens_ramp, sawtooth, square
+from .utils.etl_parameters import ETLParameterTable, parameter_columns
+from .utils.camera_roi import get_roi_parameters_from_config, get_roi_timing, get_roi_etl_parameters
+from .utils.metrics import metrics
+
+from .utils.command_registry import CommandRegistry
 
 from PyQt5 import QtCore
 
+''' State parameters that only change the waveforms '''
+WAVEFORM_PARAMETERS = ('samplerate',
+                       'sweeptime',
+                       'etl_l_delay_%',
+                       'etl_l_ramp_rising_%',
+                       'etl_l_ramp_falling_%',
+                       'etl_l_amplitude',
+                       'etl_l_offset',
+                       'etl_r_delay_%',
+                       'etl_r_ramp_rising_%',
+                       'etl_r_ramp_falling_%',
+                       'etl_r_amplitude',
+                       'etl_r_offset',
+                       'galvo_l_frequency',
+                       'galvo_l_amplitude',
+                       'galvo_l_offset',
+                       'galvo_l_duty_cycle',
+                       'galvo_l_phase',
+                       'galvo_r_frequency',
+                       'galvo_r_amplitude',
+                       'galvo_r_offset',
+                       'galvo_r_duty_cycle',
+                       'galvo_r_phase',
+                       'laser_l_delay_%',
+                       'laser_l_pulse_%',
+                       'laser_l_max_amplitude',
+                       'laser_r_delay_%',
+                       'laser_r_pulse_%',
+                       'laser_r_max_amplitude',
+                       'camera_delay_%',
+                       'camera_pulse_%')
+
+def create_command_registry(waveformer):
+    '''State request handlers of a waveform generator (NI or Demo)
+
+    'zoom' and 'laser' update the ETL parameters like
+    'set_etls_according_to_zoom' and 'set_etls_according_to_laser'.
+    '''
+    state = waveformer.state
+
+    def set_parameter(key, value):
+        state[key] = value
+        waveformer.create_waveforms()
+
+    def set_roi(roi):
+        ''' The core has already updated the state '''
+        waveformer.create_waveforms()
+
+    def set_etl_cfg_file(cfg_file):
+        state['ETL_cfg_file'] = cfg_file
+        waveformer.update_etl_parameters_from_csv(cfg_file, state['laser'], state['zoom'])
+
+    def set_laser(laser):
+        state['laser'] = laser
+        waveformer.create_waveforms()
+        waveformer.update_etl_parameters_from_laser(laser)
+
+    def set_state(value):
+        ''' Log Thread ID during Live: just debugging code '''
+        if value == 'live':
+            logger.info('Thread ID during live: '+str(int(QtCore.QThread.currentThreadId())))
+
+    commands = CommandRegistry('Waveform Generator')
+    commands.register_keys(WAVEFORM_PARAMETERS + ('intensity',), set_parameter)
+    commands.register('camera_roi', set_roi)
+    commands.register('ETL_cfg_file', set_etl_cfg_file, str)
+    commands.register('zoom', waveformer.update_etl_parameters_from_zoom, str)
+    commands.register('set_etls_according_to_zoom', waveformer.update_etl_parameters_from_zoom, str)
+    commands.register('laser', set_laser, str)
+    commands.register('set_etls_according_to_laser', set_laser, str)
+    commands.register('state', set_state)
+    return commands
+
 class mesoSPIM_WaveFormGenerator(QtCore.QObject):
     '''This class contains the microscope state
 
@@ -39,6 +115,12 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         self.state = mesoSPIM_StateSingleton()
         self.parent.sig_save_etl_config.connect(self.save_etl_parameters_to_csv)
 
+        ''' Retiming of the waveforms for camera ROIs, see utils/camera_roi.py '''
+        self.roi_parameters = get_roi_parameters_from_config(self.cfg)
+
+        self.etl_parameters = ETLParameterTable(parent=self)
+        self.etl_parameters.sig_changed.connect(self.etl_parameter_file_changed)
+
         cfg_file = self.cfg.startup['ETL_cfg_file']
         self.state['ETL_cfg_file'] = cfg_file
         self.update_etl_parameters_from_csv(cfg_file, self.state['laser'], self.state['zoom'])
@@ -52,85 +134,41 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         self.state['galvo_l_offset'] = self.cfg.startup['galvo_l_offset']
         self.state['galvo_r_offset'] = self.cfg.startup['galvo_r_offset']
 
+        self.commands = create_command_registry(self)
+
     @QtCore.pyqtSlot(dict)
     def state_request_handler(self, dict):
-        for key, value in zip(dict.keys(),dict.values()):
-            # print('Waveform Generator: State request: Key: ', key, ' Value: ', value)
-            '''
-            The request handling is done
-            '''
-            if key in ('samplerate',
-                       'sweeptime',
-                       'intensity',
-                       'etl_l_delay_%',
-                       'etl_l_ramp_rising_%',
-                       'etl_l_ramp_falling_%',
-                       'etl_l_amplitude',
-                       'etl_l_offset',
-                       'etl_r_delay_%',
-                       'etl_r_ramp_rising_%',
-                       'etl_r_ramp_falling_%',
-                       'etl_r_amplitude',
-                       'etl_r_offset',
-                       'galvo_l_frequency',
-                       'galvo_l_amplitude',
-                       'galvo_l_offset',
-                       'galvo_l_duty_cycle',
-                       'galvo_l_phase',
-                       'galvo_r_frequency',
-                       'galvo_r_amplitude',
-                       'galvo_r_offset',
-                       'galvo_r_duty_cycle',
-                       'galvo_r_phase',
-                       'laser_l_delay_%',
-                       'laser_l_pulse_%',
-                       'laser_l_max_amplitude',
-                       'laser_r_delay_%',
-                       'laser_r_pulse_%',
-                       'laser_r_max_amplitude',
-                       'camera_delay_%',
-                       'camera_pulse_%'):
-                ''' Notify GUI about the change '''
-                #self.sig_update_gui_from_state.emit(True)
-                self.state[key] = value
-                #self.sig_update_gui_from_state.emit(False)
-                self.create_waveforms()
-                # print('Waveform change')
-            elif key in ('ETL_cfg_file'):
-                self.state[key] = value
-                self.update_etl_parameters_from_csv(value, self.state['laser'], self.state['zoom'])
-                # print('ETL CFG File changed')
-            elif key in ('set_etls_according_to_zoom'):
-                self.update_etl_parameters_from_zoom(value)
-                #print('zoom change')
-            elif key in ('set_etls_according_to_laser'):
-                self.state['laser'] = value
-                self.create_waveforms()
-                self.update_etl_parameters_from_laser(value)
-                #print('laser change')
-            elif key in ('laser'):
-                self.state['laser'] = value
-                self.create_waveforms()
-                
-            # Log Thread ID during Live: just debugging code
-            elif key == 'state':
-                if value == 'live':
-                    logger.info('Thread ID during live: '+str(int(QtCore.QThread.currentThreadId())))
+        self.commands.dispatch(dict)
+
+    def get_samplerate_and_sweeptime(self):
+        ''' The sweeptime is shortened if the camera reads out a ROI '''
+        samplerate, sweeptime, line_interval, roi = self.state.get_parameter_list(['samplerate', 'sweeptime',
+                                                                                   'camera_line_interval', 'camera_roi'])
+        sweeptime, _ = get_roi_timing(sweeptime, line_interval, roi, self.roi_parameters['min_sweeptime'])
+        return samplerate, sweeptime
+
+    def get_sweep_direction(self, rise, fall):
+        ''' The camera is read out during the falling ramp if it is the longer one (right ETL) '''
+        if rise >= fall:
+            return self.roi_parameters['sweep_direction']
+        return -self.roi_parameters['sweep_direction']
 
     def calculate_samples(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         self.samples = int(samplerate*sweeptime)
 
     def create_waveforms(self):
+        start_time = time.perf_counter()
         self.calculate_samples()
         self.create_etl_waveforms()
         self.create_galvo_waveforms()
         '''Bundle everything'''
         self.bundle_galvo_and_etl_waveforms()
         self.create_laser_waveforms()
+        metrics.observe('waveform_regeneration_seconds', time.perf_counter() - start_time)
 
     def create_etl_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         etl_l_delay, etl_l_ramp_rising, etl_l_ramp_falling, etl_l_amplitude, etl_l_offset =\
         self.state.get_parameter_list(['etl_l_delay_%','etl_l_ramp_rising_%','etl_l_ramp_falling_%',
         'etl_l_amplitude','etl_l_offset'])
@@ -138,6 +176,12 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         self.state.get_parameter_list(['etl_r_delay_%','etl_r_ramp_rising_%','etl_r_ramp_falling_%',
         'etl_r_amplitude','etl_r_offset'])
 
+        ''' With a camera ROI, the ramps only cover the lines that are read out '''
+        roi = self.state['camera_roi']
+        etl_l_amplitude, etl_l_offset = get_roi_etl_parameters(etl_l_amplitude, etl_l_offset, roi,
+                                                               self.get_sweep_direction(etl_l_ramp_rising, etl_l_ramp_falling))
+        etl_r_amplitude, etl_r_offset = get_roi_etl_parameters(etl_r_amplitude, etl_r_offset, roi,
+                                                               self.get_sweep_direction(etl_r_ramp_rising, etl_r_ramp_falling))
 
         self.etl_l_waveform = tunable_lens_ramp(samplerate = samplerate,
                                                 sweeptime = sweeptime,
@@ -156,7 +200,7 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                                                 offset = etl_r_offset)
 
     def create_galvo_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
 
         galvo_l_frequency, galvo_l_amplitude, galvo_l_offset, galvo_l_duty_cycle, galvo_l_phase =\
         self.state.get_parameter_list(['galvo_l_frequency', 'galvo_l_amplitude', 'galvo_l_offset',
@@ -186,7 +230,7 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
                                          phase = galvo_r_phase)
 
     def create_laser_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
 
         laser_l_delay, laser_l_pulse, max_laser_voltage, intensity = \
         self.state.get_parameter_list(['laser_l_delay_%','laser_l_pulse_%',
@@ -230,18 +274,16 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         ''' Little helper method: Because the mesoSPIM core is not handling
         the serial Zoom connection. '''
         laser = self.state['laser']
-        etl_cfg_file = self.state['ETL_cfg_file']
-        self.update_etl_parameters_from_csv(etl_cfg_file, laser, zoom)
+        self.update_etl_parameters_from_table(laser, zoom)
 
     def update_etl_parameters_from_laser(self, laser):
         ''' Little helper method: Because laser changes need an ETL parameter update '''
         zoom = self.state['zoom']
-        etl_cfg_file = self.state['ETL_cfg_file']
-        self.update_etl_parameters_from_csv(etl_cfg_file, laser, zoom)
+        self.update_etl_parameters_from_table(laser, zoom)
 
     def update_etl_parameters_from_csv(self, cfg_path, laser, zoom):
-        ''' Updates the internal ETL left/right offsets and amplitudes from the
-        values in the ETL csv files
+        ''' (Re)loads the ETL csv file into the ETL parameter table and
+        updates the internal ETL left/right offsets and amplitudes
 
         The .csv file needs to contain the follwing columns:
 
@@ -252,107 +294,42 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         ETL-Right-Offset
         ETL-Right-Amp
 
-
         '''
-        # print('Updating ETL parameters from file:', cfg_path)
-
-        self.sig_update_gui_from_state.emit(True)
-        with open(cfg_path) as file:
-            reader = csv.DictReader(file,delimiter=';')
-            #print('opened csv')
-            for row in reader:
-                if row['Wavelength'] == laser and row['Zoom'] == zoom:
-
-                    ''' Some diagnostic tracing statements
-
-                    # print(row)
-                    # print('updating parameters')
-                    # print(self.etl_l['amplitude'])
-
-                    '''
-
-                    ''' updating internal state '''
-                    etl_l_offset = float(row['ETL-Left-Offset'])
-                    etl_l_amplitude = float(row['ETL-Left-Amp'])
-                    etl_r_offset = float(row['ETL-Right-Offset'])
-                    etl_r_amplitude = float(row['ETL-Right-Amp'])
-
-                    parameter_dict = {'etl_l_offset': etl_l_offset,
-                                      'etl_l_amplitude' : etl_l_amplitude,
-                                      'etl_r_offset' : etl_r_offset,
-                                      'etl_r_amplitude' : etl_r_amplitude}
-
-                    '''  Now the GUI needs to be updated '''
-                    # print('Parameters set from csv')
-                    self.state.set_parameters(parameter_dict)
+        self.etl_parameters.load(cfg_path)
+        self.update_etl_parameters_from_table(laser, zoom)
+
+    def update_etl_parameters_from_table(self, laser, zoom):
+        ''' Updates the internal ETL left/right offsets and amplitudes from
+        the in-memory ETL parameter table (no disk access) '''
+        parameter_dict = self.etl_parameters.get_parameters(laser, zoom)
+        if parameter_dict is None:
+            logger.warning(f'No ETL parameters for {laser} / {zoom} in {self.etl_parameters.path}')
+        else:
+            '''  Now the GUI needs to be updated '''
+            self.sig_update_gui_from_state.emit(True)
+            self.state.set_parameters(parameter_dict)
+            self.sig_update_gui_from_state.emit(False)
 
         '''Update waveforms with the new parameters'''
-
         self.create_waveforms()
-        self.sig_update_gui_from_state.emit(False)
 
     @QtCore.pyqtSlot()
-    def save_etl_parameters_to_csv(self):
-        ''' Saves the current ETL left/right offsets and amplitudes from the
-        values to the ETL csv files
+    def etl_parameter_file_changed(self):
+        ''' The ETL csv file was changed by another program, running acquisitions keep their parameters '''
+        if self.state['state'] != 'run_acquisition_list':
+            self.update_etl_parameters_from_table(self.state['laser'], self.state['zoom'])
 
-        The .csv file needs to contain the following columns:
-
-        Wavelength
-        Zoom
-        ETL-Left-Offset
-        ETL-Left-Amp
-        ETL-Right-Offset
-        ETL-Right-Amp
-
-        Creates a temporary cfg file with the ending _tmp
+    @QtCore.pyqtSlot()
+    def save_etl_parameters_to_csv(self):
+        ''' Saves the current ETL left/right offsets and amplitudes to the
+        ETL parameter table
 
+        The row is appended to the ETL csv file, the file is compacted from
+        time to time (see utils/etl_parameters.py).
         '''
-
-        etl_cfg_file, laser, zoom, etl_l_offset, etl_l_amplitude, etl_r_offset, etl_r_amplitude = \
-        self.state.get_parameter_list(['ETL_cfg_file', 'laser', 'zoom',
-        'etl_l_offset', 'etl_l_amplitude', 'etl_r_offset','etl_r_amplitude'])
-
-        '''Temporary filepath'''
-        tmp_etl_cfg_file = etl_cfg_file+'_tmp'
-
-        # print('saving current ETL parameters')
-
-        with open(etl_cfg_file,'r') as input_file, open(tmp_etl_cfg_file,'w') as outputfile:
-            reader = csv.DictReader(input_file,delimiter=';')
-            #print('created reader')
-            fieldnames = ['Objective',
-                          'Wavelength',
-                          'Zoom',
-                          'ETL-Left-Offset',
-                          'ETL-Left-Amp',
-                          'ETL-Right-Offset',
-                          'ETL-Right-Amp']
-
-            writer = csv.DictWriter(outputfile,fieldnames=fieldnames,dialect='excel',delimiter=';')
-            #print('created writer')
-
-            writer.writeheader()
-
-            for row in reader:
-                if row['Wavelength'] == laser and row['Zoom'] == zoom:
-
-                        writer.writerow({'Objective' : '1x',
-                                         'Wavelength' : laser,
-                                         'Zoom' : zoom,
-                                         'ETL-Left-Offset' : etl_l_offset,
-                                         'ETL-Left-Amp' : etl_l_amplitude,
-                                         'ETL-Right-Offset' : etl_r_offset,
-                                         'ETL-Right-Amp' : etl_r_amplitude,
-                                         })
-
-                else:
-                        writer.writerow(row)
-
-            writer.writerows(reader)
-
-        os.remove(etl_cfg_file)
-        os.rename(tmp_etl_cfg_file, etl_cfg_file)
+        laser, zoom = self.state.get_parameter_list(['laser', 'zoom'])
+        values = dict(zip(parameter_columns, self.state.get_parameter_list(list(parameter_columns))))
+        self.etl_parameters.set_parameters(laser, zoom, values)
 
     def create_tasks(self):
         '''Creates a total of four tasks for the mesoSPIM:
@@ -368,7 +345,7 @@ class mesoSPIM_WaveFormGenerator(QtCore.QObject):
         ah = self.cfg.acquisition_hardware
 
         self.calculate_samples()
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         samples = self.samples
         camera_pulse_percent, camera_delay_percent = self.state.get_parameter_list(['camera_pulse_%','camera_delay_%'])
 
@@ -476,6 +453,12 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         self.state = mesoSPIM_StateSingleton()
         self.parent.sig_save_etl_config.connect(self.save_etl_parameters_to_csv)
 
+        ''' Retiming of the waveforms for camera ROIs, see utils/camera_roi.py '''
+        self.roi_parameters = get_roi_parameters_from_config(self.cfg)
+
+        self.etl_parameters = ETLParameterTable(parent=self)
+        self.etl_parameters.sig_changed.connect(self.etl_parameter_file_changed)
+
         cfg_file = self.cfg.startup['ETL_cfg_file']
         self.state['ETL_cfg_file'] = cfg_file
         self.update_etl_parameters_from_csv(cfg_file, self.state['laser'], self.state['zoom'])
@@ -489,82 +472,41 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         self.state['galvo_l_offset'] = self.cfg.startup['galvo_l_offset']
         self.state['galvo_r_offset'] = self.cfg.startup['galvo_r_offset']
 
+        self.commands = create_command_registry(self)
+
     @QtCore.pyqtSlot(dict)
     def state_request_handler(self, dict):
-        for key, value in zip(dict.keys(),dict.values()):
-            # print('Waveform Generator: State request: Key: ', key, ' Value: ', value)
-            '''
-            The request handling is done
-            '''
-            if key in ('samplerate',
-                       'sweeptime',
-                       'intensity',
-                       'etl_l_delay_%',
-                       'etl_l_ramp_rising_%',
-                       'etl_l_ramp_falling_%',
-                       'etl_l_amplitude',
-                       'etl_l_offset',
-                       'etl_r_delay_%',
-                       'etl_r_ramp_rising_%',
-                       'etl_r_ramp_falling_%',
-                       'etl_r_amplitude',
-                       'etl_r_offset',
-                       'galvo_l_frequency',
-                       'galvo_l_amplitude',
-                       'galvo_l_offset',
-                       'galvo_l_duty_cycle',
-                       'galvo_l_phase',
-                       'galvo_r_frequency',
-                       'galvo_r_amplitude',
-                       'galvo_r_offset',
-                       'galvo_r_duty_cycle',
-                       'galvo_r_phase',
-                       'laser_l_delay_%',
-                       'laser_l_pulse_%',
-                       'laser_l_max_amplitude',
-                       'laser_r_delay_%',
-                       'laser_r_pulse_%',
-                       'laser_r_max_amplitude',
-                       'camera_delay_%',
-                       'camera_pulse_%'):
-                ''' Notify GUI about the change '''
-                #self.sig_update_gui_from_state.emit(True)
-                self.state[key] = value
-                #self.sig_update_gui_from_state.emit(False)
-                self.create_waveforms()
-                # print('Waveform change')
-            elif key in ('ETL_cfg_file'):
-                self.state[key] = value
-                self.update_etl_parameters_from_csv(value, self.state['laser'], self.state['zoom'])
-                # print('ETL CFG File changed')
-            elif key in ('zoom'):
-                self.update_etl_parameters_from_zoom(value)
-                #print('zoom change')
-            elif key in ('laser'):
-                self.state[key] = value
-                self.create_waveforms()
-                self.update_etl_parameters_from_laser(value)
-                #print('laser change')
-
-            # Log Thread ID during Live: just debugging code
-            elif key == 'state':
-                if value == 'live':
-                    logger.info('Thread ID during live: '+str(int(QtCore.QThread.currentThreadId())))
+        self.commands.dispatch(dict)
+
+    def get_samplerate_and_sweeptime(self):
+        ''' The sweeptime is shortened if the camera reads out a ROI '''
+        samplerate, sweeptime, line_interval, roi = self.state.get_parameter_list(['samplerate', 'sweeptime',
+                                                                                   'camera_line_interval', 'camera_roi'])
+        sweeptime, _ = get_roi_timing(sweeptime, line_interval, roi, self.roi_parameters['min_sweeptime'])
+        return samplerate, sweeptime
+
+    def get_sweep_direction(self, rise, fall):
+        ''' The camera is read out during the falling ramp if it is the longer one (right ETL) '''
+        if rise >= fall:
+            return self.roi_parameters['sweep_direction']
+        return -self.roi_parameters['sweep_direction']
 
     def calculate_samples(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         self.samples = int(samplerate*sweeptime)
 
     def create_waveforms(self):
+        start_time = time.perf_counter()
         self.calculate_samples()
         self.create_etl_waveforms()
         self.create_galvo_waveforms()
         '''Bundle everything'''
         self.bundle_galvo_and_etl_waveforms()
         self.create_laser_waveforms()
+        metrics.observe('waveform_regeneration_seconds', time.perf_counter() - start_time)
 
     def create_etl_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         etl_l_delay, etl_l_ramp_rising, etl_l_ramp_falling, etl_l_amplitude, etl_l_offset =\
         self.state.get_parameter_list(['etl_l_delay_%','etl_l_ramp_rising_%','etl_l_ramp_falling_%',
         'etl_l_amplitude','etl_l_offset'])
@@ -572,6 +514,12 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         self.state.get_parameter_list(['etl_r_delay_%','etl_r_ramp_rising_%','etl_r_ramp_falling_%',
         'etl_r_amplitude','etl_r_offset'])
 
+        ''' With a camera ROI, the ramps only cover the lines that are read out '''
+        roi = self.state['camera_roi']
+        etl_l_amplitude, etl_l_offset = get_roi_etl_parameters(etl_l_amplitude, etl_l_offset, roi,
+                                                               self.get_sweep_direction(etl_l_ramp_rising, etl_l_ramp_falling))
+        etl_r_amplitude, etl_r_offset = get_roi_etl_parameters(etl_r_amplitude, etl_r_offset, roi,
+                                                               self.get_sweep_direction(etl_r_ramp_rising, etl_r_ramp_falling))
 
         self.etl_l_waveform = tunable_lens_ramp(samplerate = samplerate,
                                                 sweeptime = sweeptime,
@@ -590,7 +538,7 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
                                                 offset = etl_r_offset)
 
     def create_galvo_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
 
         galvo_l_frequency, galvo_l_amplitude, galvo_l_offset, galvo_l_duty_cycle, galvo_l_phase =\
         self.state.get_parameter_list(['galvo_l_frequency', 'galvo_l_amplitude', 'galvo_l_offset',
@@ -620,7 +568,7 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
                                          phase = galvo_r_phase)
 
     def create_laser_waveforms(self):
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
 
         laser_l_delay, laser_l_pulse, max_laser_voltage, intensity = \
         self.state.get_parameter_list(['laser_l_delay_%','laser_l_pulse_%',
@@ -664,18 +612,16 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         ''' Little helper method: Because the mesoSPIM core is not handling
         the serial Zoom connection. '''
         laser = self.state['laser']
-        etl_cfg_file = self.state['ETL_cfg_file']
-        self.update_etl_parameters_from_csv(etl_cfg_file, laser, zoom)
+        self.update_etl_parameters_from_table(laser, zoom)
 
     def update_etl_parameters_from_laser(self, laser):
         ''' Little helper method: Because laser changes need an ETL parameter update '''
         zoom = self.state['zoom']
-        etl_cfg_file = self.state['ETL_cfg_file']
-        self.update_etl_parameters_from_csv(etl_cfg_file, laser, zoom)
+        self.update_etl_parameters_from_table(laser, zoom)
 
     def update_etl_parameters_from_csv(self, cfg_path, laser, zoom):
-        ''' Updates the internal ETL left/right offsets and amplitudes from the
-        values in the ETL csv files
+        ''' (Re)loads the ETL csv file into the ETL parameter table and
+        updates the internal ETL left/right offsets and amplitudes
 
         The .csv file needs to contain the follwing columns:
 
@@ -686,111 +632,47 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         ETL-Right-Offset
         ETL-Right-Amp
 
-
         '''
-        # print('Updating ETL parameters from file:', cfg_path)
-
-        with open(cfg_path) as file:
-            reader = csv.DictReader(file,delimiter=';')
-            #print('opened csv')
-            for row in reader:
-                if row['Wavelength'] == laser and row['Zoom'] == zoom:
-
-                    ''' Some diagnostic tracing statements
-
-                    # print(row)
-                    # print('updating parameters')
-                    # print(self.etl_l['amplitude'])
-
-                    '''
-
-                    ''' updating internal state '''
-                    etl_l_offset = float(row['ETL-Left-Offset'])
-                    etl_l_amplitude = float(row['ETL-Left-Amp'])
-                    etl_r_offset = float(row['ETL-Right-Offset'])
-                    etl_r_amplitude = float(row['ETL-Right-Amp'])
-
-                    parameter_dict = {'etl_l_offset': etl_l_offset,
-                                      'etl_l_amplitude' : etl_l_amplitude,
-                                      'etl_r_offset' : etl_r_offset,
-                                      'etl_r_amplitude' : etl_r_amplitude}
-
-                    '''  Now the GUI needs to be updated '''
-                    self.sig_update_gui_from_state.emit(True)
-                    self.state.set_parameters(parameter_dict)
-                    self.sig_update_gui_from_state.emit(False)
+        self.etl_parameters.load(cfg_path)
+        self.update_etl_parameters_from_table(laser, zoom)
+
+    def update_etl_parameters_from_table(self, laser, zoom):
+        ''' Updates the internal ETL left/right offsets and amplitudes from
+        the in-memory ETL parameter table (no disk access) '''
+        parameter_dict = self.etl_parameters.get_parameters(laser, zoom)
+        if parameter_dict is None:
+            logger.warning(f'No ETL parameters for {laser} / {zoom} in {self.etl_parameters.path}')
+        else:
+            '''  Now the GUI needs to be updated '''
+            self.sig_update_gui_from_state.emit(True)
+            self.state.set_parameters(parameter_dict)
+            self.sig_update_gui_from_state.emit(False)
 
         '''Update waveforms with the new parameters'''
-
         self.create_waveforms()
 
     @QtCore.pyqtSlot()
-    def save_etl_parameters_to_csv(self):
-        ''' Saves the current ETL left/right offsets and amplitudes from the
-        values to the ETL csv files
-
-        The .csv file needs to contain the following columns:
+    def etl_parameter_file_changed(self):
+        ''' The ETL csv file was changed by another program, running acquisitions keep their parameters '''
+        if self.state['state'] != 'run_acquisition_list':
+            self.update_etl_parameters_from_table(self.state['laser'], self.state['zoom'])
 
-        Wavelength
-        Zoom
-        ETL-Left-Offset
-        ETL-Left-Amp
-        ETL-Right-Offset
-        ETL-Right-Amp
-
-        Creates a temporary cfg file with the ending _tmp
+    @QtCore.pyqtSlot()
+    def save_etl_parameters_to_csv(self):
+        ''' Saves the current ETL left/right offsets and amplitudes to the
+        ETL parameter table
 
+        The row is appended to the ETL csv file, the file is compacted from
+        time to time (see utils/etl_parameters.py).
         '''
-
-        etl_cfg_file, laser, zoom, etl_l_offset, etl_l_amplitude, etl_r_offset, etl_r_amplitude = \
-        self.state.get_parameter_list(['ETL_cfg_file', 'laser', 'zoom',
-        'etl_l_offset', 'etl_l_amplitude', 'etl_r_offset','etl_r_amplitude'])
-
-        '''Temporary filepath'''
-        tmp_etl_cfg_file = etl_cfg_file+'_tmp'
-
-        # print('saving current ETL parameters')
-
-        with open(etl_cfg_file,'r') as input_file, open(tmp_etl_cfg_file,'w') as outputfile:
-            reader = csv.DictReader(input_file,delimiter=';')
-            #print('created reader')
-            fieldnames = ['Objective',
-                          'Wavelength',
-                          'Zoom',
-                          'ETL-Left-Offset',
-                          'ETL-Left-Amp',
-                          'ETL-Right-Offset',
-                          'ETL-Right-Amp']
-
-            writer = csv.DictWriter(outputfile,fieldnames=fieldnames,dialect='excel',delimiter=';')
-            #print('created writer')
-
-            writer.writeheader()
-
-            for row in reader:
-                if row['Wavelength'] == laser and row['Zoom'] == zoom:
-
-                        writer.writerow({'Objective' : '1x',
-                                         'Wavelength' : laser,
-                                         'Zoom' : zoom,
-                                         'ETL-Left-Offset' : etl_l_offset,
-                                         'ETL-Left-Amp' : etl_l_amplitude,
-                                         'ETL-Right-Offset' : etl_r_offset,
-                                         'ETL-Right-Amp' : etl_r_amplitude,
-                                         })
-
-                else:
-                        writer.writerow(row)
-
-            writer.writerows(reader)
-
-        os.remove(etl_cfg_file)
-        os.rename(tmp_etl_cfg_file, etl_cfg_file)
+        laser, zoom = self.state.get_parameter_list(['laser', 'zoom'])
+        values = dict(zip(parameter_columns, self.state.get_parameter_list(list(parameter_columns))))
+        self.etl_parameters.set_parameters(laser, zoom, values)
 
     def create_tasks(self):
 
         self.calculate_samples()
-        samplerate, sweeptime = self.state.get_parameter_list(['samplerate','sweeptime'])
+        samplerate, sweeptime = self.get_samplerate_and_sweeptime()
         samples = self.samples
         camera_pulse_percent, camera_delay_percent = self.state.get_parameter_list(['camera_pulse_%','camera_delay_%'])
 
@@ -818,7 +700,7 @@ class mesoSPIM_DemoWaveFormGenerator(QtCore.QObject):
         For this to work, all analog output and counter tasks have to be started so
         that they are waiting for the trigger signal.
         '''
-        time.sleep(self.state['sweeptime'])
+        time.sleep(self.get_samplerate_and_sweeptime()[1])
 
     def stop_tasks(self):
         pass
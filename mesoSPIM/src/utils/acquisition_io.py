@@ -0,0 +1,195 @@
+'''
+acquisition_io.py
+========================================
+
+Versioned file format for acquisition lists
+
+Acquisition lists are stored as JSON lines: The first line is a header with
+the format name, the format version and the column names, every following
+line is one row as a JSON array in column order:
+
+    {"format": "mesoSPIM-acquisition-list", "version": 1, "columns": ["x_pos", "y_pos", ...]}
+    [0, 0, 0, 100, 10, 10, 0, 0, 0, "488 nm", 20, "Empty-Alignment", "1x", "Left", "/data", "tile_0.raw", 0, 0, 0, 0, ""]
+    ...
+
+This way, files can be read row by row (or only a range of rows), new rows
+can be appended without rewriting the file and external tools can generate
+acquisition plans without Python or pickle. Columns missing in a file get the
+default value of an Acquisition, unknown columns are ignored.
+
+Legacy tables saved with pickle are still loaded by load_acquisition_list and
+can be converted from the command line:
+
+    python -m src.utils.acquisition_io old_table.p new_table.jsonl
+'''
+
+import os
+import json
+import pickle
+import itertools
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .acquisitions import Acquisition, AcquisitionList
+
+file_format = 'mesoSPIM-acquisition-list'
+file_format_version = 1
+file_extension = '.jsonl'
+
+''' Keys of an Acquisition that are stored under a different constructor argument '''
+_constructor_arguments = {'rot' : 'theta_pos'}
+
+def _json_default(value):
+    ''' Numpy scalars from the GUI are converted to Python numbers '''
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def _dump_line(values):
+    return json.dumps(values, default=_json_default, ensure_ascii=False) + '\n'
+
+def get_header(columns=None):
+    if columns is None:
+        columns = Acquisition().get_keylist()
+    return {'format' : file_format, 'version' : file_format_version, 'columns' : list(columns)}
+
+def read_header(file):
+    '''Reads and checks the header line of an open file'''
+    line = file.readline()
+    try:
+        header = json.loads(line)
+    except ValueError:
+        raise ValueError(f'{file.name} is not a mesoSPIM acquisition list (invalid header)')
+
+    if not isinstance(header, dict) or header.get('format') != file_format:
+        raise ValueError(f'{file.name} is not a mesoSPIM acquisition list')
+    if header.get('version', 0) > file_format_version:
+        raise ValueError(f'{file.name} uses acquisition list format version {header["version"]}, '
+                         f'this software supports up to version {file_format_version}')
+    return header
+
+def is_acquisition_list_file(path):
+    ''' True if the file starts with a valid header, False for pickles etc. '''
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            read_header(file)
+        return True
+    except (ValueError, UnicodeDecodeError):
+        return False
+
+def _row_converter(columns):
+    '''Returns a function creating an Acquisition from a row in the given column order'''
+    known_keys = set(Acquisition().get_keylist())
+    unknown = [column for column in columns if column not in known_keys]
+    if unknown:
+        logger.warning(f'Ignoring unknown acquisition list columns: {unknown}')
+
+    arguments = [(index, _constructor_arguments.get(column, column))
+                 for index, column in enumerate(columns) if column in known_keys]
+
+    def convert(values):
+        return Acquisition(**{argument : values[index] for index, argument in arguments})
+    return convert
+
+def iter_rows(path, start=0, stop=None):
+    '''Yields the rows of a file as dicts without creating Acquisition objects
+
+    Args:
+        start (int): First row to read
+        stop (int): Row to stop at (exclusive), None reads until the end
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        columns = read_header(file)['columns']
+        for line in itertools.islice(file, start, stop):
+            if line.strip():
+                yield dict(zip(columns, json.loads(line)))
+
+def iter_acquisitions(path, start=0, stop=None):
+    '''Yields Acquisition objects one by one (streaming load)
+
+    Args:
+        start (int): First row to read
+        stop (int): Row to stop at (exclusive), None reads until the end
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        convert = _row_converter(read_header(file)['columns'])
+        for line in itertools.islice(file, start, stop):
+            if line.strip():
+                yield convert(json.loads(line))
+
+def load_acquisition_list(path, start=0, stop=None):
+    '''Loads an acquisition list (or the row range start:stop of it)
+
+    Falls back to pickle for tables saved by previous versions of the software.
+    '''
+    if is_acquisition_list_file(path):
+        return AcquisitionList(list(iter_acquisitions(path, start, stop)))
+    else:
+        with open(path, 'rb') as file:
+            acq_list = pickle.load(file)
+        if not isinstance(acq_list, AcquisitionList):
+            raise TypeError(f'{path} does not contain a mesoSPIM acquisition list')
+        return AcquisitionList(acq_list[start:stop])
+
+def load_acquisition_table(path, start=0, stop=None):
+    '''Loads a file directly into a column-oriented AcquisitionTable'''
+    from .acquisition_table import AcquisitionTable
+
+    defaults = Acquisition()
+    rows = [dict(defaults, **row) for row in iter_rows(path, start, stop)]
+    return AcquisitionTable.from_acquisition_list(rows)
+
+def save_acquisition_list(path, acq_list):
+    '''Saves an acquisition list, the file is replaced atomically'''
+    columns = acq_list.get_keylist() if len(acq_list) else Acquisition().get_keylist()
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        file.write(_dump_line(get_header(columns)))
+        for acq in acq_list:
+            file.write(_dump_line([acq[column] for column in columns]))
+    os.replace(tmp_path, path)
+
+def append_acquisitions(path, acquisitions):
+    '''Appends Acquisitions to a file, creates the file if necessary
+
+    The rows are written in the column order of the existing file.
+    '''
+    if os.path.isfile(path) and os.path.getsize(path) > 0:
+        with open(path, 'r', encoding='utf-8') as file:
+            columns = read_header(file)['columns']
+        with open(path, 'rb+') as file:
+            ''' Make sure the file ends with a line break before appending '''
+            file.seek(-1, os.SEEK_END)
+            needs_newline = file.read(1) != b'\n'
+        mode = 'a'
+    else:
+        columns = Acquisition().get_keylist()
+        needs_newline = False
+        mode = 'w'
+
+    defaults = Acquisition()
+    with open(path, mode, encoding='utf-8') as file:
+        if mode == 'w':
+            file.write(_dump_line(get_header(columns)))
+        elif needs_newline:
+            file.write('\n')
+        for acq in acquisitions:
+            file.write(_dump_line([acq[column] if column in acq else defaults.get(column) for column in columns]))
+
+def convert_pickle(pickle_path, path):
+    '''Converts a pickled acquisition list into the JSON lines format'''
+    with open(pickle_path, 'rb') as file:
+        acq_list = pickle.load(file)
+    save_acquisition_list(path, acq_list)
+    return len(acq_list)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Convert pickled mesoSPIM acquisition tables')
+    parser.add_argument('pickle_path', help='Table saved by a previous version of the Acquisition Manager')
+    parser.add_argument('path', help='Output file (JSON lines)')
+    args = parser.parse_args()
+
+    rows = convert_pickle(args.pickle_path, args.path)
+    print(f'Converted {rows} rows: {args.path}')
@@ -0,0 +1,178 @@
+'''
+acquisition_journal.py
+========================================
+
+Journal of a running acquisition list for resuming after a crash
+
+While an acquisition list runs, a journal is written as JSON lines into the
+folder of the first stack (mesoSPIM_journal_<time>.jsonl). Every line is
+flushed to disk right away, so the journal survives a crash of the software
+or of a device:
+
+    {"event": "list", "format": "mesoSPIM-acquisition-journal", "version": 1, "columns": [...], "rows": [[...], ...]}
+    {"event": "stack_started", "row": 0, "start_plane": 0, "time": "...", "state": {...}}
+    {"event": "checkpoint", "row": 0, "planes_written": 100, "time": "...", "state": {...}}
+    {"event": "stack_completed", "row": 0, "planes_written": 1000, "paths": ["/data/tile_0.raw"], "time": "..."}
+    {"event": "list_completed", "time": "..."}
+
+planes_written is the number of planes that have been handed to the disk by
+the writers of all cameras. state is the device state at that time (position,
+laser, zoom, filter, ...).
+
+When a list is resumed from a journal, completed stacks are skipped and a
+partial stack continues at the last checkpoint into the existing files. The
+resume is appended to the same journal, so an interrupted resume can be
+resumed again. The checkpoint interval is set in the config file:
+
+    journal_parameters = {'enabled' : True,
+                          'checkpoint_interval' : 50}
+'''
+
+import os
+import json
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .acquisitions import AcquisitionList
+from .acquisition_io import _dump_line, _row_converter
+
+journal_format = 'mesoSPIM-acquisition-journal'
+journal_format_version = 1
+
+''' State parameters recorded with every checkpoint '''
+journal_state_keys = ('position', 'laser', 'intensity', 'zoom', 'filter', 'shutterconfig',
+                      'etl_l_offset', 'etl_l_amplitude', 'etl_r_offset', 'etl_r_amplitude',
+                      'camera_exposure_time', 'camera_line_interval', 'camera_roi', 'camera_binning')
+
+''' State parameters that have to match to continue the stacks of a journal '''
+journal_resume_keys = ('camera_roi', 'camera_binning', 'camera_exposure_time')
+
+def get_journal_parameters_from_config(cfg):
+    '''Returns the journal parameters with defaults
+
+    enabled: Write a journal for every acquisition list
+    checkpoint_interval: Planes between two checkpoints of a stack
+    '''
+    parameters = {'enabled' : True, 'checkpoint_interval' : 50}
+    if hasattr(cfg, 'journal_parameters'):
+        parameters.update(cfg.journal_parameters)
+    return parameters
+
+class AcquisitionJournal(object):
+    '''Appends events to a journal file, every line is synced to disk
+
+    Use create() for a new acquisition list and append() to continue the
+    journal of a resumed list.
+    '''
+    def __init__(self, path, mode='a'):
+        self.path = path
+        self.file = open(path, mode, encoding='utf-8')
+
+    @classmethod
+    def create(cls, folder, acq_list):
+        path = os.path.join(folder, 'mesoSPIM_journal_' + time.strftime('%Y%m%d-%H%M%S') + '.jsonl')
+        journal = cls(path, 'w')
+        columns = acq_list.get_keylist()
+        journal.write_event('list', format=journal_format, version=journal_format_version, columns=columns,
+                            rows=[[acq[column] for column in columns] for acq in acq_list])
+        logger.info(f'Journal: Writing {path}')
+        return journal
+
+    @classmethod
+    def append(cls, path):
+        journal = cls(path, 'a')
+        journal.write_event('resumed')
+        return journal
+
+    def write_event(self, event, **values):
+        line = dict(event=event, time=time.strftime('%Y-%m-%d %H:%M:%S'), **values)
+        self.file.write(_dump_line(line))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def stack_started(self, row, start_plane, state):
+        self.write_event('stack_started', row=row, start_plane=start_plane, state=state)
+
+    def checkpoint(self, row, planes_written, state):
+        self.write_event('checkpoint', row=row, planes_written=planes_written, state=state)
+
+    def stack_completed(self, row, planes_written, paths):
+        self.write_event('stack_completed', row=row, planes_written=planes_written, paths=paths)
+
+    def list_completed(self):
+        self.write_event('list_completed')
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+class JournalProgress(object):
+    '''Progress of an acquisition list according to its journal
+
+    Attributes:
+        acq_list (AcquisitionList): The list as it was run (after the storage policy)
+        completed_rows (dict): row -> paths of the written files
+        planes_written (dict): row -> planes on disk of stacks that were started but not completed
+        last_state (dict): Device state of the last checkpoint
+        finished (bool): The list was completed
+    '''
+    def __init__(self, acq_list):
+        self.acq_list = acq_list
+        self.completed_rows = {}
+        self.planes_written = {}
+        self.last_state = {}
+        self.finished = False
+
+    def get_start_plane(self, row):
+        ''' Plane to continue a stack at, None if the stack is complete '''
+        if row in self.completed_rows:
+            return None
+        return self.planes_written.get(row, 0)
+
+    def get_remaining_image_count(self):
+        return sum(acq.get_image_count() - self.get_start_plane(row)
+                   for row, acq in enumerate(self.acq_list) if row not in self.completed_rows)
+
+def read_journal(path):
+    '''Reads a journal and returns a JournalProgress
+
+    A crash can leave an incomplete last line, which is ignored.
+    '''
+    with open(path, 'r', encoding='utf-8') as file:
+        lines = file.readlines()
+
+    try:
+        header = json.loads(lines[0])
+    except (IndexError, ValueError):
+        raise ValueError(f'{path} is not a mesoSPIM acquisition journal')
+    if header.get('event') != 'list' or header.get('format') != journal_format:
+        raise ValueError(f'{path} is not a mesoSPIM acquisition journal')
+    if header.get('version', 0) > journal_format_version:
+        raise ValueError(f'{path} uses journal version {header["version"]}, '
+                         f'this software supports up to version {journal_format_version}')
+
+    convert = _row_converter(header['columns'])
+    progress = JournalProgress(AcquisitionList([convert(values) for values in header['rows']]))
+
+    for number, line in enumerate(lines[1:], start=2):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            logger.warning(f'Journal: Ignoring incomplete line {number} of {path}')
+            continue
+
+        event = entry.get('event')
+        if event == 'stack_started':
+            progress.planes_written[entry['row']] = entry['start_plane']
+            progress.last_state = entry['state']
+        elif event == 'checkpoint':
+            progress.planes_written[entry['row']] = entry['planes_written']
+            progress.last_state = entry['state']
+        elif event == 'stack_completed':
+            progress.planes_written.pop(entry['row'], None)
+            progress.completed_rows[entry['row']] = entry['paths']
+        elif event == 'list_completed':
+            progress.finished = True
+    return progress
@@ -0,0 +1,324 @@
+'''
+acquisition_table.py
+========================================
+
+Column-oriented storage of an acquisition list
+
+An AcquisitionList keeps one IndexedOrderedDict per row, which makes aggregates
+like the total number of planes or the filename checks loop over all rows in
+Python. The AcquisitionTable stores the same information in structured NumPy
+columns - text columns (laser, filter, folder, filename...) as integer codes
+into string pools - and keeps plane counts and the filename index up to date
+while rows are edited. Validation of folders, duplicated and existing files is
+done once per unique folder/path instead of once per row.
+'''
+
+import os
+from collections import Counter
+
+import numpy as np
+
+from .acquisitions import Acquisition, AcquisitionList
+
+numeric_columns = ('x_pos',
+                   'y_pos',
+                   'z_start',
+                   'z_end',
+                   'z_step',
+                   'planes',
+                   'rot',
+                   'f_start',
+                   'f_end',
+                   'intensity',
+                   'etl_l_offset',
+                   'etl_l_amplitude',
+                   'etl_r_offset',
+                   'etl_r_amplitude')
+
+string_columns = ('laser',
+                  'filter',
+                  'zoom',
+                  'shutterconfig',
+                  'folder',
+                  'filename',
+                  'processing')
+
+''' These columns are integers in an Acquisition '''
+integer_columns = ('planes', 'intensity')
+
+numeric_dtype = np.dtype([(column, np.float64) for column in numeric_columns])
+code_dtype = np.dtype([(column, np.int32) for column in string_columns])
+
+def compute_image_counts(z_start, z_end, z_step):
+    '''Vectorized version of Acquisition.get_image_count()
+
+    Rows with a z_step of 0 or invalid entries have 0 planes.
+    '''
+    with np.errstate(divide='ignore', invalid='ignore'):
+        counts = np.abs(np.trunc((z_end - z_start)/z_step))
+    counts[~np.isfinite(counts)] = 0
+    return counts.astype(np.int64)
+
+class StringPool(object):
+    '''Maps strings to integer codes and back, codes are never reused'''
+    def __init__(self):
+        self.strings = []
+        self.codes = {}
+
+    def encode(self, string):
+        code = self.codes.get(string)
+        if code is None:
+            code = len(self.strings)
+            self.strings.append(string)
+            self.codes[string] = code
+        return code
+
+    def decode(self, code):
+        return self.strings[code]
+
+class AcquisitionTable(object):
+    '''
+    Array-backed acquisition table with cached aggregates
+
+    Rows can be appended, inserted, deleted, moved and edited. The number
+    of planes per row, the total number of planes and the index of all
+    file paths are updated incrementally on every change.
+
+    Example:
+        table = AcquisitionTable.from_acquisition_list(acq_list)
+        table.get_image_count()
+        table.set_value(3, 'z_end', 2000)
+        table.check_for_duplicated_filenames()
+    '''
+    def __init__(self, capacity=16):
+        self._numeric = np.zeros(capacity, dtype=numeric_dtype)
+        self._codes = np.zeros(capacity, dtype=code_dtype)
+        self._image_counts = np.zeros(capacity, dtype=np.int64)
+        self._length = 0
+
+        self._pools = {column : StringPool() for column in string_columns}
+
+        ''' Cached aggregates '''
+        self._total_image_count = 0
+        self._path_counts = Counter()
+
+    @classmethod
+    def from_acquisition_list(cls, acq_list):
+        ''' Creates a table from an AcquisitionList (or any list of Acquisitions) '''
+        table = cls(capacity=max(len(acq_list), 16))
+        length = len(acq_list)
+        table._length = length
+
+        for column in numeric_columns:
+            ''' Rows with invalid entries become NaN like in set_value '''
+            table._numeric[column][:length] = [_to_float(acq[column]) for acq in acq_list]
+        for column in string_columns:
+            pool = table._pools[column]
+            table._codes[column][:length] = [pool.encode(str(acq[column])) for acq in acq_list]
+
+        table._recalculate_aggregates()
+        return table
+
+    def __len__(self):
+        return self._length
+
+    def _recalculate_aggregates(self):
+        length = self._length
+        numeric = self._numeric[:length]
+        self._image_counts[:length] = compute_image_counts(numeric['z_start'], numeric['z_end'], numeric['z_step'])
+        self._total_image_count = int(self._image_counts[:length].sum())
+        self._path_counts = Counter(zip(self._codes['folder'][:length].tolist(),
+                                        self._codes['filename'][:length].tolist()))
+
+    def _grow(self, minimum_capacity):
+        capacity = max(minimum_capacity, 2*len(self._numeric))
+        for name in ('_numeric', '_codes', '_image_counts'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self._length] = old[:self._length]
+            setattr(self, name, new)
+
+    def _check_row(self, row):
+        if not 0 <= row < self._length:
+            raise IndexError(f'Row {row} out of range for a table with {self._length} rows')
+
+    def _path_key(self, row):
+        return (int(self._codes['folder'][row]), int(self._codes['filename'][row]))
+
+    def _remove_row_from_aggregates(self, row):
+        self._total_image_count -= int(self._image_counts[row])
+        key = self._path_key(row)
+        self._path_counts[key] -= 1
+        if self._path_counts[key] == 0:
+            del self._path_counts[key]
+
+    def _add_row_to_aggregates(self, row):
+        numeric = self._numeric[row]
+        self._image_counts[row] = compute_image_counts(np.array([numeric['z_start']]),
+                                                       np.array([numeric['z_end']]),
+                                                       np.array([numeric['z_step']]))[0]
+        self._total_image_count += int(self._image_counts[row])
+        self._path_counts[self._path_key(row)] += 1
+
+    def _write_row(self, row, acq):
+        for column in numeric_columns:
+            self._numeric[column][row] = _to_float(acq[column])
+        for column in string_columns:
+            self._codes[column][row] = self._pools[column].encode(str(acq[column]))
+
+    def insert(self, row, acq):
+        ''' Inserts an Acquisition before row (like list.insert) '''
+        row = min(max(row, 0), self._length)
+        if self._length == len(self._numeric):
+            self._grow(self._length + 1)
+
+        length = self._length
+        for array in (self._numeric, self._codes, self._image_counts):
+            array[row+1:length+1] = array[row:length]
+
+        self._length += 1
+        self._write_row(row, acq)
+        self._add_row_to_aggregates(row)
+
+    def append(self, acq):
+        self.insert(self._length, acq)
+
+    def delete(self, row):
+        self._check_row(row)
+        self._remove_row_from_aggregates(row)
+
+        length = self._length
+        for array in (self._numeric, self._codes, self._image_counts):
+            array[row:length-1] = array[row+1:length]
+        self._length -= 1
+
+    def replace(self, row, acq):
+        self._check_row(row)
+        self._remove_row_from_aggregates(row)
+        self._write_row(row, acq)
+        self._add_row_to_aggregates(row)
+
+    def move(self, source_row, destination_row):
+        ''' Moves a single row, destination_row is the index after the move '''
+        acq = self.get_acquisition(source_row)
+        self.delete(source_row)
+        self.insert(destination_row, acq)
+
+    def set_value(self, row, key, value):
+        ''' Sets a single entry and updates the cached aggregates '''
+        self._check_row(row)
+        if key not in numeric_columns and key not in string_columns:
+            raise KeyError(key)
+
+        self._remove_row_from_aggregates(row)
+        if key in numeric_columns:
+            self._numeric[key][row] = _to_float(value)
+        else:
+            self._codes[key][row] = self._pools[key].encode(str(value))
+        self._add_row_to_aggregates(row)
+
+    def get_value(self, row, key):
+        self._check_row(row)
+        if key in numeric_columns:
+            value = float(self._numeric[key][row])
+            if key in integer_columns and np.isfinite(value):
+                value = int(value)
+            return value
+        elif key in string_columns:
+            return self._pools[key].decode(self._codes[key][row])
+        else:
+            raise KeyError(key)
+
+    def get_column(self, key):
+        ''' Returns a column as NumPy array (numeric) or list (text) '''
+        if key in numeric_columns:
+            return self._numeric[key][:self._length].copy()
+        elif key in string_columns:
+            pool = self._pools[key]
+            return [pool.decode(code) for code in self._codes[key][:self._length]]
+        else:
+            raise KeyError(key)
+
+    def get_acquisition(self, row):
+        acq = Acquisition()
+        for key in acq.keys():
+            acq[key] = self.get_value(row, key)
+        return acq
+
+    def to_acquisition_list(self):
+        return AcquisitionList([self.get_acquisition(row) for row in range(self._length)])
+
+    def get_image_counts(self):
+        ''' Number of planes per row '''
+        return self._image_counts[:self._length].copy()
+
+    def get_image_count(self):
+        ''' Total number of planes, cached '''
+        return self._total_image_count
+
+    def get_acquisition_time(self, framerate):
+        return self._total_image_count/framerate
+
+    def has_rotation(self):
+        rot = self._numeric['rot'][:self._length]
+        return bool(np.any(rot[1:] != rot[:-1]))
+
+    def get_paths(self):
+        folders = self._pools['folder']
+        filenames = self._pools['filename']
+        return [folders.decode(folder)+'/'+filenames.decode(filename)
+                for folder, filename in zip(self._codes['folder'][:self._length], self._codes['filename'][:self._length])]
+
+    def _get_unique_folders(self):
+        ''' Folder strings in order of their first occurrence '''
+        codes = self._codes['folder'][:self._length]
+        _, first_rows = np.unique(codes, return_index=True)
+        return [self._pools['folder'].decode(codes[row]) for row in np.sort(first_rows)]
+
+    def check_for_nonexisting_folders(self):
+        ''' Returns a list of nonexisting folders (each folder only once) '''
+        return [folder for folder in self._get_unique_folders() if not os.path.isdir(folder)]
+
+    def check_for_duplicated_filenames(self):
+        ''' Returns a list of file paths used by more than one row '''
+        folders = self._pools['folder']
+        filenames = self._pools['filename']
+        return [folders.decode(folder)+'/'+filenames.decode(filename)
+                for (folder, filename), count in self._path_counts.items() if count > 1]
+
+    def check_for_existing_filenames(self, get_written_paths=None):
+        '''Returns a list of file paths that already exist
+
+        Args:
+            get_written_paths (callable): Returns the files written for a path
+                of the table, e.g. with camera suffixes or the .craw extension
+                of the compressed writer. By default, the path itself.
+
+        Each folder is listed only once instead of calling isfile for every file.
+        '''
+        folder_contents = {}
+        existing = []
+        for path in self.get_paths():
+            written_paths = [path] if get_written_paths is None else get_written_paths(path)
+            for written_path in written_paths:
+                folder, filename = os.path.split(written_path)
+                if folder not in folder_contents:
+                    try:
+                        folder_contents[folder] = set(os.path.normcase(entry.name) for entry in os.scandir(folder or '.') if entry.is_file())
+                    except OSError:
+                        folder_contents[folder] = set()
+                if os.path.normcase(filename) in folder_contents[folder]:
+                    existing.append(written_path)
+        return existing
+
+    def validate(self, get_written_paths=None):
+        ''' Runs all checks at once, returns a dict of lists '''
+        return {'nonexisting_folders' : self.check_for_nonexisting_folders(),
+                'existing_filenames' : self.check_for_existing_filenames(get_written_paths),
+                'duplicated_filenames' : self.check_for_duplicated_filenames()}
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
@@ -6,7 +6,7 @@ Helper classes for mesoSPIM acquisitions
 '''
 
 import indexed
-import os.path
+from collections import Counter
 
 class Acquisition(indexed.IndexedOrderedDict):
     '''
@@ -253,26 +253,28 @@ class AcquisitionList(list):
         '''
         return self[0].get_keylist()
 
+    def get_table(self):
+        '''
+        Returns a column-oriented AcquisitionTable of this list for the file checks
+
+        The table is a snapshot: later changes to the list are not reflected.
+        Building it costs more than a loop over the list, so the aggregates
+        below (called often by the core) loop instead.
+        '''
+        from .acquisition_table import AcquisitionTable
+        return AcquisitionTable.from_acquisition_list(self)
+
     def get_acquisition_time(self, framerate):
         '''
         Returns total time in seconds of a list of acquisitions
         '''
-        time = 0
-
-        for i in range(len(self)):
-            time += self[i].get_acquisition_time(framerate)
-
-        return time
+        return self.get_image_count()/framerate
 
     def get_image_count(self):
         '''
         Returns the total number of planes for a list of acquistions
         '''
-        image_count = 0
-        for i in range(len(self)):
-            image_count += self[i].get_image_count()
-
-        return image_count
+        return sum(acq.get_image_count() for acq in self)
 
     def get_startpoint(self):
         return self[0].get_startpoint()
@@ -299,60 +301,19 @@ class AcquisitionList(list):
 
         TODO: Better method name
         '''
-        delta_rot = 0
-        for i in range(len(self)-1):
-            ''' self[i] is a acq_list element - an acquisition
-                get_startpoint() returns the startpoint dict
-                dict['theta_abs'] returns the start angle
-            '''
-            delta_rot = self[i+1].get_startpoint()['theta_abs']-self[i].get_startpoint()['theta_abs']
-            if delta_rot != 0:
-                return True
-                break
-        return False
-
-    def check_for_existing_filenames(self):
-        ''' Returns a list of existing filenames '''
-        filename_list = []
-        for i in range(len(self)):
-            filename = self[i]['folder']+'/'+self[i]['filename']
-            file_exists = os.path.isfile(filename)
-            if file_exists:
-                filename_list.append(filename)
-
-        return filename_list 
-        
-    def check_for_duplicated_filenames(self):
-        ''' Returns a list of duplicated filenames '''
-        duplicates = []
-        filenames = []
-
-        ''' Create a list of full file paths'''
-        for i in range(len(self)):
-            filename = self[i]['folder']+'/'+self[i]['filename']
-            filenames.append(filename)
+        return any(acq['rot'] != next_acq['rot'] for acq, next_acq in zip(self, self[1:]))
 
-        duplicates = self.get_duplicates_in_list(filenames)
+    def check_for_existing_filenames(self, get_written_paths=None):
+        ''' Returns a list of existing filenames, see AcquisitionTable.check_for_existing_filenames '''
+        return self.get_table().check_for_existing_filenames(get_written_paths)
 
-        return duplicates
+    def check_for_duplicated_filenames(self):
+        ''' Returns a list of duplicated filenames '''
+        return self.get_table().check_for_duplicated_filenames()
 
     def check_for_nonexisting_folders(self):
         ''' Returns a list of nonexisting folders '''
-        
-        nonexisting_folders = []
-
-        for i in range(len(self)):
-            folder = self[i]['folder']
-            if not os.path.isdir(folder):
-                nonexisting_folders.append(folder)
-        
-        return nonexisting_folders
+        return self.get_table().check_for_nonexisting_folders()
 
     def get_duplicates_in_list(self, list):
-        duplicates = []
-        unique = set(list)
-        for each in unique:
-            count = list.count(each)
-            if count > 1:
-                duplicates.append(each)
-        return duplicates
+        return [each for each, count in Counter(list).items() if count > 1]
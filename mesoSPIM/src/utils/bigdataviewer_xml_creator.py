@@ -40,7 +40,13 @@ class mesoSPIM_XMLexporter:
         self.z_size = 1
         self.length_unit = 'micron'
 
-    def generate_xml_from_acqlist(self, acqlist, path):
+    def generate_xml_from_acqlist(self, acqlist, path, translations=None):
+        '''
+        translations (optional): dict of row -> (nominal, correction), both as
+        (rows, columns) in pixels of the saved images, e.g. from the online tile
+        registration. They are written as "Translation to Regular Grid" and
+        "Stitching Transform" in addition to the calibration.
+        '''
         channeldict = self.generate_channeldict(acqlist)
         tiledict = self.generate_tiledict(acqlist)
         illuminationdict = self.generate_illuminationdict(acqlist)
@@ -94,7 +100,14 @@ class mesoSPIM_XMLexporter:
                                         tile = tiledict[tilestring],
                                         angle = self.create_angle_string(acq))
 
-            self.xmlwriter.addCalibrationRegistration(tp='0', view=str(id), calibrationstring=calibrationstring)
+            if translations is None:
+                self.xmlwriter.addCalibrationRegistration(tp='0', view=str(id), calibrationstring=calibrationstring)
+            else:
+                nominal, correction = translations[id]
+                transforms = [('Stitching Transform', self.create_translation_string(acq, correction)),
+                              ('Translation to Regular Grid', self.create_translation_string(acq, nominal, acq['z_start'])),
+                              ('calibration', calibrationstring)]
+                self.xmlwriter.addTransformRegistration(tp='0', view=str(id), transforms=transforms)
             id += 1
         
         self.xmlwriter.addAttributes(illuminations=illuminationlist,
@@ -236,6 +249,21 @@ class mesoSPIM_XMLexporter:
 
         return calibration_string
 
+    def create_translation_string(self, acq, pixel_shift, z_shift=0):
+        '''
+        Translation after the calibration: pixel_shift (rows, columns) is in XY pixels,
+        z_shift in microns. The calibration scales the smaller voxel dimension to 1,
+        so the translation is in multiples of that.
+        '''
+        self.update_pixelsizes(acq)
+        unit = min(self.xy_pixelsize, self.z_pixelsize)
+
+        ''' Columns of the saved images are BDV x '''
+        x = pixel_shift[1] * self.xy_pixelsize / unit
+        y = pixel_shift[0] * self.xy_pixelsize / unit
+        z = z_shift / unit
+        return f'1.0 0.0 0.0 {x} 0.0 1.0 0.0 {y} 0.0 0.0 1.0 {z}'
+
 class mesoSPIM_BDVXMLwriter:
     '''
     mesoSPIM bigdataviewer-XML-writer
@@ -392,6 +420,18 @@ class mesoSPIM_BDVXMLwriter:
         affine = etree.SubElement(VT, 'affine')
         affine.text = '1.0 0.0 0.0 0.0 0.0 1.0 0.0 0.0 0.0 0.0 1.0 0.0'
 
+    def addTransformRegistration(self, tp, view, transforms):
+        '''
+        transforms: list of (name, affine string), the last one is applied first
+        '''
+        V = etree.SubElement(self.ViewRegistrations, 'ViewRegistration', timepoint=str(tp), setup=str(view))
+        for transform_name, affinestring in transforms:
+            VT = etree.SubElement(V, 'ViewTransform', type="affine")
+            name = etree.SubElement(VT, 'Name')
+            name.text = transform_name
+            affine = etree.SubElement(VT, 'affine')
+            affine.text = affinestring
+
     def addCalibrationRegistration(self, tp, view, calibrationstring):
         V = etree.SubElement(self.ViewRegistrations, 'ViewRegistration', timepoint=str(tp), setup=str(view))
         VT = etree.SubElement(V, 'ViewTransform', type="affine")
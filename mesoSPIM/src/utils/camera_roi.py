@@ -0,0 +1,112 @@
+'''
+camera_roi.py
+========================================
+
+Camera sub-array (ROI) geometry and the matching waveform timing
+
+A ROI is given as fractions of the saved image (row_start, row_stop,
+column_start, column_stop), None is the full frame. As fractions, the ROI does
+not depend on binning or on the subsampling of the camera window.
+
+The saved images are the camera frames rotated by np.rot90: The rows of the
+saved image are the (reversed) columns of the sensor, the columns of the saved
+image are the sensor lines which are read out during the light-sheet sweep.
+Only the ROI columns reduce the number of lines, so the waveforms are retimed:
+
+    line fraction   f = column_stop - column_start
+    sweeptime       sweeptime * f, but at least min_sweeptime
+    line interval   stretched if min_sweeptime applies, so that the readout still
+                    fills the ETL ramp
+    ETL ramp        amplitude * f around the position of the ROI center
+
+The ETL parameters of the ETL parameter file stay the full-frame values, the
+retiming is only applied when the waveforms are calculated.
+'''
+
+import math
+
+def get_roi_parameters_from_config(cfg):
+    '''Returns the ROI parameters with defaults
+
+    step: Sub-array positions and sizes are multiples of step sensor pixels
+    min_sweeptime: Lower limit of the sweeptime in seconds
+    sweep_direction: 1 if the light-sheet sweeps along increasing columns of the
+        saved image, -1 otherwise
+    '''
+    parameters = {'step' : 4, 'min_sweeptime' : 0.02, 'sweep_direction' : 1}
+    if hasattr(cfg, 'camera_roi_parameters'):
+        parameters.update(cfg.camera_roi_parameters)
+    return parameters
+
+def snap_roi(roi, sensor_width, sensor_height, step=4):
+    '''Aligns a ROI to the sub-array granularity of the sensor
+
+    Args:
+        sensor_width, sensor_height (int): Unbinned sensor columns and lines
+        step (int): Granularity in sensor pixels (should include the binning)
+
+    Returns the ROI as fractions or None if it covers the full frame.
+    '''
+    if roi is None:
+        return None
+
+    row_start, row_stop, column_start, column_stop = [min(max(float(value), 0.0), 1.0) for value in roi]
+    if row_stop <= row_start or column_stop <= column_start:
+        raise ValueError(f'Invalid ROI {roi}')
+
+    h_start = math.floor(sensor_width * (1 - row_stop) / step) * step
+    h_stop = min(math.ceil(sensor_width * (1 - row_start) / step) * step, sensor_width)
+    v_start = math.floor(sensor_height * column_start / step) * step
+    v_stop = min(math.ceil(sensor_height * column_stop / step) * step, sensor_height)
+
+    if h_start == 0 and h_stop == sensor_width and v_start == 0 and v_stop == sensor_height:
+        return None
+
+    return (1 - h_stop/sensor_width, 1 - h_start/sensor_width, v_start/sensor_height, v_stop/sensor_height)
+
+def get_subarray(roi, sensor_width, sensor_height):
+    '''Returns (hpos, hsize, vpos, vsize) of the sensor in unbinned pixels'''
+    if roi is None:
+        return (0, sensor_width, 0, sensor_height)
+    row_start, row_stop, column_start, column_stop = roi
+    hpos = int(round(sensor_width * (1 - row_stop)))
+    hsize = int(round(sensor_width * (row_stop - row_start)))
+    vpos = int(round(sensor_height * column_start))
+    vsize = int(round(sensor_height * (column_stop - column_start)))
+    return (hpos, hsize, vpos, vsize)
+
+def get_image_bounds(roi, rows, columns):
+    '''Returns (row_start, row_stop, column_start, column_stop) in pixels of a saved full-frame image'''
+    if roi is None:
+        return (0, rows, 0, columns)
+    row_start, row_stop, column_start, column_stop = roi
+    return (int(round(rows * row_start)), int(round(rows * row_stop)),
+            int(round(columns * column_start)), int(round(columns * column_stop)))
+
+def get_line_fraction(roi):
+    ''' Fraction of the sensor lines read out '''
+    if roi is None:
+        return 1.0
+    return roi[3] - roi[2]
+
+def get_roi_timing(sweeptime, line_interval, roi, min_sweeptime=0.02):
+    ''' Returns (sweeptime, line interval) for a ROI '''
+    fraction = get_line_fraction(roi)
+    if fraction >= 1.0:
+        return sweeptime, line_interval
+
+    roi_sweeptime = sweeptime * fraction
+    if roi_sweeptime >= min_sweeptime:
+        return roi_sweeptime, line_interval
+    return min_sweeptime, line_interval * min_sweeptime / roi_sweeptime
+
+def get_roi_etl_parameters(amplitude, offset, roi, sweep_direction=1):
+    '''Returns (amplitude, offset) of an ETL ramp that only covers the ROI
+
+    The full-frame ramp goes from offset - amplitude to offset + amplitude.
+    '''
+    if roi is None:
+        return amplitude, offset
+    fraction = get_line_fraction(roi)
+    center = (roi[2] + roi[3]) / 2
+    return amplitude * fraction, offset + sweep_direction * amplitude * (2 * center - 1)
@@ -0,0 +1,380 @@
+'''
+compressed_raw.py
+========================================
+
+Losslessly compressed raw stacks with a random-access plane index
+
+Every plane is compressed on its own by a pool of worker threads (zstd, lz4
+or zlib - all of them release the GIL) and appended to the file in plane
+order. An index of all plane offsets is written at the end of the file, so
+any plane can be read without decompressing the rest of the stack.
+
+File layout (little endian):
+
+    Header (64 bytes)     magic, version, flags, codec, planes, x_pixels, y_pixels,
+                          planes written, offset of the index
+    Chunks                per plane: plane number (uint32), length (uint64), compressed data
+    Index                 per plane: offset and length of the compressed data (uint64)
+
+Before compression, the low and high bytes of the uint16 pixels are separated
+(byte shuffle): The high bytes of mostly dark background are nearly constant
+and compress very well. If a file was not closed properly, the index is
+rebuilt from the chunk headers.
+
+Replaced planes (replace_compressed_planes) are appended as new chunks after
+the old ones, followed by a new index. The old chunks stay in the file unused.
+
+Example:
+    with CompressedRawReader('/data/stack.craw') as stack:
+        plane = stack[100]
+
+Decompress a file into a regular .raw file from the command line:
+
+    python -m src.utils.compressed_raw /data/stack.craw /data/stack.raw
+'''
+
+import os
+import time
+import zlib
+import struct
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .raw_writers import RawWriter
+
+file_extension = '.craw'
+magic = b'MSPIMCRW'
+file_format_version = 1
+
+header_struct = struct.Struct('<8sHH16sIIIIQ')
+header_size = 64
+chunk_header_struct = struct.Struct('<IQ')
+flag_shuffle = 1
+
+def get_compressed_path(path):
+    ''' stack.raw -> stack.craw '''
+    root, extension = os.path.splitext(path)
+    if extension == '.raw':
+        return root + file_extension
+    return path + file_extension
+
+class _Codec(object):
+    '''Compression and decompression functions of one library
+
+    zstd compressors are not thread-safe, every thread gets its own.
+    '''
+    def __init__(self, name, level=None):
+        self.name = name
+        self.level = level
+        self.local = threading.local()
+
+        if name == 'zstd':
+            import zstandard
+            self.module = zstandard
+        elif name == 'lz4':
+            import lz4.frame
+            self.module = lz4.frame
+        elif name == 'zlib':
+            self.module = zlib
+        else:
+            raise ValueError(f'Unknown codec {name}, use one of {codecs}')
+
+    def compress(self, data):
+        if self.name == 'zstd':
+            if not hasattr(self.local, 'compressor'):
+                self.local.compressor = self.module.ZstdCompressor(level=self.level or 3)
+            return self.local.compressor.compress(data)
+        elif self.name == 'lz4':
+            return self.module.compress(data, compression_level=self.level or 0)
+        else:
+            return zlib.compress(data, self.level or 1)
+
+    def decompress(self, data):
+        if self.name == 'zstd':
+            if not hasattr(self.local, 'decompressor'):
+                self.local.decompressor = self.module.ZstdDecompressor()
+            return self.local.decompressor.decompress(data)
+        else:
+            return self.module.decompress(data)
+
+codecs = ('zstd', 'lz4', 'zlib')
+
+def get_codec(name='auto', level=None):
+    '''Returns a codec, 'auto' picks the first installed of zstd, lz4 and zlib'''
+    if name != 'auto':
+        return _Codec(name, level)
+
+    for name in codecs:
+        try:
+            return _Codec(name, level)
+        except ImportError:
+            pass
+
+def shuffle_bytes(image):
+    ''' All low bytes first, then all high bytes '''
+    return np.ascontiguousarray(image, dtype=np.uint16).view(np.uint8).reshape(-1, 2).T.tobytes()
+
+def unshuffle_bytes(data):
+    return np.frombuffer(data, dtype=np.uint8).reshape(2, -1).T.copy().view(np.uint16).ravel()
+
+class CompressedRawWriter(RawWriter):
+    '''Writes a compressed stack, the planes are compressed in a thread pool
+
+    Args:
+        codec (str): 'zstd', 'lz4', 'zlib' or 'auto'
+        level (int): Compression level, None uses a fast default of the codec
+        workers (int): Number of compression threads
+        shuffle (bool): Separate low and high bytes before compression
+
+    The file is written to the path with the extension .craw instead of .raw.
+    write_plane() returns as soon as the plane is queued. At most 2*workers
+    planes are waiting for compression, otherwise write_plane() blocks.
+    '''
+    options = ('codec', 'level', 'workers', 'shuffle')
+
+    def __init__(self, path, x_pixels, y_pixels, planes, start_plane=0, codec='auto', level=None, workers=4, shuffle=True):
+        super().__init__(get_compressed_path(path), x_pixels, y_pixels, planes, start_plane)
+        self.codec = get_codec(codec, level)
+        self.shuffle = shuffle
+        self.max_pending = 2 * workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mesoSPIM_Compression')
+        self.pending = deque()
+        self.index = []
+        self.uncompressed_bytes = 0
+
+        if start_plane:
+            self.continue_file(start_plane)
+        else:
+            self.file = open(self.path, 'wb')
+            self.write_header(index_offset=0)
+
+    def continue_file(self, start_plane):
+        '''Keeps the first start_plane planes of an existing file and continues after them
+
+        Codec and byte shuffle of the file are used instead of the parameters.
+        '''
+        with CompressedRawReader(self.path) as stack:
+            if len(stack) < start_plane:
+                raise ValueError(f'{self.path} only has {len(stack)} planes, cannot continue at plane {start_plane}')
+            self.index = [(int(offset), int(length)) for offset, length in stack.index[:start_plane]]
+            self.codec = stack.codec
+            self.shuffle = stack.shuffle
+
+        self.file = open(self.path, 'r+b')
+        self.write_header(index_offset=0)
+        ''' Replaced planes can be stored after later planes, see replace_compressed_planes() '''
+        self.file.seek(max(offset + length for offset, length in self.index))
+        self.file.truncate()
+
+    def write_header(self, index_offset):
+        flags = flag_shuffle if self.shuffle else 0
+        header = header_struct.pack(magic, file_format_version, flags, self.codec.name.encode('ascii'),
+                                    self.planes, self.x_pixels, self.y_pixels, len(self.index), index_offset)
+        self.file.write(header.ljust(header_size, b'\0'))
+
+    def _compress(self, image):
+        if self.shuffle:
+            data = shuffle_bytes(image)
+        else:
+            data = np.ascontiguousarray(image, dtype=np.uint16).tobytes()
+        return self.codec.compress(data)
+
+    def write_plane(self, image):
+        if self.planes_written >= self.planes:
+            raise IndexError(f'{self.path} only has {self.planes} planes')
+        self.pending.append((self.planes_written, self.executor.submit(self._compress, image)))
+        self.planes_written += 1
+        self.uncompressed_bytes += self.plane_bytes
+        self.write_compressed_planes(wait=len(self.pending) > self.max_pending)
+
+    def write_compressed_planes(self, wait=False):
+        '''Writes finished planes in plane order
+
+        Args:
+            wait (bool): Block until the queue is short enough again
+        '''
+        while self.pending and (wait or self.pending[0][1].done()):
+            plane, future = self.pending.popleft()
+            data = future.result()
+
+            start_time = time.perf_counter()
+            self.file.write(chunk_header_struct.pack(plane, len(data)))
+            self.index.append((self.file.tell(), len(data)))
+            self.file.write(data)
+            self._add_to_statistics(chunk_header_struct.size + len(data), start_time)
+
+            wait = wait and len(self.pending) > self.max_pending
+
+    def close(self):
+        if self.file.closed:
+            return
+
+        while self.pending:
+            self.write_compressed_planes(wait=True)
+        self.executor.shutdown()
+
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype=np.uint64).reshape(-1, 2).tobytes())
+        self.file.seek(0)
+        self.write_header(index_offset)
+        self.file.close()
+
+    @property
+    def planes_on_disk(self):
+        return len(self.index)
+
+    def get_stack(self):
+        return CompressedRawReader(self.path)
+
+    def get_statistics(self):
+        statistics = super().get_statistics()
+        statistics['file'] = os.path.basename(self.path)
+        statistics['codec'] = self.codec.name
+        statistics['uncompressed_bytes'] = self.uncompressed_bytes
+        statistics['compression_ratio'] = self.uncompressed_bytes/self.bytes_written if self.bytes_written else 0.0
+        return statistics
+
+class CompressedRawReader(object):
+    '''Random access to the planes of a compressed stack
+
+    Supports len(), iteration, stack[plane] and stack[start:stop] (returns an array).
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'rb')
+        self.lock = threading.Lock()
+
+        header = header_struct.unpack(self.file.read(header_size)[:header_struct.size])
+        file_magic, version, flags, codec, self.planes, self.x_pixels, self.y_pixels, planes_written, index_offset = header
+        if file_magic != magic:
+            raise ValueError(f'{path} is not a compressed mesoSPIM stack')
+        if version > file_format_version:
+            raise ValueError(f'{path} uses version {version}, this software supports up to version {file_format_version}')
+
+        self.shuffle = bool(flags & flag_shuffle)
+        self.codec = get_codec(codec.rstrip(b'\0').decode('ascii'))
+
+        if index_offset:
+            self.file.seek(index_offset)
+            self.index = np.frombuffer(self.file.read(planes_written * 16), dtype=np.uint64).reshape(-1, 2)
+        else:
+            logger.warning(f'{path} was not closed properly, rebuilding the plane index')
+            self.index = self.rebuild_index()
+
+    def rebuild_index(self):
+        index = []
+        file_size = os.path.getsize(self.path)
+        offset = header_size
+        while offset + chunk_header_struct.size <= file_size:
+            self.file.seek(offset)
+            plane, length = chunk_header_struct.unpack(self.file.read(chunk_header_struct.size))
+            data_offset = offset + chunk_header_struct.size
+            if plane > len(index) or data_offset + length > file_size:
+                break
+            if plane == len(index):
+                index.append((data_offset, length))
+            else:
+                ''' A replaced plane '''
+                index[plane] = (data_offset, length)
+            offset = data_offset + length
+        return np.array(index, dtype=np.uint64).reshape(-1, 2)
+
+    @property
+    def shape(self):
+        return (len(self), self.x_pixels, self.y_pixels)
+
+    def __len__(self):
+        return len(self.index)
+
+    def read_plane(self, plane):
+        offset, length = self.index[plane]
+        with self.lock:
+            self.file.seek(int(offset))
+            data = self.file.read(int(length))
+        data = self.codec.decompress(data)
+
+        if self.shuffle:
+            image = unshuffle_bytes(data)
+        else:
+            image = np.frombuffer(data, dtype=np.uint16)
+        return image.reshape(self.x_pixels, self.y_pixels)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return np.stack([self.read_plane(plane) for plane in range(*key.indices(len(self)))])
+        if key < 0:
+            key += len(self)
+        return self.read_plane(key)
+
+    def __iter__(self):
+        for plane in range(len(self)):
+            yield self.read_plane(plane)
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def replace_compressed_planes(path, images):
+    '''Replaces planes of a closed compressed stack
+
+    Args:
+        images (dict): plane -> image, the planes have to be in the index already
+    '''
+    with CompressedRawReader(path) as stack:
+        index = stack.index.copy()
+        codec = stack.codec
+        shuffle = stack.shuffle
+        planes, x_pixels, y_pixels = stack.planes, stack.x_pixels, stack.y_pixels
+
+    with open(path, 'r+b') as file:
+        ''' The new chunks overwrite the old index '''
+        offset = int((index[:, 0] + index[:, 1]).max()) if len(index) else header_size
+        file.seek(offset)
+        file.truncate()
+
+        for plane, image in sorted(images.items()):
+            if plane >= len(index):
+                raise IndexError(f'Plane {plane} of {path} was never written')
+            if shuffle:
+                data = shuffle_bytes(image)
+            else:
+                data = np.ascontiguousarray(image, dtype=np.uint16).tobytes()
+            data = codec.compress(data)
+            file.write(chunk_header_struct.pack(plane, len(data)))
+            index[plane] = (file.tell(), len(data))
+            file.write(data)
+
+        index_offset = file.tell()
+        file.write(index.tobytes())
+        file.seek(0)
+        header = header_struct.pack(magic, file_format_version, flag_shuffle if shuffle else 0, codec.name.encode('ascii'),
+                                    planes, x_pixels, y_pixels, len(index), index_offset)
+        file.write(header.ljust(header_size, b'\0'))
+
+def decompress_to_raw(path, raw_path):
+    ''' Writes a regular .raw file (e.g. for Fiji), returns the number of planes '''
+    with CompressedRawReader(path) as stack, open(raw_path, 'wb') as file:
+        for image in stack:
+            file.write(image.tobytes())
+        return len(stack)
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description='Decompress a compressed mesoSPIM stack into a .raw file')
+    parser.add_argument('path', help='Compressed stack (.craw)')
+    parser.add_argument('raw_path', help='Output .raw file')
+    args = parser.parse_args()
+
+    planes = decompress_to_raw(args.path, args.raw_path)
+    print(f'Decompressed {planes} planes: {args.raw_path}')
@@ -0,0 +1,51 @@
+'''
+etl_calibration.py
+========================================
+
+Fitting ETL offsets and amplitudes from an offset sweep
+
+During the rising ramp, the ETL voltage across the field of view is
+
+    v(u) = offset + amplitude * (2u - 1),   u = 0...1 along the readout direction
+
+For the calibration, the image is split into bands along the readout direction
+and only the offset is swept. For every band, the offset with the sharpest
+image is found (parabola fit). A straight line through the best offsets of the
+bands gives both parameters:
+
+    best_offset(u) = c + d * (2u - 1)
+    offset = c
+    amplitude = amplitude_during_sweep + direction * d
+
+direction is -1 if the bands are numbered against the readout direction.
+'''
+
+import numpy as np
+
+from .focus_metrics import compute_focus_metric, fit_focus_peak
+
+def compute_band_metrics(image, bands=8, axis=1, method='tenengrad', binning=4):
+    ''' Focus metric of equally wide bands of the image along an axis '''
+    return [compute_focus_metric(band, method, binning) for band in np.array_split(image, bands, axis=axis)]
+
+def get_band_centers(bands):
+    ''' Position of the band centers as fraction of the field of view '''
+    return (np.arange(bands) + 0.5) / bands
+
+def fit_etl_parameters(offsets, band_metrics, amplitude, direction=1):
+    '''Optimal ETL offset and amplitude from an offset sweep
+
+    Args:
+        offsets (list): Offsets of the sweep
+        band_metrics (list): For every offset, the list of band metrics
+        amplitude (float): Amplitude used during the sweep
+        direction (int): 1 if band 0 is read out first, -1 otherwise
+
+    Returns (offset, amplitude, best offsets per band)
+    '''
+    band_metrics = np.asarray(band_metrics, dtype=np.float64)
+    best_offsets = np.array([fit_focus_peak(offsets, band_metrics[:, band]) for band in range(band_metrics.shape[1])])
+
+    ramp_position = 2 * get_band_centers(len(best_offsets)) - 1
+    slope, intercept = np.polyfit(ramp_position, best_offsets, 1)
+    return float(intercept), float(amplitude + direction * slope), best_offsets
@@ -0,0 +1,254 @@
+'''
+etl_parameters.py
+========================================
+
+In-memory table of the ETL parameters per laser, zoom and objective
+
+The ETL parameter file (semicolon-separated csv) is read once into a dict, so
+laser and zoom changes during an acquisition do not touch the disk.
+Combinations which are not in the file are interpolated linearly over the zoom
+magnification (same laser) or, if that is not possible, over the wavelength
+(same zoom). Outside of the listed range, the nearest values are used.
+
+Saving appends rows to the file - when the file is read, a later row of a
+combination replaces the earlier ones. After max_appended_rows appended rows,
+the file is compacted: All combinations are written to a temporary file which
+atomically replaces the original (os.replace).
+
+Changes of the file by other programs (e.g. a text editor) are picked up with
+a QFileSystemWatcher and signalled with sig_changed.
+'''
+
+import os
+import re
+import csv
+
+import numpy as np
+
+from PyQt5 import QtCore
+
+import logging
+logger = logging.getLogger(__name__)
+
+fieldnames = ['Objective',
+              'Wavelength',
+              'Zoom',
+              'ETL-Left-Offset',
+              'ETL-Left-Amp',
+              'ETL-Right-Offset',
+              'ETL-Right-Amp']
+
+''' State parameter -> column of the file '''
+parameter_columns = {'etl_l_offset' : 'ETL-Left-Offset',
+                     'etl_l_amplitude' : 'ETL-Left-Amp',
+                     'etl_r_offset' : 'ETL-Right-Offset',
+                     'etl_r_amplitude' : 'ETL-Right-Amp'}
+
+default_objective = '1x'
+
+def parse_number(string):
+    ''' "0.63x" -> 0.63, "488 nm" -> 488.0, None if there is no number '''
+    match = re.search(r'\d*\.?\d+', str(string))
+    return float(match.group()) if match else None
+
+def read_etl_file(path):
+    '''Returns a dict (laser, zoom, objective) -> parameter dict
+
+    Rows are kept in file order, a later row of a combination replaces the
+    values of an earlier one. Incomplete rows are skipped.
+    '''
+    table = {}
+    with open(path, 'r', newline='') as file:
+        for row in csv.DictReader(file, delimiter=';'):
+            if not row.get('Wavelength') or not row.get('Zoom'):
+                continue
+            key = (row['Wavelength'], row['Zoom'], row.get('Objective') or default_objective)
+            try:
+                table[key] = {parameter : float(row[column]) for parameter, column in parameter_columns.items()}
+            except (TypeError, ValueError):
+                logger.warning(f'ETL parameters: Skipping invalid row {row}')
+    return table
+
+def format_row(key, values):
+    laser, zoom, objective = key
+    row = {'Objective' : objective, 'Wavelength' : laser, 'Zoom' : zoom}
+    for parameter, column in parameter_columns.items():
+        row[column] = values[parameter]
+    return row
+
+class ETLParameterTable(QtCore.QObject):
+    '''ETL parameters of an ETL parameter file, indexed by (laser, zoom, objective)
+
+    Args:
+        path (str): ETL parameter file, can also be loaded later with load()
+        max_appended_rows (int): The file is compacted after this many appended rows
+        watch (bool): Reload the file if it is changed by another program
+        parent (QObject): Moves the watcher into the thread of the parent
+    '''
+    sig_changed = QtCore.pyqtSignal()
+
+    def __init__(self, path=None, max_appended_rows=50, watch=True, parent=None):
+        super().__init__(parent)
+        self.path = None
+        self.table = {}
+        self.max_appended_rows = max_appended_rows
+        self.appended_rows = 0
+        ''' (mtime, size) after the last write of this table, to ignore its own changes '''
+        self.own_file_signature = None
+
+        if watch:
+            self.watcher = QtCore.QFileSystemWatcher(self)
+            self.watcher.fileChanged.connect(self.file_changed)
+        else:
+            self.watcher = None
+
+        if path is not None:
+            self.load(path)
+
+    def load(self, path):
+        ''' Reads the file and watches it for changes '''
+        table = read_etl_file(path)
+
+        if self.watcher is not None:
+            if self.path is not None and self.path != path:
+                self.watcher.removePath(self.path)
+            if path not in self.watcher.files():
+                self.watcher.addPath(path)
+
+        self.path = path
+        self.table = table
+        self.appended_rows = 0
+        self.own_file_signature = self.get_file_signature()
+        logger.info(f'ETL parameters: Loaded {len(table)} combinations from {path}')
+
+    def get_file_signature(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @QtCore.pyqtSlot(str)
+    def file_changed(self, path):
+        ''' Editors (and os.replace) remove the watched file, so it has to be watched again '''
+        if path != self.path or not os.path.isfile(path):
+            return
+        if path not in self.watcher.files():
+            self.watcher.addPath(path)
+        if self.get_file_signature() == self.own_file_signature:
+            return
+
+        try:
+            self.load(path)
+        except (OSError, csv.Error):
+            logger.error(f'ETL parameters: Could not reload {path}', exc_info=True)
+            return
+        self.sig_changed.emit()
+
+    def __contains__(self, key):
+        return key in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def get_parameters(self, laser, zoom, objective=default_objective):
+        '''Returns a dict with etl_l_offset, etl_l_amplitude, etl_r_offset and etl_r_amplitude
+
+        Combinations which are not in the table are interpolated, None is
+        returned if there is nothing to interpolate from.
+        '''
+        key = (laser, zoom, objective)
+        if key in self.table:
+            return dict(self.table[key])
+
+        for (other_laser, other_zoom, _), values in self.table.items():
+            if other_laser == laser and other_zoom == zoom:
+                return dict(values)
+
+        values = self.interpolate(key, along='zoom')
+        if values is None:
+            values = self.interpolate(key, along='laser')
+        if values is not None:
+            logger.info(f'ETL parameters: Interpolated parameters for {laser} / {zoom}')
+        return values
+
+    def interpolate(self, key, along='zoom'):
+        '''Linear interpolation over the zoom (same laser) or over the wavelength (same zoom)'''
+        index = 1 if along == 'zoom' else 0
+        fixed = 1 - index
+        target = parse_number(key[index])
+        if target is None:
+            return None
+
+        points = []
+        for other_key, values in self.table.items():
+            if other_key[fixed] != key[fixed] or other_key[2] != key[2]:
+                continue
+            position = parse_number(other_key[index])
+            if position is not None:
+                points.append((position, values))
+        if not points:
+            return None
+
+        points.sort(key=lambda point: point[0])
+        positions = [position for position, _ in points]
+        return {parameter : float(np.interp(target, positions, [values[parameter] for _, values in points]))
+                for parameter in parameter_columns}
+
+    def set_parameters(self, laser, zoom, values, objective=default_objective):
+        ''' Stores the parameters of one combination and saves them '''
+        self.update_parameters({(laser, zoom) : values}, objective)
+
+    def update_parameters(self, parameters, objective=default_objective):
+        '''Stores the parameters of several combinations and saves them
+
+        Args:
+            parameters (dict): (laser, zoom) -> dict with the keys of parameter_columns
+        '''
+        keys = []
+        for (laser, zoom), values in parameters.items():
+            key = (laser, zoom, objective)
+            self.table[key] = {parameter : float(values[parameter]) for parameter in parameter_columns}
+            keys.append(key)
+
+        if not os.path.isfile(self.path) or self.appended_rows + len(keys) > self.max_appended_rows:
+            self.compact()
+        else:
+            self.append_rows(keys)
+
+    def append_rows(self, keys):
+        with open(self.path, 'rb+') as file:
+            ''' Hand-edited files may not end with a line break '''
+            file.seek(0, os.SEEK_END)
+            if file.tell() > 0:
+                file.seek(-1, os.SEEK_END)
+                missing_line_break = file.read(1) != b'\n'
+            else:
+                missing_line_break = False
+
+        with open(self.path, 'a', newline='') as file:
+            if missing_line_break:
+                file.write('\r\n')
+            writer = csv.DictWriter(file, fieldnames=fieldnames, dialect='excel', delimiter=';')
+            writer.writerows(format_row(key, self.table[key]) for key in keys)
+            file.flush()
+            os.fsync(file.fileno())
+
+        self.appended_rows += len(keys)
+        self.own_file_signature = self.get_file_signature()
+
+    def compact(self):
+        ''' Rewrites the file with one row per combination, atomically replacing the old file '''
+        tmp_path = self.path + '_tmp'
+        with open(tmp_path, 'w', newline='') as file:
+            writer = csv.DictWriter(file, fieldnames=fieldnames, dialect='excel', delimiter=';')
+            writer.writeheader()
+            writer.writerows(format_row(key, values) for key, values in self.table.items())
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.path)
+
+        self.appended_rows = 0
+        self.own_file_signature = self.get_file_signature()
+        if self.watcher is not None and self.path not in self.watcher.files():
+            self.watcher.addPath(self.path)
@@ -0,0 +1,183 @@
+'''
+flatfield.py
+========================================
+
+Online dark-frame and flat-field correction
+
+    corrected = (image - dark) * mean(flat - dark) / (flat - dark) + offset
+
+The gain is precomputed per pixel as fixed-point integer, so the correction
+only needs integer subtraction, multiplication and a bit shift. Large frames
+are split into blocks of rows which are corrected by a pool of threads (NumPy
+releases the GIL for these operations).
+
+The reference frames are averaged by a calibration routine of the core
+(mesoSPIM_Core.calibrate_flatfield) and kept as .npy files in the reference
+folder of the config:
+
+    dark_<camera>_<binning>.npy          one per camera and binning
+    flat_<camera>_<binning>_<zoom>.npy   one per camera, binning and zoom
+
+They are stored in the orientation of the saved images.
+'''
+
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+class FlatFieldCorrection(object):
+    '''Fixed-point dark and flat-field correction of uint16 images
+
+    Args:
+        dark (ndarray): Averaged dark frame
+        flat (ndarray): Averaged flat frame, None only subtracts the dark frame
+        offset (int): Added after the correction to keep the noise floor above 0
+        fraction_bits (int): Fractional bits of the fixed-point gain
+        max_gain (float): Gains are clipped to this value (dead pixels in the flat)
+        workers (int): Threads correcting blocks of rows in parallel
+    '''
+    def __init__(self, dark, flat=None, offset=0, fraction_bits=12, max_gain=4, workers=4):
+        self.dark = np.asarray(dark, dtype=np.float64).round().astype(np.int32)
+        self.offset = int(offset)
+        self.fraction_bits = fraction_bits
+
+        if flat is None:
+            self.gain = None
+        else:
+            signal = np.maximum(np.asarray(flat, dtype=np.float64) - self.dark, 1)
+            gain = np.clip(signal.mean() / signal, 0, max_gain)
+            ''' int32 is sufficient: 65535 * max_gain * 2**fraction_bits < 2**31 '''
+            self.gain = np.round(gain * 2**fraction_bits).astype(np.int32)
+
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='mesoSPIM_FlatField') if workers > 1 else None
+
+    def _correct_rows(self, image, out, start, stop):
+        block = image[start:stop].astype(np.int32)
+        block -= self.dark[start:stop]
+        np.maximum(block, 0, out=block)
+        if self.gain is not None:
+            block *= self.gain[start:stop]
+            ''' Rounding instead of truncation '''
+            block += 1 << (self.fraction_bits - 1)
+            block >>= self.fraction_bits
+        block += self.offset
+        np.clip(block, 0, 65535, out=block)
+        out[start:stop] = block
+
+    def apply(self, image):
+        ''' Returns the corrected image as uint16 '''
+        if image.shape != self.dark.shape:
+            raise ValueError(f'Image shape {image.shape} does not match the reference shape {self.dark.shape}')
+
+        out = np.empty(image.shape, dtype=np.uint16)
+        if self.executor is None:
+            self._correct_rows(image, out, 0, len(image))
+        else:
+            bounds = np.linspace(0, len(image), self.workers + 1).astype(int)
+            futures = [self.executor.submit(self._correct_rows, image, out, start, stop)
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            for future in futures:
+                future.result()
+        return out
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+
+def _clean(string):
+    ''' Makes zoom names like "0.63x" safe for filenames '''
+    return re.sub(r'[^A-Za-z0-9.\-]', '_', str(string))
+
+class FlatFieldLibrary(object):
+    '''Reference frames of one camera in a folder
+
+    Args:
+        folder (str): Reference folder
+        camera (str): Camera name, e.g. cfg.camera
+    '''
+    def __init__(self, folder, camera, offset=0, workers=4):
+        self.folder = folder
+        self.camera = _clean(camera)
+        self.offset = offset
+        self.workers = workers
+        self.corrections = {}
+
+    def get_dark_path(self, binning):
+        return os.path.join(self.folder, f'dark_{self.camera}_{_clean(binning)}.npy')
+
+    def get_flat_path(self, binning, zoom):
+        return os.path.join(self.folder, f'flat_{self.camera}_{_clean(binning)}_{_clean(zoom)}.npy')
+
+    def save_reference(self, kind, frame, binning, zoom=None):
+        '''Saves an averaged reference frame
+
+        Args:
+            kind (str): 'dark' or 'flat'
+        '''
+        os.makedirs(self.folder, exist_ok=True)
+        if kind == 'dark':
+            path = self.get_dark_path(binning)
+        elif kind == 'flat':
+            path = self.get_flat_path(binning, zoom)
+        else:
+            raise ValueError(f'Unknown reference {kind}, use "dark" or "flat"')
+
+        np.save(path, frame.astype(np.float32))
+        logger.info(f'Flat-field: Saved {kind} reference {path}')
+
+        ''' Corrections using the old references are rebuilt on the next request '''
+        for correction in self.corrections.values():
+            if correction is not None:
+                correction.shutdown()
+        self.corrections = {}
+        return path
+
+    def get_correction(self, binning, zoom, bounds=None):
+        '''Returns the correction for a binning and zoom, None if there is no dark frame
+
+        Without a flat frame for the zoom, only the dark frame is subtracted.
+
+        Args:
+            bounds (tuple): (row_start, row_stop, column_start, column_stop) to crop
+                the references to a camera ROI, None for full frames
+        '''
+        key = (binning, zoom, bounds)
+        if key not in self.corrections:
+            dark_path = self.get_dark_path(binning)
+            flat_path = self.get_flat_path(binning, zoom)
+            if not os.path.isfile(dark_path):
+                logger.warning(f'Flat-field: No dark reference {dark_path}, images are not corrected')
+                self.corrections[key] = None
+            else:
+                dark = np.load(dark_path)
+                flat = np.load(flat_path) if os.path.isfile(flat_path) else None
+                if flat is None:
+                    logger.warning(f'Flat-field: No flat reference {flat_path}, only the dark frame is subtracted')
+                if bounds is not None:
+                    row_start, row_stop, column_start, column_stop = bounds
+                    dark = dark[row_start:row_stop, column_start:column_stop]
+                    if flat is not None:
+                        flat = flat[row_start:row_stop, column_start:column_stop]
+                self.corrections[key] = FlatFieldCorrection(dark, flat, offset=self.offset, workers=self.workers)
+        return self.corrections[key]
+
+def get_flatfield_library_from_config(cfg, camera=None):
+    '''Returns a FlatFieldLibrary if enabled in the config, otherwise None
+
+    Args:
+        camera (str): Camera name for the reference files, default: cfg.camera
+    '''
+    if not hasattr(cfg, 'flatfield_parameters') or not cfg.flatfield_parameters.get('enabled', False):
+        return None
+
+    parameters = cfg.flatfield_parameters
+    return FlatFieldLibrary(parameters['reference_folder'],
+                            camera or cfg.camera,
+                            offset=parameters.get('offset', 0),
+                            workers=parameters.get('workers', 4))
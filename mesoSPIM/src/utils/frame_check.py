@@ -0,0 +1,130 @@
+'''
+frame_check.py
+========================================
+
+Frame-number bookkeeping of a stack and the list of missing planes
+
+The frames of a stack are assigned to planes by their frame number (relative
+to the start of the stack, the first frame is 1) instead of the order in which
+they arrive. If the camera buffer overruns, the frame numbers jump and the
+planes in between are missing: They are written as empty planes, so the
+following planes stay at their position in the file. Frames with a frame
+number that was already written are duplicates and are dropped, as are frames
+beyond the end of the stack. At the end of the stack, planes that never
+arrived are missing as well.
+
+The result is saved next to the raw file as ``<filename>_frame_check.json``:
+
+    {"planes": 1000, "missing_planes": [412, 413], "duplicated_planes": [],
+     "extra_frames": 0, "repaired_planes": [412, 413]}
+
+With frame_loss_parameters in the config, the core moves back to the missing
+planes after the stack and re-acquires them:
+
+    frame_loss_parameters = {'repair' : True,
+                             'max_repair_planes' : 50}
+'''
+
+import json
+
+import logging
+logger = logging.getLogger(__name__)
+
+def get_frame_loss_parameters_from_config(cfg):
+    '''Returns the frame loss parameters with defaults
+
+    repair: Re-acquire missing planes at the end of the stack
+    max_repair_planes: Stacks with more missing planes are not repaired
+        (something is seriously wrong, e.g. the camera stopped)
+    '''
+    parameters = {'repair' : False, 'max_repair_planes' : 50}
+    if hasattr(cfg, 'frame_loss_parameters'):
+        parameters.update(cfg.frame_loss_parameters)
+    return parameters
+
+def get_frame_check_path(path):
+    ''' stack.raw -> stack.raw_frame_check.json '''
+    return path + '_frame_check.json'
+
+class FrameCheck(object):
+    '''Assigns the frames of a stack to planes
+
+    Args:
+        planes (int): Number of planes in the stack
+        first_plane (int): Plane of the first frame, if a stack is continued
+    '''
+    def __init__(self, planes, first_plane=0):
+        self.planes = planes
+        self.first_plane = first_plane
+        self.next_plane = first_plane
+        self.missing_planes = []
+        self.duplicated_planes = []
+        self.extra_frames = 0
+        self.repaired_planes = []
+
+    def assign_frame(self, frame_number):
+        '''Returns (plane, skipped planes) for a frame
+
+        plane is None if the frame is a duplicate or beyond the end of the stack.
+        The skipped planes between the last frame and this one are missing.
+        '''
+        plane = self.first_plane + frame_number - 1
+        if plane < self.next_plane:
+            self.duplicated_planes.append(plane)
+            return None, []
+        if plane >= self.planes:
+            self.extra_frames += 1
+            return None, []
+
+        skipped = list(range(self.next_plane, plane))
+        self.missing_planes.extend(skipped)
+        self.next_plane = plane + 1
+        return plane, skipped
+
+    def finish(self):
+        ''' Returns the planes that did not arrive until the end of the stack '''
+        skipped = list(range(self.next_plane, self.planes))
+        self.missing_planes.extend(skipped)
+        self.next_plane = self.planes
+        return skipped
+
+    def get_unrepaired_planes(self):
+        repaired = set(self.repaired_planes)
+        return [plane for plane in self.missing_planes if plane not in repaired]
+
+    def mark_repaired(self, planes):
+        self.repaired_planes = sorted(set(self.repaired_planes) | set(planes))
+
+    def is_complete(self):
+        return not self.get_unrepaired_planes()
+
+    def get_summary(self):
+        ''' Returns a dict for the metadata file '''
+        return {'planes' : self.planes,
+                'missing_planes' : len(self.missing_planes),
+                'duplicated_planes' : len(self.duplicated_planes),
+                'extra_frames' : self.extra_frames,
+                'repaired_planes' : len(self.repaired_planes),
+                'first_missing_plane' : self.missing_planes[0] if self.missing_planes else -1}
+
+    def to_dict(self):
+        return {'planes' : self.planes,
+                'missing_planes' : self.missing_planes,
+                'duplicated_planes' : self.duplicated_planes,
+                'extra_frames' : self.extra_frames,
+                'repaired_planes' : self.repaired_planes}
+
+    def save(self, path):
+        with open(path, 'w') as file:
+            json.dump(self.to_dict(), file)
+
+def load_frame_check(path):
+    with open(path, 'r') as file:
+        data = json.load(file)
+    frame_check = FrameCheck(data['planes'])
+    frame_check.next_plane = data['planes']
+    frame_check.missing_planes = data['missing_planes']
+    frame_check.duplicated_planes = data['duplicated_planes']
+    frame_check.extra_frames = data['extra_frames']
+    frame_check.repaired_planes = data['repaired_planes']
+    return frame_check
@@ -56,12 +56,15 @@ class ImageProcessingWizard(QtWidgets.QWizard):
         row_count = self.parent.model.rowCount()
         processing_column = self.parent.model.getColumnByName('Processing')
          
+        ''' Jobs of the post-processing queue, comma-separated '''
+        jobs = [job for job, field in (('MAX', 'maxProjEnabled'),
+                                       ('PREVIEW', 'previewEnabled'),
+                                       ('TIFF', 'tiffEnabled'),
+                                       ('SHA256', 'checksumEnabled')) if self.field(field)]
+
         for row in range(0, row_count):
             index = self.parent.model.createIndex(row, processing_column)
-            if self.field('maxProjEnabled'):
-                self.parent.model.setData(index, 'MAX')
-            else:
-                self.parent.model.setData(index,  '')
+            self.parent.model.setData(index, ','.join(jobs))
 
 class ImageProcessingWizardWelcomePage(QtWidgets.QWizardPage):
     def __init__(self, parent=None):
@@ -79,12 +82,23 @@ class ImageProcessingWizardSetOptionsPage(QtWidgets.QWizardPage):
         self.setTitle("Select processing options")
         #self.setSubTitle("Select the processing options:")
 
-        self.maxProjectionCheckBox = QtWidgets.QCheckBox('Post-stack MAX projection (adds time)', self)
+        self.setSubTitle("The jobs run in the background after each stack")
+
+        self.maxProjectionCheckBox = QtWidgets.QCheckBox('MAX projection', self)
+        self.previewCheckBox = QtWidgets.QCheckBox('Downsampled preview stack', self)
+        self.tiffCheckBox = QtWidgets.QCheckBox('OME-TIFF copy of the stack', self)
+        self.checksumCheckBox = QtWidgets.QCheckBox('SHA256 checksum', self)
         
         self.registerField('maxProjEnabled',self.maxProjectionCheckBox)
+        self.registerField('previewEnabled',self.previewCheckBox)
+        self.registerField('tiffEnabled',self.tiffCheckBox)
+        self.registerField('checksumEnabled',self.checksumCheckBox)
 
         self.layout = QtWidgets.QGridLayout()
         self.layout.addWidget(self.maxProjectionCheckBox, 0, 0)
+        self.layout.addWidget(self.previewCheckBox, 1, 0)
+        self.layout.addWidget(self.tiffCheckBox, 2, 0)
+        self.layout.addWidget(self.checksumCheckBox, 3, 0)
         self.setLayout(self.layout)
 
     def validatePage(self):
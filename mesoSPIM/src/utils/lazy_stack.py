@@ -0,0 +1,245 @@
+'''
+lazy_stack.py
+========================================
+
+Lazy, downsampled access to acquired stacks for the stack viewer
+
+A raw stack is opened as np.memmap with the dimensions from its _meta.txt file
+(compressed .craw stacks carry their dimensions in the header), nothing is read
+until a view needs it:
+
+    XY slices are read plane by plane (one plane is a contiguous block of the file)
+    and kept in a small cache of their own, so scrolling does not evict blocks
+    XZ/YZ slices and maximum projections come from a downsampled copy of the
+    stack, which is read in blocks of planes and kept in an LRU cache
+
+At level d, every d-th plane, row and column is read, so level 4 of a 100 GB
+stack is 1.6 GB. The coarsest levels are read first and shown while the finer
+levels are loading. Blocks that are not loaded yet are shown empty.
+'''
+
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+def get_metadata_path(path):
+    ''' stack.raw -> stack.raw_meta.txt '''
+    return path + '_meta.txt'
+
+def read_metadata_file(path):
+    '''Reads a _meta.txt file written by the core
+
+    Returns {section : {key : value}}, the values are strings. Lines before
+    the first section are in the section ''.
+    '''
+    metadata = {'' : {}}
+    section = ''
+    with open(path, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line.startswith('[') or ']' not in line:
+                continue
+            key, value = line[1:].split(']', 1)
+            value = value.strip()
+            if value == '':
+                section = key
+                metadata.setdefault(section, {})
+            else:
+                metadata[section][key] = value
+    return metadata
+
+def _find_value(metadata, key, sections):
+    for section in sections:
+        if key in metadata.get(section, {}):
+            return metadata[section][key]
+    return None
+
+def get_stack_geometry(path):
+    '''Returns (shape, pixelsize, z_step) of a stack
+
+    shape is (planes, rows, columns) of the images as saved. Stacks with a
+    different number of planes on disk (e.g. if the acquisition was stopped)
+    are opened with the planes that are complete.
+    '''
+    metadata_path = get_metadata_path(path)
+    metadata = read_metadata_file(metadata_path) if os.path.exists(metadata_path) else {}
+
+    pixelsize = float(_find_value(metadata, 'Pixelsize in um', ('CFG',)) or 1.0)
+    z_step = float(_find_value(metadata, 'z_stepsize', ('POSITION', '')) or 1.0)
+
+    if path.endswith('.craw'):
+        from .compressed_raw import CompressedRawReader
+        with CompressedRawReader(path) as stack:
+            return stack.shape, pixelsize, z_step
+
+    if not metadata:
+        raise ValueError(f'{metadata_path} not found, the dimensions of the stack are unknown')
+    rows = _find_value(metadata, 'image_rows', ('CAMERA PARAMETERS',)) or _find_value(metadata, 'x_pixels', ('CAMERA PARAMETERS',))
+    columns = _find_value(metadata, 'image_columns', ('CAMERA PARAMETERS',)) or _find_value(metadata, 'y_pixels', ('CAMERA PARAMETERS',))
+    planes = _find_value(metadata, 'z_planes', ('POSITION', ''))
+    if rows is None or columns is None or planes is None:
+        raise ValueError(f'{metadata_path} does not contain the dimensions of the stack')
+    rows, columns, planes = int(rows), int(columns), int(planes)
+
+    plane_bytes = rows * columns * 2
+    planes_on_disk = os.path.getsize(path) // plane_bytes
+    if planes_on_disk == 0 or os.path.getsize(path) % plane_bytes:
+        raise ValueError(f'The size of {path} does not match the image size {rows} x {columns} in {metadata_path}')
+    if planes_on_disk != planes:
+        logger.warning(f'Lazy stack: {path} contains {planes_on_disk} of {planes} planes')
+    return (min(planes, planes_on_disk), rows, columns), pixelsize, z_step
+
+class BlockCache(object):
+    ''' Thread-safe LRU cache of arrays with a limit in bytes '''
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.blocks = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            block = self.blocks.get(key)
+            if block is not None:
+                self.blocks.move_to_end(key)
+            return block
+
+    def put(self, key, block):
+        with self.lock:
+            if key in self.blocks:
+                self.bytes -= self.blocks.pop(key).nbytes
+            self.blocks[key] = block
+            self.bytes += block.nbytes
+            while self.bytes > self.max_bytes and len(self.blocks) > 1:
+                _, evicted = self.blocks.popitem(last=False)
+                self.bytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.blocks.clear()
+            self.bytes = 0
+
+class LazyStack(object):
+    '''Downsampled, cached access to a .raw or .craw stack
+
+    Args:
+        path (str): Stack file
+        cache_bytes (int): Memory for cached blocks
+        block_planes (int): Downsampled planes per block
+        plane_cache_bytes (int): Memory for cached XY planes
+    '''
+    def __init__(self, path, cache_bytes=2*1024**3, block_planes=32, plane_cache_bytes=256*1024**2):
+        self.path = path
+        self.shape, self.pixelsize, self.z_step = get_stack_geometry(path)
+        self.block_planes = block_planes
+        self.cache = BlockCache(cache_bytes)
+        self.plane_cache = BlockCache(plane_cache_bytes)
+
+        if path.endswith('.craw'):
+            from .compressed_raw import CompressedRawReader
+            self.stack = CompressedRawReader(path)
+        else:
+            self.stack = np.memmap(path, mode='r', dtype=np.uint16, shape=self.shape)
+
+    def get_levels(self):
+        ''' Downsampling levels 1, 2, 4, ... down to about 64 pixels '''
+        levels = [1]
+        while min(self.shape[1:]) // (levels[-1] * 2) >= 64:
+            levels.append(levels[-1] * 2)
+        return levels
+
+    def get_level_shape(self, level):
+        return tuple(-(-size // level) for size in self.shape)
+
+    def get_level_bytes(self, level):
+        return int(np.prod(self.get_level_shape(level))) * 2
+
+    def get_finest_level(self):
+        ''' The finest level whose blocks fit into half of the cache '''
+        for level in self.get_levels():
+            if self.get_level_bytes(level) <= self.cache.max_bytes // 2:
+                return level
+        return self.get_levels()[-1]
+
+    def fits_in_cache(self, level):
+        ''' Whether the blocks of this level and of all coarser levels fit into the cache together '''
+        return sum(self.get_level_bytes(other) for other in self.get_levels() if other >= level) <= self.cache.max_bytes
+
+    def get_block_count(self, level):
+        return -(-self.get_level_shape(level)[0] // self.block_planes)
+
+    def read_plane(self, plane, level=1):
+        ''' A plane downsampled by level, cached '''
+        key = (plane, level)
+        image = self.plane_cache.get(key)
+        if image is None:
+            image = np.ascontiguousarray(self.stack[plane][::level, ::level])
+            self.plane_cache.put(key, image)
+        return image
+
+    def read_block(self, level, block):
+        ''' Reads a block of planes at a level into the cache, returns the block '''
+        key = ('block', level, block)
+        data = self.cache.get(key)
+        if data is None:
+            planes = range(block * self.block_planes * level,
+                           min((block + 1) * self.block_planes * level, self.shape[0]), level)
+            data = np.stack([np.ascontiguousarray(self.stack[plane][::level, ::level]) for plane in planes])
+            self.cache.put(key, data)
+        return data
+
+    def is_loaded(self, level, block):
+        return self.cache.get(('block', level, block)) is not None
+
+    def get_loaded_block_count(self, level):
+        return sum(self.is_loaded(level, block) for block in range(self.get_block_count(level)))
+
+    def is_level_loaded(self, level):
+        return self.get_loaded_block_count(level) == self.get_block_count(level)
+
+    def _get_blocks(self, level):
+        ''' Yields (first plane of the level, block) for the cached blocks '''
+        for block in range(self.get_block_count(level)):
+            data = self.cache.get(('block', level, block))
+            if data is not None:
+                yield block * self.block_planes, data
+
+    def get_xz(self, row, level):
+        ''' (planes, columns) at a row of the full-resolution image '''
+        planes, _, columns = self.get_level_shape(level)
+        image = np.zeros((planes, columns), dtype=np.uint16)
+        for start, data in self._get_blocks(level):
+            image[start:start+len(data)] = data[:, min(row // level, data.shape[1]-1), :]
+        return image
+
+    def get_yz(self, column, level):
+        ''' (rows, planes) at a column of the full-resolution image '''
+        planes, rows, _ = self.get_level_shape(level)
+        image = np.zeros((rows, planes), dtype=np.uint16)
+        for start, data in self._get_blocks(level):
+            image[:, start:start+len(data)] = data[:, :, min(column // level, data.shape[2]-1)].T
+        return image
+
+    def get_projections(self, level):
+        ''' Maximum projections along z, rows and columns as (XY, XZ, YZ) '''
+        planes, rows, columns = self.get_level_shape(level)
+        xy = np.zeros((rows, columns), dtype=np.uint16)
+        xz = np.zeros((planes, columns), dtype=np.uint16)
+        yz = np.zeros((rows, planes), dtype=np.uint16)
+        for start, data in self._get_blocks(level):
+            np.maximum(xy, data.max(axis=0), out=xy)
+            xz[start:start+len(data)] = data.max(axis=1)
+            yz[:, start:start+len(data)] = data.max(axis=2).T
+        return xy, xz, yz
+
+    def close(self):
+        ''' A memmap is closed when the last reference is gone '''
+        self.cache.clear()
+        self.plane_cache.clear()
+        if not isinstance(self.stack, np.memmap):
+            self.stack.close()
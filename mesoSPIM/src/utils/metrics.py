@@ -0,0 +1,211 @@
+'''
+metrics.py
+========================================
+
+Performance counters & gauges and an optional local HTTP endpoint publishing them
+
+The devices update the metrics from their own threads via the module-level
+``metrics`` registry. The HTTP server runs in a plain Python daemon thread and
+only reads a locked copy of the values, so scraping never touches the GUI or
+any of the Qt worker threads.
+
+Endpoints:
+    /metrics        Prometheus text format
+    /metrics.json   The same values as JSON
+
+The endpoint is opt-in via the config file:
+
+    metrics_parameters = {'enabled' : True,
+                          'host' : '127.0.0.1',
+                          'port' : 9110,
+                          'microscope_name' : 'mesoSPIM-1'}
+'''
+
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import logging
+logger = logging.getLogger(__name__)
+
+''' Metric name : (type, help text) '''
+metric_definitions = {
+    'frames_acquired_total' : ('counter', 'Frames read out from the camera in acquisitions'),
+    'frames_written_total' : ('counter', 'Frames written to disk'),
+    'bytes_written_total' : ('counter', 'Bytes written to disk'),
+    'dropped_frames_total' : ('counter', 'Frames missing according to the camera frame counter'),
+    'frames_per_second' : ('gauge', 'Current camera frame rate (acquisition and live mode)'),
+    'bytes_per_second' : ('gauge', 'Current data rate to disk'),
+    'writer_queue_depth' : ('gauge', 'Frames triggered but not yet written to disk'),
+    'acquisition_images_done' : ('gauge', 'Images acquired in the current acquisition list'),
+    'acquisition_images_total' : ('gauge', 'Images in the current acquisition list'),
+    'acquisition_remaining_seconds' : ('gauge', 'Predicted remaining time of the acquisition list'),
+    'stage_command_latency_seconds' : ('summary', 'Time spent in stage move commands'),
+    'waveform_regeneration_seconds' : ('summary', 'Time needed to recalculate the waveforms'),
+    'focus_metric' : ('gauge', 'Sharpness of the last measured frame'),
+    'camera_frame_mismatches_total' : ('counter', 'Planes where the frame numbers of several cameras differ'),
+    'missing_planes_total' : ('counter', 'Planes without a frame, written empty'),
+    'repaired_planes_total' : ('counter', 'Missing planes re-acquired after the stack'),
+    'postprocessing_jobs_queued' : ('gauge', 'Post-processing jobs waiting for a worker'),
+    'postprocessing_jobs_running' : ('gauge', 'Post-processing jobs running in the worker processes'),
+    'postprocessing_jobs_failed_total' : ('counter', 'Post-processing jobs that raised an error'),
+    'snaps_pending' : ('gauge', 'Snapped images waiting to be written'),
+    'state_requests_total' : ('counter', 'State requests dispatched by the core, cameras and waveform generator'),
+    'jog_moves_total' : ('counter', 'Relative moves sent by the joystick jog controller'),
+}
+
+class MetricsRegistry(object):
+    '''Thread-safe store for the mesoSPIM metrics
+
+    All update methods return immediately if the registry is disabled, so the
+    instrumentation costs next to nothing when nobody is scraping.
+    '''
+    def __init__(self, definitions):
+        self.definitions = definitions
+        self.enabled = False
+        self.labels = {}
+        self.lock = threading.Lock()
+        self.values = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            for name, (metric_type, _) in self.definitions.items():
+                if metric_type == 'summary':
+                    self.values[name] = {'sum' : 0.0, 'count' : 0, 'last' : 0.0}
+                else:
+                    self.values[name] = 0.0
+
+    def inc(self, name, value=1):
+        if self.enabled:
+            with self.lock:
+                self.values[name] += value
+
+    def set(self, name, value):
+        if self.enabled:
+            with self.lock:
+                self.values[name] = value
+
+    def observe(self, name, value):
+        if self.enabled:
+            with self.lock:
+                summary = self.values[name]
+                summary['sum'] += value
+                summary['count'] += 1
+                summary['last'] = value
+
+    def snapshot(self):
+        with self.lock:
+            return {name : (dict(value) if isinstance(value, dict) else value) for name, value in self.values.items()}
+
+    def to_prometheus(self, prefix='mesospim_'):
+        values = self.snapshot()
+        label_string = ','.join(f'{key}="{value}"' for key, value in self.labels.items())
+        label_string = '{'+label_string+'}' if label_string else ''
+
+        lines = []
+        for name, (metric_type, help_text) in self.definitions.items():
+            full_name = prefix + name
+            lines.append(f'# HELP {full_name} {help_text}')
+            lines.append(f'# TYPE {full_name} {metric_type}')
+            if metric_type == 'summary':
+                lines.append(f'{full_name}_sum{label_string} {values[name]["sum"]}')
+                lines.append(f'{full_name}_count{label_string} {values[name]["count"]}')
+            else:
+                lines.append(f'{full_name}{label_string} {values[name]}')
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry(metric_definitions)
+
+class FrameRateMeter(object):
+    '''Smoothed frame rate from the intervals between frames
+
+    Args:
+        smoothing (float): Weight of the newest interval (exponential moving average)
+    '''
+    def __init__(self, smoothing=0.1):
+        self.smoothing = smoothing
+        self.reset()
+
+    def reset(self):
+        self.last_time = None
+        self.interval = None
+
+    def update(self, frames=1):
+        ''' Returns the current frame rate in frames per second '''
+        now = time.time()
+        if self.last_time is not None and frames > 0:
+            interval = (now - self.last_time)/frames
+            if self.interval is None:
+                self.interval = interval
+            else:
+                self.interval = self.smoothing * interval + (1-self.smoothing) * self.interval
+        self.last_time = now
+
+        if self.interval:
+            return 1/self.interval
+        else:
+            return 0.0
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == '/metrics':
+            body = metrics.to_prometheus().encode('utf-8')
+            content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        elif self.path == '/metrics.json':
+            body = json.dumps({'labels' : metrics.labels,
+                               'time' : time.time(),
+                               'metrics' : metrics.snapshot()}).encode('utf-8')
+            content_type = 'application/json'
+        else:
+            self.send_error(404)
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        ''' Keep scrapes out of the log '''
+        pass
+
+class mesoSPIM_MetricsServer(object):
+    '''HTTP server publishing the metrics registry in a daemon thread'''
+    def __init__(self, host='127.0.0.1', port=9110, microscope_name=None):
+        self.host = host
+        self.port = port
+        if microscope_name:
+            metrics.labels = {'microscope' : microscope_name}
+
+        self.server = ThreadingHTTPServer((self.host, self.port), _MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name='mesoSPIM_MetricsServer', daemon=True)
+
+    def start(self):
+        metrics.enabled = True
+        self.thread.start()
+        logger.info(f'Metrics server: Serving on http://{self.host}:{self.port}/metrics')
+
+    def stop(self):
+        metrics.enabled = False
+        self.server.shutdown()
+        self.server.server_close()
+
+def start_metrics_server_from_config(cfg):
+    '''Starts the metrics server if enabled in the config - returns the server or None'''
+    if not hasattr(cfg, 'metrics_parameters') or not cfg.metrics_parameters.get('enabled', False):
+        return None
+
+    parameters = cfg.metrics_parameters
+    try:
+        server = mesoSPIM_MetricsServer(host=parameters.get('host', '127.0.0.1'),
+                                        port=parameters.get('port', 9110),
+                                        microscope_name=parameters.get('microscope_name', None))
+        server.start()
+        return server
+    except OSError:
+        logger.error('Metrics server could not be started', exc_info=True)
+        return None
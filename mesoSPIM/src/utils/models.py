@@ -1,11 +1,12 @@
 from PyQt5 import QtWidgets, QtGui, QtCore, QtDesigner
 
 from .acquisitions import Acquisition, AcquisitionList
+from .acquisition_table import AcquisitionTable
+from .acquisition_io import load_acquisition_list, save_acquisition_list
 
 from ..mesoSPIM_State import mesoSPIM_StateSingleton
 
 import copy
-import pickle
 
 class AcquisitionModel(QtCore.QAbstractTableModel):
     '''
@@ -14,6 +15,11 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
     The headers are derived from the keys of the first acquisition
     dictionary.
 
+    In parallel to the AcquisitionList, the model keeps a column-oriented
+    AcquisitionTable up to date which provides the plane count, time estimate
+    and filename checks without looping over all rows. All changes to the
+    list have to go through the model for this to work.
+
     TODO: Typecheck in __init__ for AcquisitionList as table
     '''
     def __init__(self, table = None, parent = None):
@@ -27,6 +33,8 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
         ''' Get the headers as the capitalized keys from the first acquisition '''
         self._headers = self._table.get_capitalized_keylist()
 
+        self._acquisition_table = AcquisitionTable.from_acquisition_list(self._table)
+
         self.state = mesoSPIM_StateSingleton()
 
         self.dataChanged.connect(self.updatePlanes)
@@ -107,7 +115,9 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
                 - if d is the indexed dict, then
                 - d[d.keys()[column]] = new_value allow that
                 '''
-                self._table[row][self._table[row].keys()[column]] = value
+                key = self._table[row].keys()[column]
+                self._table[row][key] = value
+                self._acquisition_table.set_value(row, key, value)
                 self.dataChanged.emit(index, index)
                 #print('Data changed')
                 return True
@@ -164,6 +174,7 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
             # defaultValues = ['Default' for i in range(self.columnCount(parent))]
             # defaultValues = ['Default',1,'One',50,56]
             self._table.insert(position, Acquisition())
+            self._acquisition_table.insert(position, self._table[position])
 
         ''' Sending the required signal '''
         self.endInsertRows()
@@ -175,6 +186,7 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
 
         for i in range(rows):
             del self._table[position]
+            self._acquisition_table.delete(position)
 
         self.endRemoveRows()
         return True
@@ -184,6 +196,7 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
         old_row = copy.deepcopy(self._table[row])
         self.insertRow(row)
         self._table[row] = old_row
+        self._acquisition_table.replace(row, old_row)
         self.send_data_changed()
 
     # def supportedDropActions(self):
@@ -238,15 +251,18 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
             ''' Remove the sublist from the list '''
             for i in range(count):
                 extracted_list.append(self._table.pop(source_row))
+                self._acquisition_table.delete(source_row)
 
             ''' Go through the sublist and add its items '''
             for i in range(count):
                 ''' As the _table was shortened during modification, the destination_row has to
                 be adapted for insertion as well. '''
                 if destination_row > source_row:
-                    self._table.insert(destination_row-count+1,extracted_list.pop(len(extracted_list)-1))
+                    insert_row = destination_row-count+1
                 else:
-                    self._table.insert(destination_row,extracted_list.pop(len(extracted_list)-1))
+                    insert_row = destination_row
+                self._table.insert(insert_row,extracted_list.pop(len(extracted_list)-1))
+                self._acquisition_table.insert(insert_row, self._table[insert_row])
 
             self.send_data_changed()
             return True
@@ -313,7 +329,15 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
 
     def getTotalImageCount(self):
         ''' gets the total number of planes from the model '''
-        return self._table.get_image_count()
+        return self._acquisition_table.get_image_count()
+
+    def getAcquisitionTime(self, framerate):
+        ''' gets the predicted time for the whole table in seconds '''
+        return self._acquisition_table.get_acquisition_time(framerate)
+
+    def getAcquisitionTable(self):
+        ''' gets the column-oriented AcquisitionTable kept in sync with the model '''
+        return self._acquisition_table
 
     def get_acquisition_list(self, row=None):
         if row is None:
@@ -322,20 +346,24 @@ class AcquisitionModel(QtCore.QAbstractTableModel):
             return AcquisitionList([self._table[row]])
 
     def saveModel(self, filename):
-        ''' Allows to serialize a model via pickle '''
-        pickle.dump(self._table, open(filename, "wb" ))
+        ''' Saves the table in the versioned acquisition list format (JSON lines) '''
+        save_acquisition_list(filename, self._table)
 
     def setTable(self, table):
         self.modelAboutToBeReset.emit()
         self._table = table
+        self._acquisition_table = AcquisitionTable.from_acquisition_list(self._table)
         self.modelReset.emit()
 
     def loadModel(self, filename):
         self.modelAboutToBeReset.emit()
-        self._table = pickle.load(open(filename, "rb" ))
+        ''' Tables pickled by previous versions are still accepted '''
+        self._table = load_acquisition_list(filename)
+        self._acquisition_table = AcquisitionTable.from_acquisition_list(self._table)
         self.modelReset.emit()
 
     def deleteTable(self):
         self.modelAboutToBeReset.emit()
         self._table = AcquisitionList()
+        self._acquisition_table = AcquisitionTable.from_acquisition_list(self._table)
         self.modelReset.emit()
@@ -0,0 +1,86 @@
+'''
+multicamera.py
+========================================
+
+Configuration and frame counter cross-check for setups with several cameras
+
+All cameras are triggered by the same waveform generator. Every camera runs in
+its own thread with its own writer, so two cameras (e.g. two detection paths or
+one camera per emission band) write twice the data in the time of one stack.
+
+Without multicamera_parameters in the config, a single camera is set up from
+camera and camera_parameters as before:
+
+    multicamera_parameters = {'enabled' : True,
+                              'cameras' : [{'name' : 'cam0',
+                                            'camera' : 'HamamatsuOrca',
+                                            'camera_parameters' : camera_parameters_0},
+                                           {'name' : 'cam1',
+                                            'camera' : 'HamamatsuOrca',
+                                            'camera_parameters' : camera_parameters_1,
+                                            'filename_suffix' : '_cam1'}]}
+
+The first camera is the primary camera: It is displayed in the camera window
+and used for the focus measurements. The files of the other cameras get a
+suffix before the extension (default: _<name>), e.g. stack_cam1.raw.
+
+For every plane, the frame numbers reported by the cameras (relative to the
+start of the stack) are compared after the stack. As all cameras see the same
+triggers, any difference means that a camera missed or duplicated a frame.
+'''
+
+import os
+
+import numpy as np
+
+def get_camera_configs(cfg):
+    '''Returns a list of dicts with name, camera, camera_parameters and filename_suffix'''
+    if not hasattr(cfg, 'multicamera_parameters') or not cfg.multicamera_parameters.get('enabled', False):
+        return [{'name' : cfg.camera,
+                 'camera' : cfg.camera,
+                 'camera_parameters' : cfg.camera_parameters,
+                 'filename_suffix' : ''}]
+
+    camera_configs = []
+    for index, camera_config in enumerate(cfg.multicamera_parameters['cameras']):
+        name = camera_config.get('name', f'cam{index}')
+        camera_configs.append({'name' : name,
+                               'camera' : camera_config.get('camera', cfg.camera),
+                               'camera_parameters' : camera_config.get('camera_parameters', cfg.camera_parameters),
+                               'filename_suffix' : camera_config.get('filename_suffix', '' if index == 0 else '_'+name)})
+
+    suffixes = [camera_config['filename_suffix'] for camera_config in camera_configs]
+    if len(set(suffixes)) != len(suffixes):
+        raise ValueError(f'The filename suffixes of the cameras have to be different: {suffixes}')
+    return camera_configs
+
+def add_filename_suffix(filename, suffix):
+    ''' stack.raw -> stack_cam1.raw '''
+    if not suffix:
+        return filename
+    root, extension = os.path.splitext(filename)
+    return root + suffix + extension
+
+def compare_frame_numbers(traces):
+    '''Cross-checks the frame numbers of the cameras plane by plane
+
+    Args:
+        traces (list): TimingTrace of every camera, the first one is the reference
+
+    Returns a dict for the metadata file: number of planes where the frame
+    numbers differ from the first camera, the first of these planes and the
+    planes without a frame per camera.
+    '''
+    reference = traces[0].data['frame_number']
+    mismatched = np.zeros(len(reference), dtype=bool)
+    missing = []
+    for trace in traces:
+        frame_numbers = trace.data['frame_number']
+        mismatched |= frame_numbers != reference
+        missing.append(int((frame_numbers < 0).sum()))
+
+    planes = np.flatnonzero(mismatched)
+    return {'cameras' : len(traces),
+            'planes_with_mismatched_frame_numbers' : len(planes),
+            'first_mismatched_plane' : int(planes[0]) if len(planes) else -1,
+            'planes_without_frame' : missing}
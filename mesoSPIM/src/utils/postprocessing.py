@@ -0,0 +1,297 @@
+'''
+postprocessing.py
+========================================
+
+Background post-processing of finished stacks in a process pool
+
+After a stack has been written, the jobs of its "Processing" column are queued
+and run in worker processes, so the next stack starts right away. The worker
+processes read the finished files via np.memmap (or the plane index of
+compressed stacks) and never hold a full stack in memory.
+
+Jobs (comma-separated in the Processing column, e.g. "MAX,SHA256"):
+
+    MAX       Maximum projection, MAX_<filename>.tif
+    PREVIEW   Stack downsampled in x, y and z, <filename>_preview.tif
+    TIFF      OME-TIFF copy of the stack (BigTIFF), <filename without .raw>.ome.tif
+    SHA256    Checksum of the written file, <file>.sha256 (sha256sum format)
+
+Jobs with a lower priority number run first. Only as many jobs as there are
+workers are handed to the pool at a time, the others wait in a priority
+queue. The worker processes run with a lower scheduling priority (nice) and,
+where supported, on a restricted set of CPUs, so they do not compete with
+the acquisition:
+
+    postprocessing_parameters = {'workers' : 1,
+                                 'nice' : 10,
+                                 'cpu_affinity' : None,
+                                 'default_jobs' : ['SHA256'],
+                                 'preview_downsampling' : 4}
+'''
+
+import os
+import heapq
+import hashlib
+import itertools
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from PyQt5 import QtCore
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .metrics import metrics
+
+''' Default priorities, lower numbers run first '''
+job_priorities = {'SHA256' : 0,
+                  'MAX' : 1,
+                  'PREVIEW' : 2,
+                  'TIFF' : 3}
+
+def get_postprocessing_parameters_from_config(cfg):
+    '''Returns the post-processing parameters with defaults
+
+    workers: Number of worker processes
+    nice: Scheduling priority increment of the workers (0 keeps the priority)
+    cpu_affinity: List of CPUs for the workers (Linux only), None uses all CPUs
+    default_jobs: Jobs for every stack in addition to the Processing column
+    priorities: Job -> priority, overrides job_priorities
+    preview_downsampling: Downsampling of the PREVIEW job in x, y and z
+    '''
+    parameters = {'workers' : 1,
+                  'nice' : 10,
+                  'cpu_affinity' : None,
+                  'default_jobs' : [],
+                  'priorities' : {},
+                  'preview_downsampling' : 4}
+    if hasattr(cfg, 'postprocessing_parameters'):
+        parameters.update(cfg.postprocessing_parameters)
+    return parameters
+
+def parse_processing_string(string):
+    ''' "MAX, tiff" -> ['MAX', 'TIFF'] '''
+    return [job.strip().upper() for job in str(string).split(',') if job.strip()]
+
+def limit_worker_process(nice=10, cpu_affinity=None):
+    ''' Initializer of the worker processes '''
+    if nice:
+        if hasattr(os, 'nice'):
+            os.nice(nice)
+        else:
+            try:
+                import psutil
+                psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+            except ImportError:
+                pass
+    if cpu_affinity and hasattr(os, 'sched_setaffinity'):
+        os.sched_setaffinity(0, cpu_affinity)
+
+def iter_planes(path, shape):
+    ''' Yields the planes of a .raw or .craw stack '''
+    if path.endswith('.craw'):
+        from .compressed_raw import CompressedRawReader
+        with CompressedRawReader(path) as stack:
+            for plane in stack:
+                yield plane
+    else:
+        stack = np.memmap(path, mode='r', dtype=np.uint16, shape=tuple(shape))
+        for plane in stack:
+            yield plane
+        del stack
+
+def max_projection(job):
+    projection = np.zeros(job['shape'][1:], dtype=np.uint16)
+    for plane in iter_planes(job['path'], job['shape']):
+        np.maximum(projection, plane, out=projection)
+
+    import tifffile
+    output = os.path.join(job['folder'], 'MAX_' + job['filename'] + '.tif')
+    tifffile.imwrite(output, projection, photometric='minisblack')
+    return output
+
+def downsampled_preview(job):
+    ''' Block mean over downsampling x downsampling pixels and downsampling planes '''
+    factor = job['preview_downsampling']
+    rows = job['shape'][1] // factor * factor
+    columns = job['shape'][2] // factor * factor
+
+    preview = []
+    block = np.zeros((rows//factor, columns//factor), dtype=np.float64)
+    count = 0
+    for plane in iter_planes(job['path'], job['shape']):
+        block += plane[:rows, :columns].reshape(rows//factor, factor, columns//factor, factor).mean(axis=(1, 3))
+        count += 1
+        if count == factor:
+            preview.append((block / count).astype(np.uint16))
+            block[:] = 0
+            count = 0
+    if count:
+        preview.append((block / count).astype(np.uint16))
+
+    import tifffile
+    output = os.path.join(job['folder'], job['filename'] + '_preview.tif')
+    tifffile.imwrite(output, np.stack(preview), photometric='minisblack')
+    return output
+
+def tiff_conversion(job):
+    ''' Writes the planes one by one, the stack is never loaded completely '''
+    import tifffile
+    root, extension = os.path.splitext(job['filename'])
+    output = os.path.join(job['folder'], (root if extension == '.raw' else job['filename']) + '.ome.tif')
+    metadata = {'axes' : 'ZYX',
+                'PhysicalSizeX' : job['pixelsize'],
+                'PhysicalSizeY' : job['pixelsize'],
+                'PhysicalSizeZ' : job['z_step']}
+    tifffile.imwrite(output, iter_planes(job['path'], job['shape']), shape=tuple(job['shape']), dtype=np.uint16,
+                     bigtiff=True, ome=True, photometric='minisblack', metadata=metadata)
+    return output
+
+def checksum(job, chunk_size=16*1024**2):
+    sha256 = hashlib.sha256()
+    with open(job['path'], 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            sha256.update(chunk)
+
+    output = job['path'] + '.sha256'
+    with open(output, 'w') as file:
+        file.write(f'{sha256.hexdigest()}  {os.path.basename(job["path"])}\n')
+    return output
+
+job_functions = {'MAX' : max_projection,
+                 'PREVIEW' : downsampled_preview,
+                 'TIFF' : tiff_conversion,
+                 'SHA256' : checksum}
+
+def run_job(job):
+    ''' Runs in a worker process, returns the path of the result '''
+    return job_functions[job['kind']](job)
+
+class PostProcessingQueue(QtCore.QObject):
+    '''Priority queue of post-processing jobs in front of a process pool
+
+    sig_status is emitted with get_status() whenever a job is queued or
+    finished (from the thread that finished the job).
+    '''
+    sig_status = QtCore.pyqtSignal(dict)
+
+    def __init__(self, workers=1, nice=10, cpu_affinity=None, default_jobs=(), priorities=None,
+                 preview_downsampling=4):
+        super().__init__()
+        self.workers = max(int(workers), 1)
+        self.nice = nice
+        self.cpu_affinity = cpu_affinity
+        self.default_jobs = parse_processing_string(','.join(default_jobs))
+        self.priorities = dict(job_priorities, **(priorities or {}))
+        self.preview_downsampling = preview_downsampling
+
+        self.executor = None
+        ''' Reentrant: add_done_callback calls _job_finished right away if a job is already done '''
+        self.lock = threading.RLock()
+        self.queue = []
+        self.sequence = itertools.count()
+        self.running = {}
+        self.done = 0
+        self.failed = 0
+        ''' The last finished jobs for the GUI '''
+        self.history = deque(maxlen=20)
+
+    def submit_stack(self, acq, path, shape, filename, pixelsize):
+        '''Queues the jobs of a finished stack
+
+        Args:
+            acq (Acquisition): Row of the acquisition list, its Processing column selects the jobs
+            path (str): File as written (.raw or .craw)
+            shape (tuple): (planes, rows, columns)
+            filename (str): Filename of the camera (with the camera suffix)
+        '''
+        kinds = parse_processing_string(acq['processing'])
+        kinds += [kind for kind in self.default_jobs if kind not in kinds]
+        for kind in kinds:
+            if kind not in job_functions:
+                logger.warning(f'Post-processing: Unknown job {kind}, use one of {list(job_functions)}')
+                continue
+            self.submit({'kind' : kind,
+                         'path' : path,
+                         'shape' : tuple(shape),
+                         'folder' : acq['folder'],
+                         'filename' : filename,
+                         'pixelsize' : pixelsize,
+                         'z_step' : acq['z_step'],
+                         'preview_downsampling' : self.preview_downsampling})
+
+    def submit(self, job):
+        with self.lock:
+            heapq.heappush(self.queue, (self.priorities.get(job['kind'], 10), next(self.sequence), job))
+            self._start_jobs()
+        self.update_status()
+
+    def _start_jobs(self):
+        ''' Hands jobs to the pool until all workers are busy, needs the lock '''
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=limit_worker_process,
+                                                initargs=(self.nice, self.cpu_affinity))
+        while self.queue and len(self.running) < self.workers:
+            _, _, job = heapq.heappop(self.queue)
+            future = self.executor.submit(run_job, job)
+            self.running[future] = job
+            future.add_done_callback(self._job_finished)
+
+    def _job_finished(self, future):
+        with self.lock:
+            job = self.running.pop(future)
+            try:
+                output = future.result()
+                self.done += 1
+                self.history.append(f'{job["kind"]} {job["filename"]}: {os.path.basename(output)}')
+                logger.info(f'Post-processing: {job["kind"]} of {job["path"]} finished: {output}')
+            except Exception as error:
+                self.failed += 1
+                metrics.inc('postprocessing_jobs_failed_total')
+                self.history.append(f'{job["kind"]} {job["filename"]}: failed ({error})')
+                logger.error(f'Post-processing: {job["kind"]} of {job["path"]} failed', exc_info=True)
+            if self.executor is not None:
+                self._start_jobs()
+        self.update_status()
+
+    def get_status(self):
+        with self.lock:
+            return {'queued' : len(self.queue),
+                    'running' : len(self.running),
+                    'done' : self.done,
+                    'failed' : self.failed,
+                    'history' : list(self.history)}
+
+    def update_status(self):
+        status = self.get_status()
+        metrics.set('postprocessing_jobs_queued', status['queued'])
+        metrics.set('postprocessing_jobs_running', status['running'])
+        self.sig_status.emit(status)
+
+    def shutdown(self, wait=False):
+        '''Stops the worker processes
+
+        Args:
+            wait (bool): Run all queued jobs first, otherwise they are dropped
+        '''
+        if wait:
+            with self.lock:
+                futures = list(self.running)
+            while futures:
+                for future in futures:
+                    future.exception()
+                with self.lock:
+                    futures = list(self.running)
+        with self.lock:
+            if self.queue:
+                logger.warning(f'Post-processing: {len(self.queue)} queued jobs were not run')
+            self.queue = []
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+def get_postprocessing_queue_from_config(cfg):
+    return PostProcessingQueue(**get_postprocessing_parameters_from_config(cfg))
@@ -0,0 +1,300 @@
+'''
+raw_writers.py
+========================================
+
+Writers for the .raw stacks of the camera
+
+All writers produce the same file layout: the planes are written one after the
+other as uint16 in the order they are handed to the writer (no header).
+
+    MemmapRawWriter         np.memmap, relies on the page cache (default)
+    PreallocatedRawWriter   Preallocates the file, collects planes in a page-aligned
+                            staging buffer and writes them in batches. On Linux,
+                            the batches are written with O_DIRECT (bypassing the
+                            page cache) or, if that is not possible, the written
+                            pages are dropped from the cache with posix_fadvise.
+    CompressedRawWriter     Compressed stack with a plane index (.craw),
+                            see compressed_raw.py
+
+Planes of a closed stack can be overwritten with replace_planes(), e.g. with
+planes that were re-acquired after a frame loss (see frame_check.py). With
+start_plane, a writer continues an existing file of a stack that was
+interrupted (see acquisition_journal.py).
+
+The writer is selected in the config file:
+
+    raw_writer_parameters = {'writer' : 'preallocated',
+                             'batch_planes' : 4,
+                             'direct_io' : True,
+                             'drop_page_cache' : True}
+'''
+
+import os
+import mmap
+import time
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+class RawWriter(object):
+    '''Base class of the raw writers
+
+    Args:
+        path (str): File path
+        x_pixels, y_pixels (int): Shape of a flattened plane
+        planes (int): Number of planes in the stack
+        start_plane (int): Continue an existing file at this plane, the
+            planes before it are kept
+
+    Planes are written sequentially with write_plane(), after close()
+    the stack can be read back with get_stack() (e.g. for projections).
+    planes_on_disk is the number of planes that have been handed to the
+    operating system, i.e. that survive a crash of the software.
+    '''
+    ''' Keyword arguments taken from the raw_writer_parameters '''
+    options = ()
+
+    def __init__(self, path, x_pixels, y_pixels, planes, start_plane=0):
+        self.path = path
+        self.x_pixels = x_pixels
+        self.y_pixels = y_pixels
+        self.planes = planes
+        self.plane_size = x_pixels * y_pixels
+        self.plane_bytes = self.plane_size * 2
+
+        self.planes_written = start_plane
+        self.bytes_written = 0
+        self.write_seconds = 0
+        self.open_time = time.perf_counter()
+        self.last_write_time = self.open_time
+
+    def write_plane(self, image):
+        raise NotImplementedError
+
+    @property
+    def planes_on_disk(self):
+        return self.planes_written
+
+    def close(self):
+        pass
+
+    def get_stack(self):
+        ''' Returns the stack as array of shape (planes, x_pixels, y_pixels) '''
+        return np.memmap(self.path, mode='r', dtype=np.uint16, shape=(self.planes, self.x_pixels, self.y_pixels))
+
+    def _add_to_statistics(self, number_of_bytes, start_time):
+        now = time.perf_counter()
+        self.bytes_written += number_of_bytes
+        self.write_seconds += now - start_time
+        self.last_write_time = now
+
+    def get_statistics(self):
+        '''Returns a dict with the write throughput in bytes/s
+
+        write_throughput: Bytes divided by the time spent in write calls
+        sustained_throughput: Bytes divided by the time between opening the file and the last write
+        '''
+        elapsed = self.last_write_time - self.open_time
+        return {'planes_written' : self.planes_written,
+                'bytes_written' : self.bytes_written,
+                'write_seconds' : self.write_seconds,
+                'write_throughput' : self.bytes_written/self.write_seconds if self.write_seconds else 0.0,
+                'sustained_throughput' : self.bytes_written/elapsed if elapsed else 0.0}
+
+class MemmapRawWriter(RawWriter):
+    ''' The writer used so far: A memory-mapped file of the full stack size '''
+    def __init__(self, path, x_pixels, y_pixels, planes, start_plane=0):
+        super().__init__(path, x_pixels, y_pixels, planes, start_plane)
+        self.stack = np.memmap(path, mode='r+' if start_plane else 'write', dtype=np.uint16, shape=self.plane_size * planes)
+
+    def write_plane(self, image):
+        if self.planes_written >= self.planes:
+            raise IndexError(f'{self.path} only has {self.planes} planes')
+        start_time = time.perf_counter()
+        self.stack[self.planes_written*self.plane_size:(self.planes_written+1)*self.plane_size] = image
+        self._add_to_statistics(self.plane_bytes, start_time)
+        self.planes_written += 1
+
+    def close(self):
+        self.stack.flush()
+
+    def get_stack(self):
+        stackview = self.stack.view()
+        stackview.shape = (self.planes, self.x_pixels, self.y_pixels)
+        return stackview
+
+class PreallocatedRawWriter(RawWriter):
+    '''Preallocated file written in page-aligned batches
+
+    Args:
+        batch_planes (int): Number of planes collected before a write
+        direct_io (bool): Open the file with O_DIRECT where available (Linux)
+        drop_page_cache (bool): Without O_DIRECT, ask the OS to write back
+            and drop written pages from the cache (posix_fadvise)
+
+    On systems without O_DIRECT or posix_fadvise (Windows), the file is still
+    preallocated and written in large sequential batches.
+    '''
+    alignment = mmap.PAGESIZE
+    options = ('batch_planes', 'direct_io', 'drop_page_cache')
+
+    def __init__(self, path, x_pixels, y_pixels, planes, start_plane=0, batch_planes=4, direct_io=True, drop_page_cache=True):
+        super().__init__(path, x_pixels, y_pixels, planes, start_plane)
+        self.batch_planes = max(int(batch_planes), 1)
+        self.file_size = self.plane_bytes * planes
+
+        flags = os.O_WRONLY | os.O_CREAT | getattr(os, 'O_BINARY', 0)
+        if not start_plane:
+            flags |= os.O_TRUNC
+        self.file_offset = start_plane * self.plane_bytes
+
+        self.direct_io = False
+        ''' O_DIRECT writes have to start at an aligned offset '''
+        if direct_io and hasattr(os, 'O_DIRECT') and self.file_offset % self.alignment == 0:
+            try:
+                self.fd = os.open(path, flags | os.O_DIRECT)
+                self.direct_io = True
+            except OSError:
+                ''' Some file systems (e.g. tmpfs) do not support O_DIRECT '''
+                logger.info(f'Raw writer: O_DIRECT not supported for {path}, using buffered writes')
+        if not self.direct_io:
+            self.fd = os.open(path, flags)
+
+        self.drop_page_cache = drop_page_cache and not self.direct_io and hasattr(os, 'posix_fadvise')
+        self.preallocate()
+        os.lseek(self.fd, self.file_offset, os.SEEK_SET)
+
+        ''' Anonymous mmaps are page-aligned as O_DIRECT requires. The extra page
+        holds the unaligned remainder that is carried over to the next batch '''
+        self.buffer = mmap.mmap(-1, self.batch_planes * self.plane_bytes + self.alignment)
+        self.buffer_view = memoryview(self.buffer)
+        self.fill = 0
+        self.previous_batch = None
+
+    @property
+    def planes_on_disk(self):
+        return self.file_offset // self.plane_bytes
+
+    def preallocate(self):
+        if self.file_size == 0:
+            return
+        try:
+            os.posix_fallocate(self.fd, 0, self.file_size)
+        except (AttributeError, OSError):
+            ''' No fallocate (Windows) or not supported by the file system '''
+            os.ftruncate(self.fd, self.file_size)
+
+    def write_plane(self, image):
+        if self.planes_written >= self.planes:
+            raise IndexError(f'{self.path} only has {self.planes} planes')
+        data = np.ascontiguousarray(image, dtype=np.uint16).view(np.uint8).ravel()
+        self.buffer_view[self.fill:self.fill+len(data)] = data
+        self.fill += len(data)
+        self.planes_written += 1
+
+        if self.planes_written % self.batch_planes == 0:
+            self.flush_buffer()
+
+    def flush_buffer(self, final=False):
+        if self.direct_io and not final:
+            ''' O_DIRECT needs lengths that are a multiple of the block size '''
+            length = self.fill - self.fill % self.alignment
+        else:
+            length = self.fill
+
+        if length > 0:
+            start_time = time.perf_counter()
+            written = 0
+            while written < length:
+                written += os.write(self.fd, self.buffer_view[written:length])
+            self._add_to_statistics(length, start_time)
+
+            if self.drop_page_cache:
+                self.advise_page_cache(self.file_offset, length)
+            self.file_offset += length
+
+            remainder = self.fill - length
+            if remainder:
+                self.buffer_view[:remainder] = self.buffer_view[length:self.fill]
+            self.fill = remainder
+
+    def advise_page_cache(self, offset, length):
+        '''POSIX_FADV_DONTNEED starts the write-back of the new batch and drops
+        the previous batch from the cache, which has been written back by now'''
+        os.posix_fadvise(self.fd, offset, length, os.POSIX_FADV_DONTNEED)
+        if self.previous_batch is not None:
+            os.posix_fadvise(self.fd, *self.previous_batch, os.POSIX_FADV_DONTNEED)
+        self.previous_batch = (offset, length)
+
+    def close(self):
+        if self.fd is None:
+            return
+
+        self.flush_buffer()
+        if self.fill:
+            if self.direct_io:
+                ''' The unaligned end of the file is written without O_DIRECT '''
+                import fcntl
+                fcntl.fcntl(self.fd, fcntl.F_SETFL, fcntl.fcntl(self.fd, fcntl.F_GETFL) & ~os.O_DIRECT)
+            self.flush_buffer(final=True)
+
+        if self.drop_page_cache:
+            os.fdatasync(self.fd)
+            os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+        os.close(self.fd)
+        self.fd = None
+        self.buffer_view.release()
+        self.buffer.close()
+
+raw_writers = {'memmap' : MemmapRawWriter,
+               'preallocated' : PreallocatedRawWriter}
+
+def replace_planes(path, x_pixels, y_pixels, images):
+    '''Overwrites planes of a closed stack
+
+    Args:
+        images (dict): plane -> image with x_pixels*y_pixels pixels
+    '''
+    if path.endswith('.craw'):
+        from .compressed_raw import replace_compressed_planes
+        replace_compressed_planes(path, images)
+        return
+
+    plane_bytes = x_pixels * y_pixels * 2
+    with open(path, 'r+b') as file:
+        for plane, image in sorted(images.items()):
+            file.seek(plane * plane_bytes)
+            file.write(np.ascontiguousarray(image, dtype=np.uint16).tobytes())
+        file.flush()
+        os.fsync(file.fileno())
+
+def get_written_path(path, parameters=None):
+    ''' The file a writer creates for a path: stack.raw -> stack.craw for the compressed writer '''
+    if (parameters or {}).get('writer', 'memmap') == 'compressed':
+        from .compressed_raw import get_compressed_path
+        return get_compressed_path(path)
+    return path
+
+def get_raw_writer(path, x_pixels, y_pixels, planes, parameters=None, start_plane=0):
+    '''Creates the writer selected in the raw_writer_parameters of the config
+
+    Args:
+        parameters (dict): raw_writer_parameters, None selects the memmap writer
+        start_plane (int): Continue an existing file at this plane
+    '''
+    parameters = parameters or {}
+    writer = parameters.get('writer', 'memmap')
+    if writer == 'compressed':
+        ''' Imported here as compressed_raw builds on this module '''
+        from .compressed_raw import CompressedRawWriter
+        writer_class = CompressedRawWriter
+    elif writer in raw_writers:
+        writer_class = raw_writers[writer]
+    else:
+        raise ValueError(f'Unknown raw writer {writer}, use one of {list(raw_writers)+["compressed"]}')
+
+    options = {key : value for key, value in parameters.items() if key in writer_class.options}
+    return writer_class(path, x_pixels, y_pixels, planes, start_plane, **options)
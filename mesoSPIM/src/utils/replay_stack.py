@@ -0,0 +1,98 @@
+'''
+replay_stack.py
+========================================
+
+Recorded stacks as frame source of the ReplayCamera
+
+The ReplayCamera serves the planes of an existing stack as camera frames, so
+the writers, projections, display and analysis can be run and benchmarked on
+real sample data without hardware. Supported stacks:
+
+    .raw            np.memmap with the dimensions from the _meta.txt file
+    .craw           Compressed stack (utils/compressed_raw.py)
+    .tif/.tiff      tifffile.memmap for uncompressed files, otherwise page by page
+    .zarr           An array or the dataset replay_dataset of a group (needs zarr)
+
+The camera is set up in the config file:
+
+    camera = 'ReplayCamera'
+    camera_parameters = {'x_pixels' : 2048,
+                         'y_pixels' : 2048,
+                         'x_pixel_size_in_microns' : 6.5,
+                         'y_pixel_size_in_microns' : 6.5,
+                         'subsampling' : [1,2,4],
+                         'binning' : '1x1',
+                         'replay_path' : 'D:/data/stack.raw',
+                         'replay_dataset' : None,
+                         'replay_frame_rate' : 40,
+                         'replay_loop' : True}
+
+replay_frame_rate limits the frames per second, 0 serves frames as fast as
+possible. The planes are served in order and start over at the end of the stack
+if replay_loop is True (otherwise the last plane is repeated).
+'''
+
+import os
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+class TiffPages(object):
+    ''' Plane access to TIFF files that cannot be memory-mapped (e.g. compressed) '''
+    def __init__(self, path):
+        import tifffile
+        self.tiff = tifffile.TiffFile(path)
+        self.pages = self.tiff.pages
+        self.shape = (len(self.pages),) + tuple(self.pages[0].shape)
+
+    def __len__(self):
+        return len(self.pages)
+
+    def __getitem__(self, plane):
+        return self.pages[plane].asarray()
+
+    def close(self):
+        self.tiff.close()
+
+def open_replay_stack(path, dataset=None):
+    '''Opens a stack for replay
+
+    Returns an object with len() and stack[plane] (a 2D array as saved by mesoSPIM).
+    '''
+    extension = os.path.splitext(path.rstrip('/\\'))[1].lower()
+    if extension == '.raw':
+        from .lazy_stack import get_stack_geometry
+        shape, _, _ = get_stack_geometry(path)
+        return np.memmap(path, mode='r', dtype=np.uint16, shape=shape)
+    if extension == '.craw':
+        from .compressed_raw import CompressedRawReader
+        return CompressedRawReader(path)
+    if extension in ('.tif', '.tiff'):
+        import tifffile
+        try:
+            stack = tifffile.memmap(path, mode='r')
+        except ValueError:
+            ''' Compressed or not contiguous '''
+            return TiffPages(path)
+        return stack if stack.ndim == 3 else stack.reshape((1,) + stack.shape)
+    if extension == '.zarr':
+        try:
+            import zarr
+        except ImportError:
+            raise ImportError('Replaying Zarr stacks needs the zarr package')
+        stack = zarr.open(path, mode='r')
+        if not hasattr(stack, 'shape'):
+            ''' A group '''
+            stack = stack[dataset] if dataset is not None else next(iter(stack.arrays()))[1]
+        return stack
+    raise ValueError(f'Unsupported stack for replay: {path}')
+
+def fit_frame(image, rows, columns):
+    ''' Crops or zero-pads an image to rows x columns '''
+    if image.shape == (rows, columns):
+        return image
+    frame = np.zeros((rows, columns), dtype=np.uint16)
+    frame[:min(rows, image.shape[0]), :min(columns, image.shape[1])] = image[:rows, :columns]
+    return frame
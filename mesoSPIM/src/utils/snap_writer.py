@@ -0,0 +1,117 @@
+'''
+snap_writer.py
+========================================
+
+Writes snapped images in background threads
+
+The camera thread only copies the snapped image and hands it to the writer, the
+TIFF encoding (and compression) and the disk access run in a small thread pool,
+so repeated snaps (e.g. while surveying a sample) do not stall the live view.
+The metadata of the snap is embedded into the TIFF file: as JSON in the image
+description or, for OME-TIFF, as pixel size and description of the OME image.
+
+    snap_parameters = {'workers' : 2,
+                       'compression' : None,
+                       'ome' : False,
+                       'max_pending' : 16}
+
+compression is passed to tifffile (e.g. 'zlib' or 'zstd', None writes
+uncompressed files). Compressed files are written in strips of 256 rows, which
+are encoded in parallel. If max_pending snaps are waiting to be written, the
+next snap waits for a free slot instead of filling up the memory.
+'''
+
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import tifffile
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .metrics import metrics
+
+def get_snap_parameters_from_config(cfg):
+    '''Returns the snap parameters with defaults
+
+    workers: Number of writer threads
+    compression: tifffile compression, None for uncompressed files
+    ome: Write OME-TIFF files
+    max_pending: Snaps held in memory until they are written
+    '''
+    parameters = {'workers' : 2, 'compression' : None, 'ome' : False, 'max_pending' : 16}
+    if hasattr(cfg, 'snap_parameters'):
+        parameters.update(cfg.snap_parameters)
+    return parameters
+
+class SnapWriter(object):
+    '''Thread pool writing snapped images with their metadata
+
+    Args:
+        workers (int): Number of writer threads
+        compression (str): tifffile compression, None for uncompressed files
+        ome (bool): Write OME-TIFF instead of plain TIFF
+        max_pending (int): submit() blocks if this many snaps are not written yet
+    '''
+    def __init__(self, workers=2, compression=None, ome=False, max_pending=16):
+        self.workers = max(int(workers), 1)
+        self.compression = compression
+        self.ome = ome
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='snap_writer')
+        self.slots = threading.BoundedSemaphore(max(int(max_pending), 1))
+        self.lock = threading.Lock()
+        self.pending = 0
+
+    def submit(self, path, image, metadata):
+        '''Queues a snap, the image must not be changed afterwards
+
+        Args:
+            path (str): TIFF file to write
+            image (np.ndarray): 2D image
+            metadata (dict): Sections of the metadata file, e.g. {'CFG' : {'Laser' : '488 nm', ...}, ...}
+        '''
+        if not self.slots.acquire(blocking=False):
+            logger.warning(f'Snap writer: {self.pending} snaps are not written yet, waiting')
+            self.slots.acquire()
+        with self.lock:
+            self.pending += 1
+            metrics.set('snaps_pending', self.pending)
+        future = self.executor.submit(self.write, path, image, metadata)
+        future.add_done_callback(lambda future: self._written(future, path))
+        return future
+
+    def write(self, path, image, metadata):
+        options = {'photometric' : 'minisblack'}
+        if self.compression is not None:
+            options.update(compression=self.compression, rowsperstrip=256, maxworkers=self.workers)
+
+        pixelsize = metadata.get('CFG', {}).get('Pixelsize in um')
+        if self.ome:
+            ome_metadata = {'axes' : 'YX', 'Description' : json.dumps(metadata, default=str)}
+            if pixelsize is not None:
+                ome_metadata.update(PhysicalSizeX=pixelsize, PhysicalSizeY=pixelsize)
+            tifffile.imwrite(path, image, ome=True, metadata=ome_metadata, **options)
+        else:
+            if pixelsize:
+                options.update(resolution=(1e4/pixelsize, 1e4/pixelsize), resolutionunit='CENTIMETER')
+            tifffile.imwrite(path, image, description=json.dumps(metadata, default=str), metadata=None, **options)
+        return path
+
+    def _written(self, future, path):
+        with self.lock:
+            self.pending -= 1
+            metrics.set('snaps_pending', self.pending)
+        self.slots.release()
+        try:
+            future.result()
+            logger.info(f'Snap writer: Saved {path}')
+        except Exception:
+            logger.error(f'Snap writer: {path} could not be saved', exc_info=True)
+
+    def shutdown(self, wait=True):
+        ''' Writes the pending snaps (if wait is True) and stops the threads '''
+        self.executor.shutdown(wait=wait)
+
+def get_snap_writer_from_config(cfg):
+    return SnapWriter(**get_snap_parameters_from_config(cfg))
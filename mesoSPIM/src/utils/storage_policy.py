@@ -0,0 +1,137 @@
+'''
+storage_policy.py
+========================================
+
+Distributes the stacks of an acquisition list across several storage targets
+
+With a single disk, every stack of a list has to be written (and flushed from
+the page cache) by the same drive. If several target folders on different
+disks are configured, the storage policy assigns each stack to one of them,
+so a disk can flush the previous stack while the next one is written to
+another disk.
+
+Modes:
+    round_robin         Stacks are assigned to the targets in turn
+    bandwidth_weighted  Each stack goes to the target that would finish its
+                        share of the data first, given the target weights
+                        (e.g. measured write bandwidths in MB/s)
+
+The assignment is saved as a JSON manifest into every target folder, so the
+stacks of a list can be found again later.
+'''
+
+import os
+import copy
+import json
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+from .acquisitions import AcquisitionList
+from .storage_preflight import get_row_bytes, measure_write_bandwidth
+
+storage_modes = ('round_robin', 'bandwidth_weighted')
+
+class StoragePolicy(object):
+    '''Assigns the stacks of an acquisition list to storage targets
+
+    Args:
+        targets (list): Target folders, ideally on different disks
+        mode (str): 'round_robin' or 'bandwidth_weighted'
+        weights (list): Relative bandwidth of the targets (bandwidth_weighted only),
+                        None measures the bandwidths with a short write test
+    '''
+    def __init__(self, targets, mode='round_robin', weights=None):
+        if not targets:
+            raise ValueError('The storage policy needs at least one target folder')
+        if mode not in storage_modes:
+            raise ValueError(f'Unknown storage mode {mode}, use one of {storage_modes}')
+        if weights is not None and len(weights) != len(targets):
+            raise ValueError('The storage policy needs one weight per target folder')
+
+        self.targets = list(targets)
+        self.mode = mode
+        self.weights = weights
+
+    def get_weights(self):
+        if self.weights is None:
+            self.weights = []
+            for target in self.targets:
+                try:
+                    self.weights.append(measure_write_bandwidth(target, size_mb=64))
+                except OSError:
+                    ''' Missing targets are reported by the folder check of the core '''
+                    logger.error(f'Storage policy: Bandwidth of {target} could not be measured', exc_info=True)
+                    self.weights.append(1)
+            logger.info(f'Storage policy: Measured bandwidths {self.weights}')
+        return self.weights
+
+    def get_assignment(self, row_bytes):
+        ''' Returns the index of the target for every row '''
+        if self.mode == 'round_robin':
+            return [row % len(self.targets) for row in range(len(row_bytes))]
+
+        weights = self.get_weights()
+        assigned_bytes = [0] * len(self.targets)
+        assignment = []
+        for size in row_bytes:
+            ''' Pick the target that would be done with its data first '''
+            target = min(range(len(self.targets)), key=lambda index: (assigned_bytes[index] + size) / weights[index])
+            assigned_bytes[target] += size
+            assignment.append(target)
+        return assignment
+
+    def apply(self, acq_list, x_pixels, y_pixels):
+        '''Returns a copy of the acquisition list with the folders replaced by the targets
+
+        The list shown in the Acquisition Manager is not changed.
+        '''
+        row_bytes = get_row_bytes(acq_list, x_pixels, y_pixels)
+        assignment = self.get_assignment(row_bytes)
+
+        striped_list = AcquisitionList()
+        for acq, target in zip(acq_list, assignment):
+            striped_acq = copy.deepcopy(acq)
+            striped_acq['folder'] = self.targets[target]
+            striped_list.append(striped_acq)
+
+        self.manifest = self.get_manifest(acq_list, striped_list, row_bytes)
+        return striped_list
+
+    def get_manifest(self, acq_list, striped_list, row_bytes):
+        return {'created' : time.strftime('%Y-%m-%d %H:%M:%S'),
+                'mode' : self.mode,
+                'targets' : self.targets,
+                'weights' : self.weights,
+                'stacks' : [{'row' : row,
+                             'filename' : striped_acq['filename'],
+                             'folder' : striped_acq['folder'],
+                             'original_folder' : acq['folder'],
+                             'bytes' : size}
+                            for row, (acq, striped_acq, size) in enumerate(zip(acq_list, striped_list, row_bytes))]}
+
+    def save_manifest(self):
+        '''Writes the manifest of the last apply() into every target folder'''
+        filename = 'mesoSPIM_manifest_' + time.strftime('%Y%m%d-%H%M%S') + '.json'
+        for target in self.targets:
+            path = os.path.join(target, filename)
+            try:
+                with open(path, 'w') as file:
+                    json.dump(self.manifest, file, indent=2)
+            except OSError:
+                logger.error(f'Storage policy: Manifest {path} could not be written', exc_info=True)
+
+def load_manifest(path):
+    with open(path, 'r') as file:
+        return json.load(file)
+
+def get_storage_policy_from_config(cfg):
+    '''Returns a StoragePolicy if enabled in the config, otherwise None'''
+    if not hasattr(cfg, 'storage_policy_parameters') or not cfg.storage_policy_parameters.get('enabled', False):
+        return None
+
+    parameters = cfg.storage_policy_parameters
+    return StoragePolicy(parameters['targets'],
+                         mode=parameters.get('mode', 'round_robin'),
+                         weights=parameters.get('weights', None))
@@ -0,0 +1,155 @@
+'''
+storage_preflight.py
+========================================
+
+Checks that the target disks of an acquisition list can hold and sustain the data
+
+Before an acquisition list is started, the bytes of all stacks are summed per
+target file system and compared with the free space. Optionally, a short
+sequential write (with fsync) into each target folder measures the bandwidth,
+which is compared with the data rate of the camera at the expected framerate.
+
+Example:
+    report = run_storage_preflight(acq_list, x_pixels=2048, y_pixels=2048, framerate=5)
+    if report.errors:
+        print(report.to_string())
+'''
+
+import os
+import time
+import shutil
+import tempfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+''' The raw files are written as uint16 '''
+bytes_per_pixel = 2
+
+def get_plane_bytes(x_pixels, y_pixels):
+    return x_pixels * y_pixels * bytes_per_pixel
+
+def get_row_bytes(acq_list, x_pixels, y_pixels):
+    ''' Returns the estimated file size of every row in bytes '''
+    plane_bytes = get_plane_bytes(x_pixels, y_pixels)
+    return [int(count) * plane_bytes for count in acq_list.get_table().get_image_counts()]
+
+def format_bytes(number_of_bytes):
+    for unit in ('B', 'kB', 'MB', 'GB', 'TB'):
+        if abs(number_of_bytes) < 1000 or unit == 'TB':
+            return f'{number_of_bytes:.1f} {unit}'
+        number_of_bytes /= 1000
+
+def measure_write_bandwidth(folder, size_mb=256, block_mb=8):
+    '''Sequential write bandwidth of a folder in bytes/s
+
+    A temporary file is written in blocks, flushed to disk with fsync and
+    deleted again. Random data is used as some file systems compress zeros.
+    '''
+    block = os.urandom(block_mb * 1024 * 1024)
+    blocks = max(size_mb // block_mb, 1)
+
+    file_descriptor, path = tempfile.mkstemp(prefix='.mesoSPIM_preflight_', dir=folder)
+    try:
+        start_time = time.perf_counter()
+        with os.fdopen(file_descriptor, 'wb', buffering=0) as file:
+            for _ in range(blocks):
+                file.write(block)
+            os.fsync(file.fileno())
+        duration = time.perf_counter() - start_time
+    finally:
+        os.remove(path)
+
+    return blocks * len(block) / duration
+
+class StorageTarget(object):
+    ''' All folders of an acquisition list that are on the same file system '''
+    def __init__(self, folder):
+        self.folders = [folder]
+        self.required_bytes = 0
+        self.free_bytes = shutil.disk_usage(folder).free
+        self.bandwidth = None
+
+class StoragePreflightReport(object):
+    '''Result of the preflight
+
+    Attributes:
+        targets (list): StorageTarget objects
+        rows (list): (row, path, bytes) estimates for every row
+        errors (list): Problems that prevent the acquisition (not enough space)
+        warnings (list): Problems that slow the acquisition down (bandwidth)
+    '''
+    def __init__(self, required_bandwidth):
+        self.required_bandwidth = required_bandwidth
+        self.targets = []
+        self.rows = []
+        self.errors = []
+        self.warnings = []
+
+    def get_total_bytes(self):
+        return sum(row_bytes for _, _, row_bytes in self.rows)
+
+    def to_string(self, max_rows=20):
+        lines = [f'Required bandwidth: {format_bytes(self.required_bandwidth)}/s, total data: {format_bytes(self.get_total_bytes())}']
+        for target in self.targets:
+            bandwidth = format_bytes(target.bandwidth)+'/s' if target.bandwidth is not None else 'not measured'
+            lines.append(f'{", ".join(target.folders)}: needs {format_bytes(target.required_bytes)}, '
+                         f'{format_bytes(target.free_bytes)} free, write bandwidth {bandwidth}')
+
+        lines.append('Estimated file sizes:')
+        for row, path, row_bytes in self.rows[:max_rows]:
+            lines.append(f'  Row {row}: {path} {format_bytes(row_bytes)}')
+        if len(self.rows) > max_rows:
+            lines.append(f'  ... {len(self.rows)-max_rows} more rows')
+        return '\n'.join(lines)
+
+def run_storage_preflight(acq_list, x_pixels, y_pixels, framerate, cameras=1,
+                          measure_bandwidth=False, probe_size_mb=256, free_space_margin=0.05):
+    '''Checks free space (and optionally write bandwidth) of all target folders
+
+    Args:
+        framerate (float): Expected framerate in frames/s
+        cameras (int): Number of cameras writing a stack of the same size for every row
+        measure_bandwidth (bool): Write a test file of probe_size_mb into every target
+        free_space_margin (float): Fraction of the data that has to be free in addition
+
+    Folders that do not exist are skipped, they are reported by the other checks.
+    '''
+    report = StoragePreflightReport(cameras * get_plane_bytes(x_pixels, y_pixels) * framerate)
+
+    targets = {}
+    for row, (acq, row_bytes) in enumerate(zip(acq_list, get_row_bytes(acq_list, x_pixels, y_pixels))):
+        folder = acq['folder']
+        row_bytes *= cameras
+        report.rows.append((row, folder+'/'+acq['filename'], row_bytes))
+        if not os.path.isdir(folder):
+            continue
+
+        ''' Folders on the same device share the free space '''
+        device = os.stat(folder).st_dev
+        if device not in targets:
+            targets[device] = StorageTarget(folder)
+        elif folder not in targets[device].folders:
+            targets[device].folders.append(folder)
+        targets[device].required_bytes += row_bytes
+
+    report.targets = list(targets.values())
+
+    for target in report.targets:
+        if target.required_bytes * (1 + free_space_margin) > target.free_bytes:
+            report.errors.append(f'Not enough free space in {", ".join(target.folders)}: '
+                                 f'{format_bytes(target.required_bytes)} needed, {format_bytes(target.free_bytes)} free')
+
+        if measure_bandwidth:
+            try:
+                target.bandwidth = measure_write_bandwidth(target.folders[0], size_mb=probe_size_mb)
+            except OSError as error:
+                report.warnings.append(f'Write bandwidth of {target.folders[0]} could not be measured: {error}')
+                continue
+
+            if target.bandwidth < report.required_bandwidth:
+                report.warnings.append(f'{target.folders[0]} is too slow: {format_bytes(target.bandwidth)}/s measured, '
+                                       f'{format_bytes(report.required_bandwidth)}/s needed at {framerate:.2f} frames/s')
+
+    logger.info('Storage preflight:\n'+report.to_string(max_rows=len(report.rows)))
+    return report
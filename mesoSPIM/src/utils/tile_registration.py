@@ -0,0 +1,271 @@
+'''
+tile_registration.py
+========================================
+
+Online registration of overlapping tiles during a tiled acquisition
+
+As soon as a stack is written, it is compared with the already acquired
+neighbouring tiles: A few planes around the middle of both stacks are max
+projected and downsampled, the overlap expected from the stage positions is
+cut out and the residual shift is measured by phase correlation. The
+comparisons run in a process pool, so the acquisition is not slowed down.
+
+At the end of the acquisition list, the pairwise shifts are combined into one
+translation per tile (weighted least squares) and a BigDataViewer XML with the
+nominal ("Translation to Regular Grid") and refined ("Stitching Transform")
+translations is written next to the data.
+
+Only the first channel/illumination of each rotation angle is registered,
+the other channels of a tile get the same translation.
+
+Stage axes and image axes depend on the microscope: x_sign, y_sign and swap_xy
+in the config map the stage x/y positions onto the image columns/rows.
+'''
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import logging
+logger = logging.getLogger(__name__)
+
+def load_projection(path, shape, projection_planes=5, downsampling=4):
+    '''Max projection of the planes around the middle of a stack, downsampled by block averaging
+
+    Args:
+        path (str): .raw or .craw file
+        shape (tuple): (planes, rows, columns) of the stack
+    '''
+    planes = shape[0]
+    start = max(planes//2 - projection_planes//2, 0)
+    stop = min(start + projection_planes, planes)
+
+    if path.endswith('.craw'):
+        from .compressed_raw import CompressedRawReader
+        with CompressedRawReader(path) as stack:
+            projection = stack[start:stop].max(axis=0)
+    else:
+        stack = np.memmap(path, mode='r', dtype=np.uint16, shape=tuple(shape))
+        projection = stack[start:stop].max(axis=0)
+        del stack
+
+    rows = projection.shape[0] // downsampling * downsampling
+    columns = projection.shape[1] // downsampling * downsampling
+    projection = projection[:rows, :columns].astype(np.float32)
+    return projection.reshape(rows//downsampling, downsampling, columns//downsampling, downsampling).mean(axis=(1, 3))
+
+def phase_correlation(reference, moving):
+    '''Returns the shift (rows, columns) with moving[p] ~ reference[p + shift] and the peak height
+
+    The peak height of the normalized cross-power spectrum (0..1) is used as confidence.
+    '''
+    window = np.outer(np.hanning(reference.shape[0]), np.hanning(reference.shape[1]))
+    reference = (reference - reference.mean()) * window
+    moving = (moving - moving.mean()) * window
+
+    cross_power = np.fft.rfft2(reference) * np.conj(np.fft.rfft2(moving))
+    cross_power /= np.abs(cross_power) + 1e-12
+    correlation = np.fft.irfft2(cross_power, s=reference.shape)
+
+    peak = np.unravel_index(np.argmax(correlation), correlation.shape)
+    shift = [p - size if p > size//2 else p for p, size in zip(peak, correlation.shape)]
+    return np.array(shift, dtype=np.float64), float(correlation[peak])
+
+def get_overlap_slices(offset, shape):
+    '''Slices of the overlap of two images of the same shape
+
+    Args:
+        offset (tuple): Nominal position of image B minus position of image A (rows, columns) in pixels
+
+    Returns slices into A and B or None if they do not overlap.
+    '''
+    slices_a = []
+    slices_b = []
+    for shift, size in zip(offset, shape):
+        shift = int(round(shift))
+        start, stop = max(shift, 0), min(size + shift, size)
+        if stop <= start:
+            return None
+        slices_a.append(slice(start, stop))
+        slices_b.append(slice(start - shift, stop - shift))
+    return tuple(slices_a), tuple(slices_b)
+
+def register_pair(job):
+    '''Measures the residual shift of tile B relative to tile A (runs in a worker process)
+
+    Returns (index_a, index_b, shift in full-resolution pixels (rows, columns), confidence)
+    '''
+    downsampling = job['downsampling']
+    image_a = load_projection(job['path_a'], job['shape'], job['projection_planes'], downsampling)
+    image_b = load_projection(job['path_b'], job['shape'], job['projection_planes'], downsampling)
+
+    overlap = get_overlap_slices(np.array(job['offset']) / downsampling, image_a.shape)
+    if overlap is None:
+        return job['index_a'], job['index_b'], np.zeros(2), 0.0
+
+    slices_a, slices_b = overlap
+    shift, confidence = phase_correlation(image_a[slices_a], image_b[slices_b])
+    return job['index_a'], job['index_b'], shift * downsampling, confidence
+
+def solve_translations(number_of_tiles, pairs, min_confidence=0.05):
+    '''Combines pairwise shifts into one correction per tile
+
+    Args:
+        pairs (list): (index_a, index_b, shift, confidence) - shift of b relative to a
+
+    The first tile stays in place, tiles without reliable pairs get no correction.
+    '''
+    pairs = [pair for pair in pairs if pair[3] >= min_confidence]
+    corrections = np.zeros((number_of_tiles, 2))
+    if not pairs:
+        return corrections
+
+    matrix = np.zeros((len(pairs) + 1, number_of_tiles))
+    values = np.zeros((len(pairs) + 1, 2))
+    for row, (index_a, index_b, shift, confidence) in enumerate(pairs):
+        matrix[row, index_b] = confidence
+        matrix[row, index_a] = -confidence
+        values[row] = np.asarray(shift) * confidence
+    matrix[-1, 0] = 1
+
+    corrections, *_ = np.linalg.lstsq(matrix, values, rcond=None)
+    return corrections
+
+class TileRegistration(object):
+    '''Collects the stacks of an acquisition list and registers neighbouring tiles
+
+    Args:
+        cfg: Microscope configuration (pixel sizes)
+        downsampling (int): Downsampling of the projections before correlation
+        projection_planes (int): Planes around the middle of the stack used for the projection
+        min_overlap (float): Minimal overlap of neighbours as fraction of the field of view
+        min_confidence (float): Pairs with a lower correlation peak are ignored
+        workers (int): Number of processes
+    '''
+    def __init__(self, cfg, downsampling=4, projection_planes=5, min_overlap=0.05,
+                 min_confidence=0.05, workers=2, x_sign=1, y_sign=1, swap_xy=False):
+        self.cfg = cfg
+        self.downsampling = downsampling
+        self.projection_planes = projection_planes
+        self.min_overlap = min_overlap
+        self.min_confidence = min_confidence
+        self.workers = workers
+        self.x_sign = x_sign
+        self.y_sign = y_sign
+        self.swap_xy = swap_xy
+        self.executor = None
+
+    def start(self, acq_list, shape):
+        '''Called before the acquisition list starts
+
+        Args:
+            shape (tuple): (rows, columns) of a plane as written to disk
+        '''
+        self.acq_list = acq_list
+        self.plane_shape = tuple(shape)
+        self.tiles = []
+        self.tile_of_row = {}
+        self.futures = []
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers)
+
+    def get_group(self, acq):
+        ''' Tiles are registered within the first channel/illumination of each angle '''
+        return (acq['laser'], acq['filter'], acq['shutterconfig'], acq['rot'])
+
+    def get_tilestring(self, acq):
+        return (acq['x_pos'], acq['y_pos'], acq['z_start'], acq['rot'])
+
+    def get_nominal_position(self, acq):
+        ''' Stage position in pixels along (rows, columns) of the saved images '''
+        pixelsize = self.cfg.pixelsize[acq['zoom']]
+        x = self.x_sign * acq['x_pos'] / pixelsize
+        y = self.y_sign * acq['y_pos'] / pixelsize
+        if self.swap_xy:
+            return np.array([x, y])
+        else:
+            return np.array([y, x])
+
+    def add_stack(self, row, acq, path):
+        '''Called after a stack has been written, submits comparisons with its neighbours'''
+        if self.executor is None or not os.path.isfile(path):
+            return
+
+        angle_groups = {}
+        for other in self.acq_list:
+            angle_groups.setdefault(other['rot'], self.get_group(other))
+        if self.get_group(acq) != angle_groups[acq['rot']]:
+            return
+
+        index = len(self.tiles)
+        tile = {'row' : row,
+                'tilestring' : self.get_tilestring(acq),
+                'path' : path,
+                'planes' : acq.get_image_count(),
+                'position' : self.get_nominal_position(acq),
+                'rot' : acq['rot']}
+        self.tiles.append(tile)
+
+        minimum = self.min_overlap * np.array(self.plane_shape)
+        for other_index, other in enumerate(self.tiles[:-1]):
+            if other['rot'] != tile['rot'] or other['planes'] != tile['planes']:
+                continue
+            offset = tile['position'] - other['position']
+            overlap = np.array(self.plane_shape) - np.abs(offset)
+            if np.all(overlap > minimum):
+                job = {'index_a' : other_index,
+                       'index_b' : index,
+                       'path_a' : other['path'],
+                       'path_b' : path,
+                       'shape' : (tile['planes'],) + self.plane_shape,
+                       'offset' : tuple(offset),
+                       'downsampling' : self.downsampling,
+                       'projection_planes' : self.projection_planes}
+                self.futures.append(self.executor.submit(register_pair, job))
+
+    def finish(self):
+        '''Waits for all comparisons and returns the refined translations
+
+        Returns a dict: row of the acquisition list -> (nominal, correction) in
+        pixels (rows, columns) - rows of all channels of a tile are included.
+        '''
+        pairs = []
+        for future in self.futures:
+            try:
+                pairs.append(future.result())
+            except Exception:
+                logger.error('Tile registration: Comparison failed', exc_info=True)
+        self.pairs = pairs
+
+        corrections = solve_translations(len(self.tiles), pairs, self.min_confidence)
+        correction_of_tile = {tile['tilestring'] : correction for tile, correction in zip(self.tiles, corrections)}
+
+        translations = {}
+        for row, acq in enumerate(self.acq_list):
+            correction = correction_of_tile.get(self.get_tilestring(acq), np.zeros(2))
+            translations[row] = (self.get_nominal_position(acq), correction)
+        return translations
+
+    def save_pairs(self, path):
+        ''' Saves the pairwise shifts as JSON for troubleshooting '''
+        with open(path, 'w') as file:
+            json.dump([{'tile_a' : self.tiles[a]['path'],
+                        'tile_b' : self.tiles[b]['path'],
+                        'shift_pixels' : [float(value) for value in shift],
+                        'confidence' : confidence} for a, b, shift, confidence in self.pairs], file, indent=2)
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+def get_tile_registration_from_config(cfg):
+    '''Returns a TileRegistration if enabled in the config, otherwise None'''
+    if not hasattr(cfg, 'tile_registration_parameters') or not cfg.tile_registration_parameters.get('enabled', False):
+        return None
+
+    parameters = dict(cfg.tile_registration_parameters)
+    del parameters['enabled']
+    return TileRegistration(cfg, **parameters)
@@ -0,0 +1,176 @@
+'''
+timing_trace.py
+========================================
+
+Per-plane timing trace of a stack acquisition
+
+For every plane, the core records when it was triggered and where the stages
+were commanded to and actually were, the camera records when the frame arrived,
+its frame number and when it was written to disk. The trace is saved as a
+NumPy structured array next to the raw file (``<filename>_timing.npy``).
+
+The module can also be run as a script to look for slow planes in saved traces:
+
+    python timing_trace.py /data/stack.raw_timing.npy --threshold 2
+'''
+
+import argparse
+
+import numpy as np
+
+timing_trace_dtype = np.dtype([('plane', np.int32),
+                               ('trigger_time', np.float64),
+                               ('frame_arrival_time', np.float64),
+                               ('write_complete_time', np.float64),
+                               ('frame_number', np.int64),
+                               ('z_commanded', np.float64),
+                               ('z_readback', np.float64),
+                               ('f_commanded', np.float64),
+                               ('f_readback', np.float64),
+                               ('frames_in_flight', np.int32),
+                               ('frames_per_readout', np.int32),
+                               ('focus_metric', np.float64),
+                               ])
+
+class TimingTrace(object):
+    '''
+    Preallocated timing trace for a single stack.
+
+    The core and the camera thread write into different fields of the same
+    row, the array is never resized during an acquisition.
+
+    Args:
+        planes (int): Number of planes in the stack
+
+    Times are in seconds since the epoch (time.time()), fields that were
+    never written contain NaN (times, positions) or -1 (counters).
+    '''
+    def __init__(self, planes):
+        self.data = np.zeros(planes, dtype=timing_trace_dtype)
+        self.data['plane'] = np.arange(planes)
+        for field in ('trigger_time', 'frame_arrival_time', 'write_complete_time',
+                      'z_commanded', 'z_readback', 'f_commanded', 'f_readback', 'focus_metric'):
+            self.data[field] = np.nan
+        for field in ('frame_number', 'frames_in_flight', 'frames_per_readout'):
+            self.data[field] = -1
+
+        self.triggered = 0
+        self.written = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def record_trigger(self, plane, trigger_time, z_commanded, f_commanded, position):
+        '''Called by the core right before the waveforms for a plane are started
+
+        Args:
+            position (dict): Last reported stage position, e.g. state['position']
+        '''
+        if plane < len(self.data):
+            row = self.data[plane]
+            row['trigger_time'] = trigger_time
+            row['z_commanded'] = z_commanded
+            row['f_commanded'] = f_commanded
+            row['z_readback'] = position['z_pos']
+            row['f_readback'] = position['f_pos']
+            self.triggered = plane + 1
+
+    def record_frame(self, plane, arrival_time, frame_number, frames_per_readout):
+        '''Called by the camera when a frame for a plane was read out'''
+        if plane < len(self.data):
+            row = self.data[plane]
+            row['frame_arrival_time'] = arrival_time
+            row['frame_number'] = frame_number
+            row['frames_per_readout'] = frames_per_readout
+
+    def record_focus_metric(self, plane, value):
+        '''Called by the camera if the sharpness of every plane is measured'''
+        if plane < len(self.data):
+            self.data[plane]['focus_metric'] = value
+
+    def record_write(self, plane, write_complete_time):
+        '''Called by the camera once the plane has been handed to the file'''
+        if plane < len(self.data):
+            row = self.data[plane]
+            row['write_complete_time'] = write_complete_time
+            row['frames_in_flight'] = self.triggered - plane - 1
+            self.written = max(self.written, plane + 1)
+
+    def save(self, path):
+        np.save(path, self.data)
+
+    def get_summary(self):
+        ''' Returns a dict with the key numbers of the trace for the metadata file '''
+        return summarize_timing_trace(self.data)
+
+def load_timing_trace(path):
+    return np.load(path)
+
+def get_plane_intervals(data):
+    '''Time between the triggers of consecutive planes - the first plane has NaN'''
+    intervals = np.full(len(data), np.nan)
+    intervals[1:] = np.diff(data['trigger_time'])
+    return intervals
+
+def summarize_timing_trace(data):
+    intervals = get_plane_intervals(data)
+    latency = data['write_complete_time'] - data['trigger_time']
+    z_error = np.abs(data['z_readback'] - data['z_commanded'])
+
+    with np.errstate(invalid='ignore'):
+        median_interval = np.nanmedian(intervals) if np.isfinite(intervals).any() else np.nan
+
+    return {'planes' : len(data),
+            'planes_triggered' : int(np.isfinite(data['trigger_time']).sum()),
+            'planes_written' : int(np.isfinite(data['write_complete_time']).sum()),
+            'median_plane_interval' : median_interval,
+            'max_plane_interval' : np.nanmax(intervals) if np.isfinite(intervals).any() else np.nan,
+            'max_trigger_to_write_latency' : np.nanmax(latency) if np.isfinite(latency).any() else np.nan,
+            'max_frames_in_flight' : int(data['frames_in_flight'].max()) if len(data) else -1,
+            'max_z_readback_error' : np.nanmax(z_error) if np.isfinite(z_error).any() else np.nan,
+            }
+
+def find_slow_planes(data, threshold=2.0, z_tolerance=None):
+    '''Returns the indices of suspicious planes
+
+    A plane is slow if the interval to the previous trigger exceeds threshold
+    times the median interval. If z_tolerance (in microns) is given, planes where
+    read-back and commanded z differ by more than that are flagged as well.
+    '''
+    intervals = get_plane_intervals(data)
+    with np.errstate(invalid='ignore'):
+        median_interval = np.nanmedian(intervals) if np.isfinite(intervals).any() else np.nan
+        slow = intervals > threshold * median_interval
+        if z_tolerance is not None:
+            slow |= np.abs(data['z_readback'] - data['z_commanded']) > z_tolerance
+    return np.flatnonzero(slow)
+
+def print_report(path, threshold=2.0, z_tolerance=None):
+    data = load_timing_trace(path)
+    summary = summarize_timing_trace(data)
+    intervals = get_plane_intervals(data)
+
+    print(path)
+    for key, value in summary.items():
+        print(f'  {key}: {value}')
+
+    slow_planes = find_slow_planes(data, threshold, z_tolerance)
+    print(f'  {len(slow_planes)} suspicious plane(s)')
+    for plane in slow_planes:
+        row = data[plane]
+        print(f'    plane {plane}: interval {intervals[plane]:.4f} s, '
+              f'frame {row["frame_number"]}, in flight {row["frames_in_flight"]}, '
+              f'z {row["z_commanded"]:.2f}/{row["z_readback"]:.2f}, '
+              f'f {row["f_commanded"]:.2f}/{row["f_readback"]:.2f}')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Flag slow planes in mesoSPIM timing traces')
+    parser.add_argument('paths', nargs='+', help='One or more *_timing.npy files')
+    parser.add_argument('--threshold', type=float, default=2.0,
+                        help='Flag planes slower than threshold x median plane interval (default: 2)')
+    parser.add_argument('--z-tolerance', type=float, default=None,
+                        help='Flag planes where read-back z differs more than this from the commanded z (microns)')
+    args = parser.parse_args()
+
+    for path in args.paths:
+        print_report(path, args.threshold, args.z_tolerance)
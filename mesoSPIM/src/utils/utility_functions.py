@@ -2,6 +2,8 @@
 Contains a variety of mesoSPIM utility functions
 '''
 
+import importlib.util
+
 import numpy as np
 
 def convert_seconds_to_string(delta_t):
@@ -16,3 +18,14 @@ def convert_seconds_to_string(delta_t):
         hours, remainder = divmod(delta_t, 3600)
         minutes, seconds = divmod(remainder, 60)
         return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+
+def load_config_from_path(path):
+    '''
+    Imports a microscope configuration file (a Python module) from a path
+
+    Returns the config module so that parameters can be accessed via cfg.camera etc.
+    '''
+    spec = importlib.util.spec_from_file_location('module.name', path)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
@@ -0,0 +1,28 @@
+'''
+Existing files are found under the name the raw writer actually uses
+'''
+import pytest
+
+pytest.importorskip('numpy')
+
+from mesoSPIM.src.utils.acquisitions import Acquisition, AcquisitionList
+from mesoSPIM.src.utils.raw_writers import get_written_path
+
+def make_list(folder):
+    return AcquisitionList([Acquisition(folder=folder, filename=f'stack_{index}.raw') for index in range(3)])
+
+def test_existing_compressed_stack_is_found(tmp_path):
+    (tmp_path / 'stack_1.craw').write_bytes(b'')
+    acq_list = make_list(str(tmp_path))
+
+    assert acq_list.check_for_existing_filenames() == []
+
+    compressed = {'writer' : 'compressed'}
+    existing = acq_list.check_for_existing_filenames(lambda path: [get_written_path(path, compressed)])
+    assert existing == [str(tmp_path)+'/stack_1.craw']
+
+def test_existing_raw_stack_is_found(tmp_path):
+    (tmp_path / 'stack_2.raw').write_bytes(b'')
+    acq_list = make_list(str(tmp_path))
+
+    assert acq_list.check_for_existing_filenames() == [str(tmp_path)+'/stack_2.raw']
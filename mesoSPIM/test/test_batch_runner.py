@@ -0,0 +1,46 @@
+'''
+The headless batch runner has to provide every signal the core connects to
+'''
+import os
+
+import pytest
+
+try:
+    from PyQt5 import QtCore
+    from mesoSPIM.src.mesoSPIM_BatchRunner import mesoSPIM_BatchRunner
+    from mesoSPIM.src.utils.utility_functions import load_config_from_path
+except ImportError as error:
+    pytest.skip(f'mesoSPIM dependencies missing: {error}', allow_module_level=True)
+
+MESOSPIM_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+@pytest.fixture(scope='module')
+def runner():
+    '''One runner for all tests, as the state singleton is shared
+
+    The config refers to files relative to the mesoSPIM folder.
+    '''
+    working_directory = os.getcwd()
+    os.chdir(MESOSPIM_FOLDER)
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    try:
+        cfg = load_config_from_path(os.path.join('config', 'demo_config.py'))
+        runner = mesoSPIM_BatchRunner(cfg)
+        yield runner
+        runner.shutdown()
+    finally:
+        os.chdir(working_directory)
+
+def test_batch_runner_builds_with_demo_config(runner):
+    assert runner.core.parent is runner
+    assert runner.exit_code == 0
+
+def test_only_errors_fail_the_batch_run(runner):
+    app = QtCore.QCoreApplication.instance()
+    runner.core.sig_warning.emit('The acquisition might be slowed down by the disks')
+    app.processEvents()
+    assert runner.exit_code == 0
+
+    runner.core.send_error('The following files already exist - stopping!')
+    app.processEvents()
+    assert runner.exit_code == 1
@@ -0,0 +1,38 @@
+'''
+Reading XY planes must not evict the blocks of the XZ/YZ views
+'''
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from mesoSPIM.src.utils.lazy_stack import LazyStack
+
+def write_stack(path, shape):
+    stack = np.arange(np.prod(shape), dtype=np.uint64).reshape(shape) % 60000
+    stack.astype(np.uint16).tofile(path)
+    with open(path + '_meta.txt', 'w') as file:
+        file.write('[CAMERA PARAMETERS]\n')
+        file.write(f'[image_rows] {shape[1]}\n')
+        file.write(f'[image_columns] {shape[2]}\n')
+        file.write('[POSITION]\n')
+        file.write(f'[z_planes] {shape[0]}\n')
+    return stack.astype(np.uint16)
+
+def test_planes_do_not_evict_blocks(tmp_path):
+    path = str(tmp_path / 'stack.raw')
+    data = write_stack(path, (200, 256, 256))
+    ''' The blocks of level 2 fit into the cache, but not together with all planes '''
+    stack = LazyStack(path, cache_bytes=8*1024**2, plane_cache_bytes=1024**2)
+    try:
+        level = stack.get_finest_level()
+        assert stack.fits_in_cache(level)
+        for block in range(stack.get_block_count(level)):
+            stack.read_block(level, block)
+
+        for plane in range(stack.shape[0]):
+            np.testing.assert_array_equal(stack.read_plane(plane), data[plane])
+
+        assert stack.is_level_loaded(level)
+        np.testing.assert_array_equal(stack.get_xz(128, level), data[::level, 128, ::level])
+    finally:
+        stack.close()
@@ -0,0 +1,55 @@
+'''
+Tile registration with a known synthetic offset
+'''
+import pytest
+
+np = pytest.importorskip('numpy')
+ndimage = pytest.importorskip('scipy.ndimage')
+
+from mesoSPIM.src.utils.tile_registration import phase_correlation, register_pair, solve_translations
+
+SHIFT = (4, 7)
+
+def make_sample(shape, seed=0):
+    ''' Smooth random texture, like a sample with structures of a few pixels '''
+    random = np.random.default_rng(seed)
+    return ndimage.gaussian_filter(random.random(shape), 2) * 10000
+
+def test_phase_correlation_sign():
+    ''' moving[p] = reference[p + shift] '''
+    sample = make_sample((140, 140))
+    reference = sample[10:110, 10:110]
+    moving = sample[10+SHIFT[0]:110+SHIFT[0], 10+SHIFT[1]:110+SHIFT[1]]
+
+    shift, confidence = phase_correlation(reference, moving)
+    assert tuple(shift) == SHIFT
+    assert confidence > 0.1
+
+def test_register_pair_round_trip(tmp_path):
+    '''Tile b is nominally 96 columns right of tile a, but the stage put it SHIFT further'''
+    planes, rows, columns = 3, 128, 128
+    nominal_offset = (0, 96)
+    sample = make_sample((rows + 20, columns + nominal_offset[1] + 20))
+
+    tile_a = sample[:rows, :columns]
+    tile_b = sample[SHIFT[0]:SHIFT[0]+rows, nominal_offset[1]+SHIFT[1]:nominal_offset[1]+SHIFT[1]+columns]
+    paths = []
+    for name, tile in (('a', tile_a), ('b', tile_b)):
+        path = str(tmp_path / f'{name}.raw')
+        np.repeat(tile[np.newaxis].astype(np.uint16), planes, axis=0).tofile(path)
+        paths.append(path)
+
+    job = {'index_a' : 0,
+           'index_b' : 1,
+           'path_a' : paths[0],
+           'path_b' : paths[1],
+           'shape' : (planes, rows, columns),
+           'offset' : nominal_offset,
+           'downsampling' : 1,
+           'projection_planes' : planes}
+    pair = register_pair(job)
+    assert tuple(pair[2]) == SHIFT
+
+    corrections = solve_translations(2, [pair])
+    np.testing.assert_allclose(corrections[0], (0, 0), atol=1e-6)
+    np.testing.assert_allclose(corrections[1], SHIFT, atol=1e-6)